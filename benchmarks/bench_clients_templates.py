@@ -0,0 +1,62 @@
+# File: benchmarks/bench_clients_templates.py
+# Microbenchmark: per-request model/template construction vs. the shared registries.
+#
+# No network calls are made; this only measures the setup work each agent used
+# to repeat on every request (ChatOpenAI + HTTP client, structured-output
+# wrapper, Jinja parse) against a registry lookup.
+#
+# Usage:
+#   python -m benchmarks.bench_clients_templates --iterations 200
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from jinja2 import Template
+from langchain_openai import ChatOpenAI
+
+from src.core.clients import get_chat_model, get_structured_model
+from src.core.prompts import IMAGE_PROMPT_ENGINEER_TEMPLATE, PROMPT_REFINER_TEMPLATE, VIDEO_DIRECTOR_TEMPLATE
+from src.core.schemas import VisualAnalysis
+from src.core.templates import get_template
+
+def per_request_setup() -> None:
+    ChatOpenAI(model="gpt-4o", temperature=0.1, max_retries=2, request_timeout=60).with_structured_output(VisualAnalysis)
+    ChatOpenAI(model="gpt-4o", temperature=0.7)
+    ChatOpenAI(model="gpt-4o", temperature=0.8)
+    ChatOpenAI(model="gpt-4o", temperature=0.5)
+    Template(IMAGE_PROMPT_ENGINEER_TEMPLATE)
+    Template(VIDEO_DIRECTOR_TEMPLATE)
+    Template(PROMPT_REFINER_TEMPLATE)
+
+def registry_setup() -> None:
+    get_structured_model("gpt-4o", 0.1, VisualAnalysis)
+    get_chat_model("gpt-4o", 0.7)
+    get_chat_model("gpt-4o", 0.8)
+    get_chat_model("gpt-4o", 0.5)
+    get_template("image_prompt_engineer")
+    get_template("video_director")
+    get_template("prompt_refiner")
+
+def time_per_call(func, iterations: int) -> float:
+    func()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Model/template setup overhead per request.")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    before = time_per_call(per_request_setup, args.iterations)
+    after = time_per_call(registry_setup, args.iterations)
+    print(f"per-request construction: {before * 1e3:8.3f} ms/request")
+    print(f"shared registries:        {after * 1e3:8.3f} ms/request")
+    print(f"overhead removed:         {(before - after) * 1e3:8.3f} ms/request ({before / after:.0f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# File: benchmarks/bench_image_memory.py
+# Memory benchmark: image bytes held per request, before and after the blob store.
+#
+# Simulates N concurrent requests holding their uploads in graph state, then
+# builds the base64 data URL for an image sent to the model unchanged, and
+# reports the Python heap peak (tracemalloc) of each approach:
+#   * legacy  — `await upload.read()`, bytes carried in the state dict, one-shot
+#               `b64encode(...).decode()` plus an f-string data URL;
+#   * blobs   — uploads moved into the blob store (large ones spooled to a
+#               memory-mapped temporary file), state carrying only the blob id,
+#               base64 encoded chunk by chunk straight from the mapped file.
+# Memory-mapped pages live in the OS page cache, not the Python heap.
+# No network calls are made.
+#
+# Usage:
+#   python -m benchmarks.bench_image_memory --requests 16 --size-mb 8
+
+import argparse
+import base64
+import os
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from pydantic import BaseModel
+
+from src.core.blobstore import BlobStore
+from src.core.imaging import data_url
+from src.core.schemas import AppState
+
+class LegacyState(BaseModel):
+    """The old `AppState` shape: the raw upload inside the model."""
+    original_image_bytes: bytes
+    prompt_history: List[str] = []
+
+def make_uploads(count: int, size: int) -> List[Any]:
+    """Spooled files like the ones Starlette hands to an `UploadFile`."""
+    payload = os.urandom(size)
+    uploads = []
+    for _ in range(count):
+        upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        upload.write(payload)
+        upload.seek(0)
+        uploads.append(upload)
+    return uploads
+
+def legacy_states(uploads: List[Any]) -> List[Dict[str, Any]]:
+    return [LegacyState(original_image_bytes=upload.read()).model_dump(exclude_none=True) for upload in uploads]
+
+def blob_states(store: BlobStore, uploads: List[Any], size: int) -> List[Dict[str, Any]]:
+    return [AppState(original_image=store.put_stream(upload, size).id).model_dump(exclude_none=True) for upload in uploads]
+
+def legacy_data_url(data: bytes) -> str:
+    encoded = base64.b64encode(data).decode("utf-8")
+    return f"data:image/jpeg;base64,{encoded}"
+
+def legacy_passthrough_url(upload: Any) -> str:
+    upload.seek(0)
+    return legacy_data_url(upload.read())
+
+def measure(label: str, work: Callable[[], Any]) -> int:
+    tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    result = work()
+    _, peak = tracemalloc.get_traced_memory()
+    del result
+    used = peak - start
+    print(f"  {label:<38} peak {used / 2**20:8.1f} MiB")
+    return used
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Heap used by image bytes per request: legacy vs blob store.")
+    parser.add_argument("--requests", type=int, default=16, help="Concurrent requests holding an upload.")
+    parser.add_argument("--size-mb", type=float, default=8.0, help="Upload size in MiB.")
+    args = parser.parse_args()
+    size = int(args.size_mb * 2**20)
+    store = BlobStore(memory_max_bytes=1024 * 1024, ttl_seconds=3600)
+
+    tracemalloc.start()
+    print(f"{args.requests} requests holding a {args.size_mb:g} MiB upload in graph state:")
+    uploads = make_uploads(args.requests, size)
+    legacy = measure("legacy (bytes in state)", lambda: legacy_states(uploads))
+    uploads = make_uploads(args.requests, size)
+    blobs = measure("blob store (id in state)", lambda: blob_states(store, uploads, size))
+
+    print(f"Data URL for a {args.size_mb:g} MiB image sent unchanged:")
+    upload = make_uploads(1, size)[0]
+    blob = store.put_stream(upload, size)
+    legacy_url = measure("legacy (read + b64encode + f-string)", lambda: legacy_passthrough_url(upload))
+    chunked_url = measure("chunked base64 from the blob", lambda: data_url(blob.view(), "image/jpeg"))
+    assert legacy_passthrough_url(upload) == data_url(blob.view(), "image/jpeg")
+    tracemalloc.stop()
+
+    print(f"State heap reduction:    {legacy / max(blobs, 1):.1f}x")
+    print(f"Data URL peak reduction: {legacy_url / max(chunked_url, 1):.2f}x")
+
+if __name__ == "__main__":
+    main()
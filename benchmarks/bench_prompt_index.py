@@ -0,0 +1,97 @@
+# File: benchmarks/bench_prompt_index.py
+# Similar-prompt index: build throughput and query latency at scale.
+#
+# Fills a `PromptIndex` (hashing embedder, memory-mapped vectors) in a
+# temporary directory with synthetic Prompt A / Prompt B entries and their
+# visual analyses, then times top-k queries, with and without a kind filter,
+# and a cold reopen of the directory. No network calls are made.
+#
+# Usage:
+#   python -m benchmarks.bench_prompt_index --sizes 100000 1000000 --queries 200
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.run_suite import peak_rss_mb, percentile
+from src.core.prompt_index import Entry, HashingEmbedder, PromptIndex
+
+SUBJECTS = ["lighthouse keeper", "red fox", "astronaut", "street musician", "old fisherman", "dancer", "samurai", "owl", "child with a kite", "robot gardener"]
+SETTINGS = ["storm-battered cliff", "snowy forest", "neon-lit alley", "desert canyon", "flooded cathedral", "orbital station", "rice terraces", "night market"]
+STYLES = ["oil painting", "watercolor", "cinematic photograph", "anime key art", "charcoal sketch", "3D render", "ukiyo-e woodblock print", "double exposure"]
+MOODS = ["lonely", "triumphant", "dreamy", "tense", "serene", "melancholic", "playful", "ominous"]
+LIGHTING = ["golden hour", "rim light", "neon glow", "overcast softbox", "candlelight", "harsh noon sun", "moonlight", "volumetric fog"]
+COLORS = ["amber", "slate blue", "crimson", "teal", "bone white", "emerald", "magenta", "charcoal", "gold", "rust"]
+CAMERA = ["slow dolly in", "orbiting drone shot", "handheld tracking shot", "static wide shot", "crane up", "whip pan"]
+
+def synthetic_entry(rng: random.Random, serial: int) -> Entry:
+    subject, setting, style = rng.choice(SUBJECTS), rng.choice(SETTINGS), rng.choice(STYLES)
+    mood, lighting = rng.choice(MOODS), rng.choice(LIGHTING)
+    colors = rng.sample(COLORS, 3)
+    analysis: Dict[str, Any] = {
+        "main_subject": f"A {subject}",
+        "setting_and_environment": f"A {setting}",
+        "artistic_style": style,
+        "mood_and_atmosphere": mood,
+        "lighting_style": lighting,
+        "color_scheme": colors,
+        "compositional_notes": "Rule of thirds, low angle",
+    }
+    if rng.random() < 0.7:
+        prompt = f"A {mood} {subject} in a {setting}, {style}, {lighting}, {', '.join(colors)} palette, highly detailed, take {serial}"
+        return prompt, "image", analysis
+    prompt = f"{rng.choice(CAMERA).capitalize()} on a {subject} in a {setting}; {mood} mood, {lighting}, {style} look, take {serial}"
+    return prompt, "video", analysis
+
+def build(index: PromptIndex, size: int, batch_size: int, seed: int) -> float:
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    for start in range(len(index), size, batch_size):
+        index.add_many([synthetic_entry(rng, serial) for serial in range(start, min(start + batch_size, size))])
+    return time.perf_counter() - started
+
+def time_queries(index: PromptIndex, queries: List[str], k: int, kind: Any = None) -> Tuple[float, float, float]:
+    index.search(queries[0], k, kind)  # Warm-up: pages in the mapped vectors
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, k, kind)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.median(latencies), percentile(latencies, 95), percentile(latencies, 99)
+
+def directory_mb(directory: str) -> float:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 2**20
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prompt index build and query latency at scale.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="Index sizes to measure (grown in place).")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries per size.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=256, help="Hashing embedder dimensions.")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Entries per add_many call while building.")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    queries = [f"{rng.choice(MOODS)} {rng.choice(SUBJECTS)} {rng.choice(STYLES)}" for _ in range(args.queries)]
+    with tempfile.TemporaryDirectory(prefix="bench-prompt-index-") as directory:
+        index = PromptIndex(directory, HashingEmbedder(args.dim))
+        for size in sorted(args.sizes):
+            seconds = build(index, size, args.batch_size, seed=size)
+            index.flush()
+            print(f"{size:>9,} prompts (dim {args.dim}): built in {seconds:6.1f} s, {directory_mb(directory):7.0f} MiB on disk, peak RSS {peak_rss_mb():6.0f} MB")
+            p50, p95, p99 = time_queries(index, queries, args.k)
+            print(f"  top-{args.k} query            p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  p99 {p99:7.2f} ms")
+            p50, p95, p99 = time_queries(index, queries, args.k, "video")
+            print(f"  top-{args.k} query, kind=video p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  p99 {p99:7.2f} ms")
+            started = time.perf_counter()
+            reopened = PromptIndex(directory, HashingEmbedder(args.dim))
+            print(f"  reopen                   {(time.perf_counter() - started) * 1000:7.0f} ms ({len(reopened):,} prompts)")
+            del reopened
+        index.close()
+
+if __name__ == "__main__":
+    main()
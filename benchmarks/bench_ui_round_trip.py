@@ -0,0 +1,153 @@
+# File: benchmarks/bench_ui_round_trip.py
+# UI round trips: how the Streamlit client talks to the API, before and after.
+#
+# Starts the mock OpenAI server and the real API (`uvicorn src.main:app` in a
+# subprocess), then runs Stage 1 for a series of distinct phone-sized photos
+# the way `src/app.py` does:
+#   * legacy — a fresh connection per call (`requests.post`), the full-resolution
+#              upload, the script run blocked until the stream ends, and a
+#              full-size preview (`st.image` hashes the whole file on every rerun);
+#   * client — the pooled session from `src.client`, the upload downscaled on a
+#              worker thread, the script run free as soon as the call is
+#              submitted, and a thumbnail built once per file.
+# Streamlit itself is not needed.
+#
+# Usage:
+#   python -m benchmarks.bench_ui_round_trip --calls 8 --latency fixed:0.3
+
+import argparse
+import hashlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import requests
+from PIL import Image
+
+from benchmarks.mock_openai import LatencyModel, MockOpenAIServer, _free_port
+from benchmarks.run_suite import make_image
+from src.client import downscale_upload, make_session, start_call, stream_backend, thumbnail
+
+PHOTO_SIZE = (4032, 3024)  # A 12 MP phone photo
+
+def make_photo(seed: int) -> bytes:
+    """A unique photo-like JPEG: coloured blocks plus sensor-like noise, so it compresses like a real photo."""
+    base = Image.open(io.BytesIO(make_image(seed, PHOTO_SIZE))).convert("RGB")
+    noise = Image.effect_noise(PHOTO_SIZE, 40).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(base, noise, 0.2).save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+class ApiServer:
+    """The GenPrompt API in a subprocess, pointed at the mock OpenAI server."""
+
+    def __init__(self, openai_base_url: str):
+        self.port = _free_port()
+        env = {**os.environ, "OPENAI_API_KEY": "sk-benchmark", "GENPROMPT_OPENAI_BASE_URL": openai_base_url}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(self.port), "--log-level", "warning"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api"
+
+    def __enter__(self) -> "ApiServer":
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                requests.get(f"http://127.0.0.1:{self.port}/", timeout=1).raise_for_status()
+                return self
+            except requests.exceptions.RequestException:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.process.kill()
+                    raise RuntimeError("The API server did not start.")
+                time.sleep(0.1)
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+def legacy_preview(data: bytes) -> None:
+    """What `st.image(uploaded_file)` does on each rerun: read the header and hash the whole file."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.size
+    hashlib.md5(data).hexdigest()
+
+def run_legacy(url: str, photos: List[bytes]) -> Dict[str, List[float]]:
+    results: Dict[str, List[float]] = {"round_trip": [], "blocked": [], "preview": [], "upload_bytes": [], "preview_bytes": []}
+    for index, photo in enumerate(photos):
+        started = time.perf_counter()
+        legacy_preview(photo)
+        results["preview"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        with requests.Session() as one_off:  # What a bare `requests.post` does per call
+            stream_backend(one_off, f"{url}/invoke-graph/stream", files={"image_bytes": (f"{index}.jpg", photo, "image/jpeg")})
+        elapsed = time.perf_counter() - started
+        results["round_trip"].append(elapsed)
+        results["blocked"].append(elapsed)
+        results["upload_bytes"].append(len(photo))
+        results["preview_bytes"].append(len(photo))
+    return results
+
+def run_client(url: str, photos: List[bytes]) -> Dict[str, List[float]]:
+    results: Dict[str, List[float]] = {"round_trip": [], "blocked": [], "preview": [], "upload_bytes": [], "preview_bytes": []}
+    session = make_session()
+    thumbnails: Dict[int, bytes] = {}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for index, photo in enumerate(photos):
+            started = time.perf_counter()
+            preview = thumbnails.get(index)
+            if preview is None:  # First render only; later reruns hit the cache.
+                preview = thumbnails[index] = thumbnail(photo)
+            results["preview"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            call = start_call(executor, session, f"{url}/invoke-graph/stream", "", "A", upload=(f"{index}.jpg", photo, "image/jpeg"))
+            results["blocked"].append(time.perf_counter() - started)
+            call.result()
+            results["round_trip"].append(time.perf_counter() - started)
+            results["preview_bytes"].append(len(preview))
+    results["upload_bytes"] = [len(downscale_upload(("p.jpg", photo, "image/jpeg"))[1]) for photo in photos]
+    session.close()
+    return results
+
+def summarize(label: str, results: Dict[str, List[float]]) -> Dict[str, float]:
+    summary = {
+        "round_trip_ms": statistics.median(results["round_trip"]) * 1000,
+        "blocked_ms": statistics.median(results["blocked"]) * 1000,
+        "preview_ms": statistics.median(results["preview"]) * 1000,
+        "upload_mib": statistics.median(results["upload_bytes"]) / 2**20,
+        "preview_kib": statistics.median(results["preview_bytes"]) / 1024,
+    }
+    print(
+        f"  {label:<8} round trip p50 {summary['round_trip_ms']:8.1f} ms | UI blocked p50 {summary['blocked_ms']:8.1f} ms | "
+        f"preview {summary['preview_ms']:6.1f} ms, {summary['preview_kib']:7.0f} KiB | upload {summary['upload_mib']:5.2f} MiB"
+    )
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Streamlit client round trips: legacy vs pooled, downscaled, background calls.")
+    parser.add_argument("--calls", type=int, default=8, help="Stage 1 calls per mode (each with a distinct photo).")
+    parser.add_argument("--latency", default="fixed:0.3", help="Mock LLM latency: fixed:S | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+    args = parser.parse_args()
+
+    print(f"Encoding {2 * args.calls} distinct {PHOTO_SIZE[0]}x{PHOTO_SIZE[1]} photos...")
+    photos = [make_photo(seed) for seed in range(2 * args.calls)]
+    with MockOpenAIServer(LatencyModel(args.latency)) as mock, ApiServer(mock.base_url) as api:
+        stream_backend(make_session(), f"{api.url}/invoke-graph/stream", files={"image_bytes": ("warm.jpg", make_image(999), "image/jpeg")})
+        print(f"{args.calls} sequential Stage 1 calls per mode:")
+        legacy = summarize("legacy", run_legacy(api.url, photos[: args.calls]))
+        client = summarize("client", run_client(api.url, photos[args.calls:]))
+    print(f"Round trip:     {legacy['round_trip_ms'] / client['round_trip_ms']:.2f}x faster")
+    print(f"UI blocked:     {legacy['blocked_ms']:.0f} ms -> {client['blocked_ms']:.1f} ms per call")
+    print(f"Upload size:    {legacy['upload_mib'] / client['upload_mib']:.1f}x smaller")
+    print(f"Preview bytes:  {legacy['preview_kib'] / client['preview_kib']:.1f}x smaller")
+
+if __name__ == "__main__":
+    main()
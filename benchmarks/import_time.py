@@ -0,0 +1,104 @@
+# File: benchmarks/import_time.py
+# Import-time budget: `import src.main` must stay cheap and free of side effects.
+#
+# Runs `python -X importtime -c "import src.main"` in fresh interpreters with
+# OPENAI_API_KEY unset and parses the per-module timings from stderr. Fails when
+#   * the median cumulative import time of the target exceeds the budget,
+#   * a module that should only load at startup or first use (LangGraph,
+#     LangChain, the OpenAI SDK, NumPy) is imported,
+#   * the import raises or prints anything (settings are validated in the lifespan).
+#
+# Usage:
+#   python -m benchmarks.import_time
+#   python -m benchmarks.import_time --budget-ms 800 --runs 7 --top 15
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+# Heavy packages that importing the app must not pull in.
+DEFERRED_PACKAGES = ("langgraph", "langchain_core", "langchain_openai", "openai", "langsmith", "numpy")
+# Median cumulative import time allowed for `import src.main`.
+DEFAULT_BUDGET_MS = 1500.0
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+class ModuleTiming(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+def parse_importtime(stderr: str) -> List[ModuleTiming]:
+    """Parses `-X importtime` lines; other stderr output is ignored."""
+    timings = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            timings.append(ModuleTiming(name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return timings
+
+def measure_once(module: str) -> Tuple[List[ModuleTiming], subprocess.CompletedProcess]:
+    env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    return parse_importtime(completed.stderr), completed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the import time of the API against a budget.")
+    parser.add_argument("--module", default="src.main", help="Module to import.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Fail if the median import takes longer.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time (the first warms the bytecode cache).")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to list.")
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    totals: List[float] = []
+    last: List[ModuleTiming] = []
+    measure_once(args.module)  # Warm-up: writes .pyc files and fills the OS file cache.
+    for _ in range(args.runs):
+        timings, completed = measure_once(args.module)
+        if completed.returncode != 0:
+            failures.append(f"import raised:\n{completed.stderr.splitlines()[-1] if completed.stderr else ''}")
+            break
+        if completed.stdout.strip():
+            failures.append(f"import printed to stdout: {completed.stdout.strip()[:200]!r}")
+        target = [timing for timing in timings if timing.name == args.module]
+        if not target:
+            failures.append(f"{args.module} missing from the -X importtime output")
+            break
+        totals.append(target[-1].cumulative_us / 1000)
+        last = timings
+
+    if totals:
+        median = statistics.median(totals)
+        print(f"import {args.module}: median {median:.0f} ms over {len(totals)} runs (budget {args.budget_ms:.0f} ms)")
+        if median > args.budget_ms:
+            failures.append(f"median import time {median:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+
+        packages: Dict[str, int] = {}
+        for timing in last:
+            package = timing.name.split(".")[0]
+            packages[package] = packages.get(package, 0) + timing.self_us
+        print("Slowest packages (self time, last run):")
+        for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[: args.top]:
+            print(f"  {name:<32} {self_us / 1000:8.1f} ms")
+
+        deferred = sorted({timing.name for timing in last if timing.name.split(".")[0] in DEFERRED_PACKAGES})
+        if deferred:
+            failures.append(f"deferred packages imported eagerly: {', '.join(deferred[:10])}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
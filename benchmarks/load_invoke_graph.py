@@ -0,0 +1,102 @@
+# File: benchmarks/load_invoke_graph.py
+# Load test: N concurrent /api/invoke-graph calls should take about as long as one.
+#
+# The OpenAI client is replaced by a stand-in that simply sleeps, so the test
+# measures how well the API overlaps LLM waits rather than OpenAI itself.
+#
+# Usage:
+#   python -m benchmarks.load_invoke_graph --concurrency 16 --latency 1.0
+#   GENPROMPT_LLM_ASYNC=false python -m benchmarks.load_invoke_graph   # thread-pool fallback
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-load-test")
+
+import httpx
+from langchain_core.messages import AIMessage
+
+from src.core.schemas import VisualAnalysis
+
+LATENCY_SECONDS = 1.0
+
+class SleepyChatModel:
+    """Mimics the parts of `ChatOpenAI` the agents use, with a fixed latency."""
+
+    def __init__(self, *args, schema=None, **kwargs):
+        self._schema = schema
+
+    def with_structured_output(self, schema, **kwargs):
+        return SleepyChatModel(schema=schema)
+
+    def _respond(self):
+        if self._schema is VisualAnalysis:
+            return VisualAnalysis(
+                main_subject="A lighthouse keeper",
+                setting_and_environment="a storm-battered cliff",
+                artistic_style="Moody oil painting",
+                mood_and_atmosphere="Lonely and resolute",
+                lighting_style="Lantern glow against blue dusk",
+                color_scheme=["slate blue", "amber"],
+                compositional_notes="Low angle, subject on the right third",
+            )
+        return AIMessage(content="a lighthouse keeper on a storm-battered cliff, moody oil painting")
+
+    async def ainvoke(self, _input):
+        await asyncio.sleep(LATENCY_SECONDS)
+        return self._respond()
+
+    def invoke(self, _input):
+        time.sleep(LATENCY_SECONDS)
+        return self._respond()
+
+def install_stand_in() -> None:
+    from src.core import clients
+
+    clients.ChatOpenAI = SleepyChatModel
+
+async def timed_batch(client: httpx.AsyncClient, n: int) -> float:
+    async def one_call():
+        # Unique bytes per call so the visual analysis cache never short-circuits the test.
+        files = {"image_bytes": ("load.jpg", b"\xff\xd8\xff\xe0 fake jpeg " + os.urandom(16), "image/jpeg")}
+        response = await client.post("/api/invoke-graph", files=files, data={"prompt_history_json": "[]"})
+        response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_call() for _ in range(n)))
+    return time.perf_counter() - start
+
+async def run(concurrency: int, max_ratio: float) -> int:
+    install_stand_in()
+    from src.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=300) as client:
+        single = await timed_batch(client, 1)
+        concurrent = await timed_batch(client, concurrency)
+
+    ratio = concurrent / single
+    print(f"1 call:            {single:.2f}s")
+    print(f"{concurrency} concurrent calls: {concurrent:.2f}s")
+    print(f"ratio:             {ratio:.2f}x (serialized would be ~{concurrency}x)")
+    if ratio > max_ratio:
+        print(f"FAIL: ratio exceeds {max_ratio}x")
+        return 1
+    print("OK")
+    return 0
+
+def main() -> None:
+    global LATENCY_SECONDS
+    parser = argparse.ArgumentParser(description="Concurrent /api/invoke-graph load test.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=1.0, help="Simulated seconds per LLM call.")
+    parser.add_argument("--max-ratio", type=float, default=1.5, help="Fail if N calls take longer than this many single calls.")
+    args = parser.parse_args()
+    LATENCY_SECONDS = args.latency
+    sys.exit(asyncio.run(run(args.concurrency, args.max_ratio)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# File: benchmarks/mock_openai.py
+# A local, OpenAI-compatible stand-in for /v1/chat/completions.
+#
+# Answers with canned prompts after a configurable latency, supports streaming
+# (SSE chunks with a final usage chunk) and structured output, both as
+# `response_format: json_schema` and as tool calls, returning a valid
+# `VisualAnalysis`. Token usage is estimated from the request so the tracing
+# and cost metrics have realistic input. Cached prompt tokens follow OpenAI's
+# automatic prompt caching: the longest prefix (tools, schema, then messages in
+# order) already seen in an earlier request, counted in 128-token blocks, and
+# only once it reaches `--cache-min-tokens` (1024, as OpenAI).
+#
+# Usage (standalone, then point the API at it):
+#   python -m benchmarks.mock_openai --port 8900 --latency lognormal:0.8:0.35
+#   GENPROMPT_OPENAI_BASE_URL=http://127.0.0.1:8900/v1 uvicorn src.main:app
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.core.schemas import VisualAnalysis
+
+CANNED_ANALYSIS = VisualAnalysis(
+    main_subject="A lighthouse keeper in an oilskin coat",
+    setting_and_environment="A storm-battered cliff above a grey sea",
+    artistic_style="Moody oil painting with heavy impasto",
+    mood_and_atmosphere="Lonely, resolute, windswept",
+    lighting_style="Warm lantern glow against a cold blue dusk",
+    color_scheme=["slate blue", "amber", "bone white"],
+    compositional_notes="Low angle; keeper on the right third, beam sweeping left",
+)
+
+CANNED_PROMPT = (
+    "A weathered lighthouse keeper in a dripping oilskin coat stands on a storm-battered cliff, "
+    "lantern raised against a cold blue dusk, waves exploding below, moody oil painting, heavy "
+    "impasto, warm amber light, low angle, cinematic composition, highly detailed"
+)
+
+# Flat token cost charged per image part, roughly a tiled 1024px image.
+IMAGE_TOKENS = 765
+# Shortest prompt prefix that is cached, and the granularity of cache hits, as OpenAI.
+CACHE_MIN_PROMPT_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+@dataclass
+class LatencyModel:
+    """
+    Samples per-call latency. Specs: `fixed:S`, `uniform:LO:HI`, or
+    `lognormal:MEDIAN:SIGMA` (seconds). Streaming spreads the sampled latency
+    between time to first token (`ttft_share`) and the remaining chunks.
+    """
+
+    spec: str = "fixed:0.5"
+    ttft_share: float = 0.4
+
+    def sample(self) -> float:
+        kind, *params = self.spec.split(":")
+        values = [float(p) for p in params]
+        if kind == "fixed":
+            return values[0]
+        if kind == "uniform":
+            return random.uniform(values[0], values[1])
+        if kind == "lognormal":
+            median, sigma = values
+            return random.lognormvariate(0.0, sigma) * median
+        raise ValueError(f"Unknown latency distribution: {self.spec}")
+
+    def median(self) -> float:
+        kind, *params = self.spec.split(":")
+        values = [float(p) for p in params]
+        return (values[0] + values[1]) / 2 if kind == "uniform" else values[0]
+
+def _estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                tokens += IMAGE_TOKENS
+            else:
+                tokens += len(part.get("text") or "") // 4 + 1
+    return tokens
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    """The request as the provider would see it, about four characters per token; images as opaque runs."""
+    parts = [json.dumps(body.get("tools") or []), json.dumps(body.get("response_format") or {})]
+    for message in body.get("messages", []):
+        parts.append(f"<|{message.get('role')}|>")
+        content = message.get("content")
+        for part in content if isinstance(content, list) else [{"type": "text", "text": content or ""}]:
+            if part.get("type") == "image_url":
+                url = json.dumps(part.get("image_url"), sort_keys=True).encode("utf-8")
+                parts.append(hashlib.sha256(url).hexdigest().ljust(IMAGE_TOKENS * 4, "#"))
+            else:
+                parts.append(part.get("text") or "")
+    return "".join(parts)
+
+class PrefixCache:
+    """Remembers every prompt prefix, in 128-token blocks, and reports how much of a new prompt was seen before."""
+
+    def __init__(self, min_tokens: int = CACHE_MIN_PROMPT_TOKENS):
+        self.min_tokens = min_tokens
+        self._blocks: set = set()
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, body: Dict[str, Any], prompt_tokens: int) -> int:
+        text = _prompt_text(body)
+        block_chars = CACHE_BLOCK_TOKENS * 4
+        digest = hashlib.sha256()
+        cached = 0
+        with self._lock:
+            for end in range(block_chars, len(text) + 1, block_chars):
+                digest.update(text[end - block_chars:end].encode("utf-8"))
+                key = digest.hexdigest()
+                if key in self._blocks and cached == end - block_chars:
+                    cached = end
+                self._blocks.add(key)
+        tokens = min(cached // 4, prompt_tokens)
+        return tokens if tokens >= self.min_tokens else 0
+
+def _usage(prompt_tokens: int, completion_text: str, cached: int = 0) -> Dict[str, Any]:
+    completion_tokens = len(completion_text) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+
+def _response_plan(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Decides what to answer: plain text, JSON content, or a tool call."""
+    tools = body.get("tools") or []
+    response_format = body.get("response_format") or {}
+    analysis_json = CANNED_ANALYSIS.model_dump_json()
+    if tools:
+        name = tools[0]["function"]["name"]
+        return {"tool_call": {"id": f"call_{uuid.uuid4().hex[:12]}", "name": name, "arguments": analysis_json}}
+    if response_format.get("type") in ("json_schema", "json_object"):
+        return {"content": analysis_json}
+    return {"content": CANNED_PROMPT}
+
+def _message(plan: Dict[str, Any]) -> Dict[str, Any]:
+    if "tool_call" in plan:
+        call = plan["tool_call"]
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}],
+        }
+    return {"role": "assistant", "content": plan["content"]}
+
+def create_app(latency: LatencyModel, chunk_chars: int = 24, cache_min_tokens: int = CACHE_MIN_PROMPT_TOKENS) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI")
+    app.state.calls = 0
+    prefix_cache = PrefixCache(cache_min_tokens)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        plan = _response_plan(body)
+        text = plan.get("content") or plan.get("tool_call", {}).get("arguments", "")
+        prompt_tokens = _estimate_prompt_tokens(body.get("messages", []))
+        usage = _usage(prompt_tokens, text, prefix_cache.cached_tokens(body, prompt_tokens))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o")
+        total_latency = latency.sample()
+
+        if not body.get("stream"):
+            await asyncio.sleep(total_latency)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": _message(plan), "finish_reason": "tool_calls" if "tool_call" in plan else "stop"}],
+                "usage": usage,
+            })
+
+        async def chunks() -> AsyncIterator[str]:
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                    **extra,
+                }
+                return f"data: {json.dumps(payload)}\n\n"
+
+            pieces = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+            await asyncio.sleep(total_latency * latency.ttft_share)
+            per_chunk = total_latency * (1 - latency.ttft_share) / len(pieces)
+            if "tool_call" in plan:
+                call = plan["tool_call"]
+                yield chunk({"role": "assistant", "content": None, "tool_calls": [
+                    {"index": 0, "id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": ""}}
+                ]})
+                for piece in pieces:
+                    await asyncio.sleep(per_chunk)
+                    yield chunk({"tool_calls": [{"index": 0, "function": {"arguments": piece}}]})
+                yield chunk({}, "tool_calls")
+            else:
+                yield chunk({"role": "assistant", "content": ""})
+                for piece in pieces:
+                    await asyncio.sleep(per_chunk)
+                    yield chunk({"content": piece})
+                yield chunk({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk(None, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class MockOpenAIServer:
+    """Runs the mock in a background thread on a free local port."""
+
+    def __init__(self, latency: LatencyModel, port: Optional[int] = None, cache_min_tokens: int = CACHE_MIN_PROMPT_TOKENS):
+        self.app = create_app(latency, cache_min_tokens=cache_min_tokens)
+        self.port = port or _free_port()
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning", backlog=4096)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, name="mock-openai", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def calls(self) -> int:
+        return self.app.state.calls
+
+    def __enter__(self) -> "MockOpenAIServer":
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Mock OpenAI server did not start.")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock server.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="fixed:0.5", help="fixed:S | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--ttft-share", type=float, default=0.4, help="Share of the latency spent before the first streamed token.")
+    parser.add_argument("--cache-min-tokens", type=int, default=CACHE_MIN_PROMPT_TOKENS, help="Shortest prompt prefix reported as cached.")
+    args = parser.parse_args()
+    app = create_app(LatencyModel(args.latency, args.ttft_share), cache_min_tokens=args.cache_min_tokens)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, backlog=4096)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+# File: benchmarks/run_suite.py
+# Offline benchmark suite: drives the FastAPI app against a local OpenAI stand-in.
+#
+# Every endpoint / graph path is exercised at a controlled concurrency through
+# the real ASGI app (`src.main:app`). By default the LLM is the mock server in
+# `benchmarks/mock_openai.py`, so the whole OpenAI client stack (pooled httpx,
+# retries, streaming, structured output parsing) runs; `--backend fake` uses
+# the in-process `SleepyChatModel` instead. Results are written as JSON and
+# can be compared against an earlier run.
+#
+# Scenarios that return Prompt A also report its quality: how it was written
+# (LLM or local composer), its length, the share of the visual analysis' content
+# words it keeps, and how many pass the routing validator. `stage1` and
+# `stage1_composer` are compared side by side at the end. The mock answers with
+# one canned, hand-written prompt for its canned analysis, so the LLM figures
+# describe that reference prompt rather than a live model.
+#
+# Usage:
+#   python -m benchmarks.run_suite --requests 64 --concurrency 16 --latency lognormal:0.5:0.3 -o after.json
+#   python -m benchmarks.run_suite --scenarios stage1 refine --compare before.json
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import httpx
+from PIL import Image
+
+from benchmarks.mock_openai import CACHE_MIN_PROMPT_TOKENS, LatencyModel, MockOpenAIServer
+
+@dataclass
+class Scenario:
+    """One endpoint call shape and the graph path it exercises."""
+
+    name: str
+    graph_path: str
+    endpoint: str
+    needs_session: bool = False
+    streaming: bool = False
+    form: Dict[str, str] = field(default_factory=dict)
+
+SCENARIOS = [
+    Scenario("stage1", "visual_analyst→prompt_engineer", "/api/invoke-graph"),
+    Scenario("stage1_composer", "visual_analyst→prompt_composer", "/api/invoke-graph", form={"prompt_mode": "composer"}),
+    Scenario("stage1_stream", "visual_analyst→prompt_engineer", "/api/invoke-graph/stream", streaming=True),
+    Scenario("stage2_image", "video_director", "/api/generate-video-prompt"),
+    Scenario("stage2_session", "video_director (from analysis)", "/api/generate-video-prompt", needs_session=True),
+    Scenario("refine", "refiner", "/api/refine-prompt", needs_session=True),
+    Scenario("full", "visual_analyst→{prompt_engineer, video_director}", "/api/generate-prompts"),
+]
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = {"with", "from", "into", "against", "above", "below", "their", "there", "this", "that", "while", "heavy", "right", "left"}
+
+def content_words(text: str) -> set:
+    return {word for word in _WORD.findall(text.lower()) if len(word) > 3 and word not in STOPWORDS}
+
+def analysis_coverage(analysis: Dict[str, Any], prompt: str) -> float:
+    """Share of the analysis' content words that made it into the prompt."""
+    expected = content_words(" ".join(" ".join(v) if isinstance(v, list) else str(v) for v in analysis.values()))
+    return len(expected & content_words(prompt)) / len(expected) if expected else 0.0
+
+# Every VideoCreativeBrief field is set, so the template's brief path is measured.
+BRIEF = json.dumps({
+    "moods": ["Tense", "Dreamy"],
+    "camera_movement": "Slow Dolly In",
+    "additional_notes": "The keeper raises the lantern as the storm breaks.",
+})
+
+def make_image(seed: int, size=(1024, 768)) -> bytes:
+    """A cheap, unique JPEG per seed so the analysis cache never short-circuits a call."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(8):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        box = (x0, y0, min(size[0], x0 + rng.randrange(50, 400)), min(size[1], y0 + rng.randrange(50, 300)))
+        image.paste(tuple(rng.randrange(256) for _ in range(3)), box)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def rss_mb() -> float:
+    """Current resident set size of this process (Linux), falling back to the peak."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, rest = entry.strip().partition(";dur=")
+        if name and rest:
+            timings[name] = float(rest)
+    return timings
+
+class SuiteRunner:
+    def __init__(self, client: httpx.AsyncClient, requests: int, concurrency: int, unique_images: bool):
+        self.client = client
+        self.requests = requests
+        self.concurrency = concurrency
+        self.unique_images = unique_images
+        self.seed = 0
+
+    def _image(self) -> bytes:
+        self.seed += 1
+        return make_image(self.seed if self.unique_images else 0)
+
+    async def _new_session(self) -> str:
+        files = {"image_bytes": ("seed.jpg", self._image(), "image/jpeg")}
+        response = await self.client.post("/api/invoke-graph", files=files)
+        response.raise_for_status()
+        return response.json()["session_id"]
+
+    def _request(self, scenario: Scenario, image: bytes, session_id: Optional[str]) -> Callable[[], Any]:
+        files = {"image_bytes": ("bench.jpg", image, "image/jpeg")}
+        if scenario.name == "refine":
+            payload = {"session_id": session_id, "active_prompt_type": "image", "user_feedback": "Make it more cinematic."}
+            return lambda: self.client.post(scenario.endpoint, json=payload)
+        if scenario.name == "stage2_session":
+            return lambda: self.client.post(scenario.endpoint, data={"creative_brief_json": BRIEF, "session_id": session_id})
+        if scenario.name == "stage2_image":
+            return lambda: self.client.post(scenario.endpoint, files=files, data={"creative_brief_json": BRIEF})
+        if scenario.name == "full":
+            return lambda: self.client.post(scenario.endpoint, files=files, data={"creative_brief_json": BRIEF})
+        return lambda: self.client.post(scenario.endpoint, files=files, data=scenario.form)
+
+    async def run(self, scenario: Scenario) -> Dict[str, Any]:
+        sessions = [await self._new_session() for _ in range(self.concurrency)] if scenario.needs_session else []
+        # Build every request body up front so image generation stays out of the timings.
+        calls = [
+            self._request(scenario, self._image(), sessions[i % len(sessions)] if sessions else None)
+            for i in range(self.requests + 1)
+        ]
+        await calls.pop()()  # Warm-up, not measured.
+
+        latencies: List[float] = []
+        node_timings: Dict[str, List[float]] = {}
+        errors = 0
+        bodies: List[Dict[str, Any]] = []
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(call: Callable[[], Any]) -> None:
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await call()
+                body_ok = response.status_code == 200 and (not scenario.streaming or "event: final" in response.text)
+                latencies.append(time.perf_counter() - started)
+                if not body_ok:
+                    errors += 1
+                if not scenario.streaming:
+                    if body_ok:
+                        bodies.append(response.json())
+                    for name, ms in parse_server_timing(response.headers.get("server-timing")).items():
+                        node_timings.setdefault(name, []).append(ms)
+
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(call) for call in calls))
+        wall = time.perf_counter() - started
+        return {
+            "graph_path": scenario.graph_path,
+            "endpoint": scenario.endpoint,
+            "requests": len(latencies),
+            "errors": errors,
+            "concurrency": self.concurrency,
+            "wall_seconds": round(wall, 3),
+            "throughput_rps": round(len(latencies) / wall, 3),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 1),
+                "p95": round(percentile(latencies, 95) * 1000, 1),
+                "p99": round(percentile(latencies, 99) * 1000, 1),
+                "mean": round(statistics.fmean(latencies) * 1000, 1),
+                "max": round(max(latencies) * 1000, 1),
+            },
+            "server_timing_p50_ms": {name: round(percentile(values, 50), 1) for name, values in node_timings.items()},
+            "rss_mb": {"before": round(rss_before, 1), "after": round(rss_mb(), 1), "peak": round(peak_rss_mb(), 1)},
+            "prompt_a": prompt_a_quality(bodies),
+        }
+
+def prompt_a_quality(bodies: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Who wrote Prompt A, and its length, analysis coverage and validity, over the responses whose run wrote one."""
+    from src.core.routing import validate_prompt_text
+
+    rows = [(body["image_prompt"]["prompt_body"], body) for body in bodies if body.get("image_prompt_source") and body.get("visual_analysis")]
+    if not rows:
+        return None
+    sources: Dict[str, int] = {}
+    for _, body in rows:
+        sources[body["image_prompt_source"]] = sources.get(body["image_prompt_source"], 0) + 1
+    return {
+        "sources": sources,
+        "words_mean": round(statistics.fmean(len(prompt.split()) for prompt, _ in rows), 1),
+        "analysis_coverage": round(statistics.fmean(analysis_coverage(body["visual_analysis"], prompt) for prompt, body in rows), 3),
+        "valid_rate": round(sum(validate_prompt_text(prompt) for prompt, _ in rows) / len(rows), 3),
+    }
+
+def compare_prompt_modes(results: Dict[str, Any]) -> Optional[str]:
+    """Stage 1 with the LLM against Stage 1 with the local composer, when both ran."""
+    llm, composer = results.get("stage1"), results.get("stage1_composer")
+    if not llm or not composer or not llm.get("prompt_a") or not composer.get("prompt_a"):
+        return None
+    rows = [
+        ("p50 ms", llm["latency_ms"]["p50"], composer["latency_ms"]["p50"]),
+        ("p95 ms", llm["latency_ms"]["p95"], composer["latency_ms"]["p95"]),
+        ("req/s", llm["throughput_rps"], composer["throughput_rps"]),
+        ("words", llm["prompt_a"]["words_mean"], composer["prompt_a"]["words_mean"]),
+        ("coverage %", llm["prompt_a"]["analysis_coverage"] * 100, composer["prompt_a"]["analysis_coverage"] * 100),
+        ("valid %", llm["prompt_a"]["valid_rate"] * 100, composer["prompt_a"]["valid_rate"] * 100),
+    ]
+    lines = ["Prompt A, LLM vs composer:", f"  {'metric':<12} {'llm':>10} {'composer':>10}"]
+    lines += [f"  {metric:<12} {a:>10.1f} {b:>10.1f}" for metric, a, b in rows]
+    return "\n".join(lines)
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    """Formats p50/p95/p99 and throughput of `current` against `baseline`, per scenario."""
+    lines = [f"{'scenario':<16} {'metric':<12} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        rows = [(f"{q} ms", before["latency_ms"][q], result["latency_ms"][q]) for q in ("p50", "p95", "p99")]
+        rows.append(("req/s", before["throughput_rps"], result["throughput_rps"]))
+        rows.append(("peak RSS MB", before["rss_mb"]["peak"], result["rss_mb"]["peak"]))
+        for metric, old, new in rows:
+            change = (new - old) / old * 100 if old else 0.0
+            lines.append(f"{name:<16} {metric:<12} {old:>10.1f} {new:>10.1f} {change:>+7.1f}%")
+    return "\n".join(lines)
+
+def tokens_by_node() -> Dict[str, Dict[str, float]]:
+    """Prompt tokens and cached prompt tokens so far, per graph node, from the process metrics."""
+    from src.core.metrics import metrics
+
+    counters = metrics.snapshot()["counters"]
+    usage: Dict[str, Dict[str, float]] = {}
+    for kind in ("prompt", "cached"):
+        for labels, value in counters.get(f"genprompt_llm_{kind}_tokens_total", {}).items():
+            node = dict(labels).get("node", "none")
+            usage.setdefault(node, {"prompt": 0.0, "cached": 0.0})[kind] += value
+    return usage
+
+def token_delta(before: Dict[str, Dict[str, float]], after: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    delta = {}
+    for node, totals in after.items():
+        earlier = before.get(node, {})
+        prompt = totals["prompt"] - earlier.get("prompt", 0.0)
+        if prompt:
+            delta[node] = {"prompt": prompt, "cached": totals["cached"] - earlier.get("cached", 0.0)}
+    return delta
+
+async def run_suite(args: argparse.Namespace, base_url: Optional[str]) -> Dict[str, Any]:
+    from src.config import settings
+
+    if base_url:
+        settings.OPENAI_BASE_URL = base_url
+    else:
+        from benchmarks import load_invoke_graph
+
+        # The in-process fake has a single fixed latency: the distribution's median.
+        load_invoke_graph.LATENCY_SECONDS = LatencyModel(args.latency).median()
+        load_invoke_graph.install_stand_in()
+
+    from src.main import app
+
+    selected = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+    results: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            runner = SuiteRunner(client, args.requests, args.concurrency, not args.same_image)
+            for scenario in selected:
+                before = tokens_by_node()
+                results[scenario.name] = await runner.run(scenario)
+                results[scenario.name]["tokens_by_node"] = token_delta(before, tokens_by_node())
+                latency = results[scenario.name]["latency_ms"]
+                print(
+                    f"{scenario.name:<16} p50={latency['p50']:>8.1f}ms p95={latency['p95']:>8.1f}ms "
+                    f"p99={latency['p99']:>8.1f}ms {results[scenario.name]['throughput_rps']:>7.2f} req/s "
+                    f"errors={results[scenario.name]['errors']}"
+                )
+                for node, tokens in results[scenario.name]["tokens_by_node"].items():
+                    print(f"  {node:<22} prompt tokens {tokens['prompt']:>9.0f}, cached {tokens['cached']:>9.0f} ({tokens['cached'] / tokens['prompt']:.0%})")
+                quality = results[scenario.name]["prompt_a"]
+                if quality:
+                    sources = ", ".join(f"{source} {count}" for source, count in sorted(quality["sources"].items()))
+                    print(
+                        f"  Prompt A ({sources}): {quality['words_mean']:.0f} words, "
+                        f"analysis coverage {quality['analysis_coverage']:.0%}, valid {quality['valid_rate']:.0%}"
+                    )
+    comparison = compare_prompt_modes(results)
+    if comparison:
+        print(comparison)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "backend": args.backend,
+            "latency": args.latency,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "unique_images": not args.same_image,
+            "cache_min_tokens": args.cache_min_tokens,
+        },
+        "scenarios": results,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the GenPrompt API against a local OpenAI stand-in.")
+    parser.add_argument("--scenarios", nargs="*", choices=[s.name for s in SCENARIOS], help="Subset to run (default: all).")
+    parser.add_argument("--requests", "-n", type=int, default=32, help="Measured requests per scenario.")
+    parser.add_argument("--concurrency", "-c", type=int, default=8)
+    parser.add_argument("--latency", default="lognormal:0.5:0.3", help="fixed:S | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--backend", choices=["mock", "fake"], default="mock", help="Mock HTTP server, or in-process fake model.")
+    parser.add_argument("--mock-url", help="Use an already running mock server (e.g. http://127.0.0.1:8900/v1).")
+    parser.add_argument("--same-image", action="store_true", help="Reuse one image, letting caches hit.")
+    parser.add_argument("--output", "-o", default="benchmark_results.json")
+    parser.add_argument("--compare", help="An earlier results JSON to compare against.")
+    parser.add_argument("--cache-min-tokens", type=int, default=CACHE_MIN_PROMPT_TOKENS, help="Mock: shortest prompt prefix reported as cached.")
+    args = parser.parse_args()
+
+    if args.backend == "fake":
+        report = asyncio.run(run_suite(args, None))
+    elif args.mock_url:
+        report = asyncio.run(run_suite(args, args.mock_url))
+    else:
+        with MockOpenAIServer(LatencyModel(args.latency), cache_min_tokens=args.cache_min_tokens) as server:
+            report = asyncio.run(run_suite(args, server.base_url))
+            report["meta"]["mock_calls"] = server.calls
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(report, json.load(f)))
+
+if __name__ == "__main__":
+    main()
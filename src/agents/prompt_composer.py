@@ -0,0 +1,70 @@
+# File: src/agents/prompt_composer.py
+# Zero-LLM path for Prompt A: composes it from the visual analysis (see
+# core.composer), and decides when a run should take this path.
+
+import logging
+from typing import Any, Dict, Optional
+
+from ..config import settings
+from ..core.circuit import is_circuit_open
+from ..core.composer import compose_image_prompt
+from ..core.metrics import metrics
+from ..core.routing import FAST, STRONG, tier_model
+from ..core.scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+def prompt_engineer_models() -> set:
+    """The models the prompt engineer may call: both tiers when it is routed, else the strong one."""
+    if settings.ROUTING_ENABLED and "prompt_engineer" in settings.ROUTING_NODES:
+        return {tier_model(FAST), tier_model(STRONG)}
+    return {tier_model(STRONG)}
+
+def composer_reason(state: Dict[str, Any]) -> Optional[str]:
+    """
+    Why this run's Prompt A should be composed locally: "requested"
+    (prompt_mode=composer), "saturated" (the LLM scheduler would reject the
+    call) or "circuit_open" (every model the prompt engineer may use is
+    failing). None means the LLM writes it.
+    """
+    mode = state.get("prompt_mode")
+    if mode == "composer":
+        return "requested"
+    if mode == "llm" or not settings.PROMPT_COMPOSER_AUTO:
+        return None
+    scheduler = get_scheduler()
+    if scheduler is not None and scheduler.is_saturated():
+        return "saturated"
+    if all(is_circuit_open(model) for model in prompt_engineer_models()):
+        return "circuit_open"
+    return None
+
+def image_prompt_node(state: Dict[str, Any]) -> str:
+    """The node that writes Prompt A for this run; a composer choice is counted by reason."""
+    reason = composer_reason(state)
+    if reason is None:
+        return "prompt_engineer"
+    metrics.inc("genprompt_prompt_composer_total", reason=reason)
+    logger.info("Composing Prompt A locally (%s).", reason)
+    return "prompt_composer"
+
+def compose_update(visual_analysis: Any) -> Dict[str, Any]:
+    """The state update for a locally composed Prompt A."""
+    final_prompt = compose_image_prompt(visual_analysis)
+    return {"image_prompt": final_prompt, "image_prompt_source": "composer", "prompt_history": [final_prompt.prompt_body]}
+
+async def run_prompt_composer(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Writes Prompt A from the visual analysis without calling a model.
+    Returns only the state update; the graph merges it and appends `prompt_history`.
+    """
+    logger.info("---AGENT: PROMPT COMPOSER---")
+    visual_analysis = state.get("visual_analysis")
+    if not visual_analysis:
+        logger.error("Visual analysis is missing from the state. Cannot compose prompt.")
+        return {}
+    try:
+        return compose_update(visual_analysis)
+    except Exception as e:
+        logger.error("An error occurred in Prompt Composer: %s", e, exc_info=True)
+        return {}
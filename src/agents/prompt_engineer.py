@@ -1,45 +1,63 @@
-from jinja2 import Template
-from langchain_openai import ChatOpenAI
 from typing import Dict, Any
 import logging # Use logging here too for consistency
 
+from ..config import settings
 from ..core.schemas import ImagePrompt
-from ..core.prompts import IMAGE_PROMPT_ENGINEER_TEMPLATE
+from ..core.circuit import CircuitOpen
+from ..core.llm import UNAVAILABLE_ERRORS
+from ..core.metrics import metrics
+from ..core.scheduler import SchedulerSaturated
+from ..core.routing import FAST, ainvoke_routed, choose_tier, escalate, validate_prompt_text
+from ..core.templates import get_template, prompt_messages
+from .prompt_composer import compose_update
 
 logger = logging.getLogger(__name__)
 
-def run_prompt_engineer(state: Dict[str, Any]) -> Dict[str, Any]:
-    """Invokes the PromptEngineerAgent to synthesize Prompt A, now with robust error handling."""
+PROMPT_ENGINEER_TEMPERATURE = 0.7
+
+async def run_prompt_engineer(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Invokes the PromptEngineerAgent to synthesize Prompt A, now with robust error handling.
+    Returns only the state update; the graph merges it and appends `prompt_history`.
+    If the LLM turns out to be saturated or failing, Prompt A is composed locally
+    instead, unless the request asked for the LLM (prompt_mode=llm).
+    """
     logger.info("---AGENT: PROMPT ENGINEER---")
 
     # This is the most likely point of failure.
     visual_analysis = state.get('visual_analysis')
     if not visual_analysis:
         logger.error("Visual analysis is missing from the state. Cannot generate prompt.")
-        # Return the state unmodified so the app doesn't crash
-        return state
+        # Return an empty update so the app doesn't crash
+        return {}
 
     try:
-        model = ChatOpenAI(model="gpt-4o", temperature=0.7)
-        template = Template(IMAGE_PROMPT_ENGINEER_TEMPLATE)
+        template = get_template("image_prompt_engineer")
 
         # This line can fail if 'visual_analysis' is not the expected object
         prompt_str = template.render(analysis=visual_analysis)
-        
-        logger.info("Successfully rendered prompt template. Calling OpenAI...")
-        response = model.invoke(prompt_str)
+        messages = prompt_messages("image_prompt_engineer", prompt_str)
+        decision = choose_tier("prompt_engineer", sum(len(message.content) for message in messages))
 
-        final_prompt = ImagePrompt(prompt_body=response.content)
-        
-        state['image_prompt'] = final_prompt
-        # Ensure prompt_history is initialized before appending
-        if 'prompt_history' not in state:
-            state['prompt_history'] = []
-        state['prompt_history'].append(final_prompt.prompt_body)
-        logger.info("Successfully generated and stored new image prompt.")
+        logger.info("Successfully rendered prompt template. Calling %s...", decision.model)
+        response = await ainvoke_routed(decision, PROMPT_ENGINEER_TEMPERATURE, messages)
+        if decision.tier == FAST and not validate_prompt_text(response.content):
+            response = await ainvoke_routed(escalate(decision), PROMPT_ENGINEER_TEMPERATURE, messages)
 
+        final_prompt = ImagePrompt(prompt_body=response.content)
+        logger.info("Successfully generated new image prompt.")
+        return {"image_prompt": final_prompt, "image_prompt_source": "llm", "prompt_history": [final_prompt.prompt_body]}
+
+    except (SchedulerSaturated, CircuitOpen) as e:
+        if state.get("prompt_mode") == "llm" or not settings.PROMPT_COMPOSER_AUTO:
+            raise
+        reason = "saturated" if isinstance(e, SchedulerSaturated) else "circuit_open"
+        metrics.inc("genprompt_prompt_composer_total", reason=reason)
+        logger.warning("LLM unavailable for Prompt A (%s); composing it locally.", e)
+        return compose_update(visual_analysis)
+    except UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error("An error occurred in Prompt Engineer: %s", e, exc_info=True)
         # We don't modify the state, just log the error and let it pass
-    
-    return state
\ No newline at end of file
+        return {}
\ No newline at end of file
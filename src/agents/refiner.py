@@ -1,19 +1,53 @@
 # File: src/agents/refiner.py
 # FINAL, HARDENED VERSION
 
+import asyncio
 import logging
-from typing import Dict, Any
-from jinja2 import Template
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, List
 
+from ..config import settings
 from ..core.schemas import ImagePrompt
-from ..core.prompts import PROMPT_REFINER_TEMPLATE
+from ..core.metrics import metrics
+from ..core.refine_cache import get_refine_cache, refine_cache_key
+from ..core.llm import UNAVAILABLE_ERRORS
+from ..core.routing import FAST, RoutingDecision, ainvoke_routed, choose_tier, escalate, validate_prompt_text
+from ..core.templates import get_template, prompt_messages
 
 logger = logging.getLogger(__name__)
 
-def run_refiner(state: Dict[str, Any]) -> Dict[str, Any]:
+REFINER_TEMPERATURE = 0.5
+
+async def _refine_candidates(decision: RoutingDecision, temperature: float, messages: List[Any], count: int, original: str) -> List[str]:
+    """
+    Runs `count` refinement calls concurrently and returns the usable ones in
+    order. Fast-tier output must also pass validation. Fails only when every
+    call fails.
+    """
+    responses = await asyncio.gather(
+        *(ainvoke_routed(decision, temperature, messages) for _ in range(count)),
+        return_exceptions=True,
+    )
+    candidates = []
+    for response in responses:
+        if isinstance(response, UNAVAILABLE_ERRORS):
+            raise response
+        if isinstance(response, BaseException):
+            logger.warning("A refinement candidate failed: %s", response)
+            continue
+        text = response.content.strip()
+        if decision.tier == FAST and not validate_prompt_text(text, previous=original):
+            logger.warning("A %s refinement candidate failed validation.", decision.model)
+            continue
+        if text:
+            candidates.append(text)
+    if all(isinstance(r, BaseException) for r in responses):
+        raise responses[0]
+    return candidates
+
+async def run_refiner(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Refines an existing prompt based on user feedback, with robust error handling.
+    Returns only the state update; the graph merges it and appends `prompt_history`.
     """
     logger.info("---AGENT: REFINER---")
 
@@ -22,8 +56,10 @@ def run_refiner(state: Dict[str, Any]) -> Dict[str, Any]:
     
     if not feedback or not active_prompt_type:
         logger.warning("Refiner called without feedback or active prompt type. Skipping.")
-        return state
+        return {}
 
+    # CRITICAL: Always clear feedback to prevent an infinite loop.
+    update: Dict[str, Any] = {"user_feedback": None}
     try:
         prompt_to_refine = ""
         # Safely get the prompt body, whether it's from a Pydantic model or a dict
@@ -35,39 +71,63 @@ def run_refiner(state: Dict[str, Any]) -> Dict[str, Any]:
 
         if not prompt_to_refine:
             logger.error(f"Could not find prompt to refine for type: {active_prompt_type}")
-            state['user_feedback'] = None # Clear feedback to prevent loop
-            return state
+            return update
 
-        # Initialize model and template
-        model = ChatOpenAI(model="gpt-4o", temperature=0.5)
-        template = Template(PROMPT_REFINER_TEMPLATE)
+        deterministic = bool(state.get("refine_deterministic"))
+        count = 1 if deterministic else min(state.get("refine_num_candidates") or 1, settings.REFINE_MAX_CANDIDATES)
+        update.update(refine_deterministic=None, refine_num_candidates=None, refinement_candidates=None)
 
-        refiner_prompt_str = template.render(
+        refiner_prompt_str = get_template("prompt_refiner").render(
             original_prompt=prompt_to_refine,
             user_feedback=feedback
         )
-        
-        logger.info("Refining prompt...")
-        response = model.invoke(refiner_prompt_str)
-        refined_prompt_body = response.content.strip()
+        messages = prompt_messages("prompt_refiner", refiner_prompt_str)
+        decision = choose_tier("refiner", sum(len(message.content) for message in messages), feedback)
+        temperature = 0.0 if deterministic else REFINER_TEMPERATURE
+
+        cache = get_refine_cache() if deterministic else None
+
+        async def refine_with(routed: RoutingDecision) -> List[str]:
+            # Cached under the model that wrote the candidates, so an escalated
+            # strong-tier answer is never served as the fast model's.
+            cache_key = refine_cache_key(prompt_to_refine, feedback, active_prompt_type, routed.model)
+            cached = cache.get(cache_key) if cache is not None else None
+            if cached is not None:
+                metrics.inc("genprompt_refine_cache_total", result="hit")
+                logger.info("Refinement served from cache.")
+                return cached
+            if cache is not None:
+                metrics.inc("genprompt_refine_cache_total", result="miss")
+            logger.info("Refining prompt with %s (%d candidate(s))...", routed.model, count)
+            refined = await _refine_candidates(routed, temperature, messages, count, prompt_to_refine)
+            if refined and cache is not None:
+                cache.set(cache_key, refined)
+            return refined
+
+        candidates = await refine_with(decision)
+        stronger = escalate(decision) if not candidates else None
+        if stronger is not None:
+            candidates = await refine_with(stronger)
+        if not candidates:
+            raise ValueError("The model returned no usable refinement.")
+
+        refined_prompt_body = candidates[0]
+        if len(candidates) > 1:
+            update['refinement_candidates'] = candidates
 
         # Update the state correctly
         if active_prompt_type == "image":
             # Reconstruct the ImagePrompt object to maintain schema consistency
-            state['image_prompt'] = ImagePrompt(prompt_body=refined_prompt_body)
+            update['image_prompt'] = ImagePrompt(prompt_body=refined_prompt_body)
             logger.info("Successfully refined image prompt.")
         else:
-            state['video_prompt'] = refined_prompt_body
+            update['video_prompt'] = refined_prompt_body
             logger.info("Successfully refined video prompt.")
-        
-        # Ensure prompt_history list exists before appending
-        if 'prompt_history' not in state:
-            state['prompt_history'] = []
-        state['prompt_history'].append(refined_prompt_body)
+        update['prompt_history'] = [refined_prompt_body]
 
+    except UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error("An error occurred in the Refiner agent: %s", e, exc_info=True)
 
-    # CRITICAL: Always clear feedback to prevent an infinite loop.
-    state['user_feedback'] = None
-    return state
\ No newline at end of file
+    return update
\ No newline at end of file
@@ -1,60 +1,70 @@
 # File: src/agents/video_director.py
 # FINAL, CORRECTED VERSION with the NameError fixed.
 
-import base64
 import logging
-from jinja2 import Template
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
 from typing import Dict, Any, List
 
-from ..core.prompts import VIDEO_DIRECTOR_TEMPLATE
 from ..core.schemas import VideoCreativeBrief
+from ..core.llm import UNAVAILABLE_ERRORS, ainvoke_model
+from ..core.clients import get_chat_model
+from ..core.templates import get_template, prompt_messages
+from ..core.blobstore import get_blob_store
+from ..core.imaging import image_message_part, prepare_image
 
 logger = logging.getLogger(__name__)
 
-def run_video_director(state: Dict[str, Any]) -> Dict[str, Any]:
-    """Invokes the VideoDirectorAgent, using a user's creative brief if available."""
+async def run_video_director(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Invokes the VideoDirectorAgent, using a user's creative brief if available.
+
+    With an image to animate the model sees the image itself. Without one (the
+    single-pass pipeline, or a session that was already analysed) it works from
+    the structured `visual_analysis`, which avoids a second vision call.
+    Returns only the state update; the graph merges it and appends `prompt_history`.
+    """
     logger.info("---AGENT: VIDEO DIRECTOR---")
-    
+
+    # The brief and any feedback are consumed by this run, whatever happens.
+    update: Dict[str, Any] = {"video_creative_brief": None, "user_feedback": None}
     try:
-        # --- THIS IS THE FIX ---
-        # The ChatOpenAI instance must be assigned to the 'model' variable.
-        model = ChatOpenAI(model="gpt-4o", temperature=0.8)
-        template = Template(VIDEO_DIRECTOR_TEMPLATE)
-        
-        image_to_animate = state.get("generated_image_bytes")
-        if not image_to_animate:
-            logger.error("Video director called without an image to animate.")
-            return state
+        model = get_chat_model("gpt-4o", temperature=0.8)
+        template = get_template("video_director")
+
+        image_to_animate = state.get("generated_image")
+        visual_analysis = state.get("visual_analysis")
+        if not image_to_animate and not visual_analysis:
+            logger.error("Video director called without an image or visual analysis to animate.")
+            return update
 
         creative_brief = None
         if state.get("video_creative_brief"):
             creative_brief = VideoCreativeBrief.model_validate(state["video_creative_brief"])
 
-        prompt_str = template.render(creative_brief=creative_brief)
-        message_content: List[Dict[str, Any]] = [{"type": "text", "text": prompt_str}]
-        
-        encoded_image = base64.b64encode(image_to_animate).decode('utf-8')
-        message_content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}})
+        image_bytes_sent = image_tokens = 0
+        if image_to_animate:
+            prompt_str = template.render(creative_brief=creative_brief)
+            message_content: List[Dict[str, Any]] = [{"type": "text", "text": prompt_str}]
+            prepared_image = await prepare_image(get_blob_store().get(image_to_animate), node="video_director")
+            message_content.append(image_message_part(prepared_image))
+            image_bytes_sent, image_tokens = len(prepared_image.data), prepared_image.estimated_tokens or 0
+        else:
+            prompt_str = template.render(creative_brief=creative_brief, analysis=visual_analysis)
+            message_content = [{"type": "text", "text": prompt_str}]
 
         logger.info("Generating video direction...")
-        message = HumanMessage(content=message_content)
-        
-        # This line will now work because the 'model' variable exists.
-        response = model.invoke([message])
+        # The fixed system prompt goes first so its prefix can be cached; the brief and image follow.
+        messages = prompt_messages("video_director", message_content)
+
+        response = await ainvoke_model(model, messages, image_bytes=image_bytes_sent, image_tokens=image_tokens)
         logger.info("Successfully generated video direction.")
-        
-        state['video_prompt'] = response.content.strip()
-        if 'prompt_history' not in state:
-            state['prompt_history'] = []
-        state['prompt_history'].append(response.content.strip())
-        
+
+        video_prompt = response.content.strip()
+        update["video_prompt"] = video_prompt
+        update["prompt_history"] = [video_prompt]
+
+    except UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error("An error occurred in Video Director agent: %s", e, exc_info=True)
-    
-    finally:
-        state['video_creative_brief'] = None
-        state['user_feedback'] = None
-    
-    return state
\ No newline at end of file
+
+    return update
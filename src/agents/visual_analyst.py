@@ -1,48 +1,38 @@
 # File: src/agents/visual_analyst.py
 
-import base64
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 from ..config import settings
 from ..core.schemas import VisualAnalysis
-from ..core.prompts import VISUAL_ANALYST_TEMPLATE
+from ..core.llm import UNAVAILABLE_ERRORS, ainvoke_model
+from ..core.analysis_cache import analysis_cache_key, get_analysis_cache
+from ..core.blobstore import get_blob_store
+from ..core.concurrency import run_blocking
+from ..core.metrics import metrics
+from ..core.phash import dhash, get_near_duplicate_index
+from ..core.imaging import PreparedImage, image_message_part, prepare_image
+from ..core.singleflight import SingleFlight
+from ..core.templates import prompt_messages
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+from ..core.clients import get_structured_model
 
 logger = logging.getLogger(__name__)
 
-def encode_image_to_base64(image_bytes: bytes) -> str:
-    """
-    Encodes raw image bytes into a base64 JPEG string for OpenAI Vision API.
-    """
-    try:
-        return base64.b64encode(image_bytes).decode("utf-8")
-    except Exception as e:
-        logger.error("[Encoding Error] Failed to encode image: %s", e)
-        raise
+# Concurrent requests for the same image share one vision call.
+_analysis_flight = SingleFlight("visual_analysis")
 
-def build_vision_message(encoded_image: str) -> HumanMessage:
+def build_vision_messages(image: PreparedImage) -> List[Any]:
     """
-    Constructs a multimodal prompt message combining instruction and image.
+    Constructs the analyst's fixed system prompt followed by a message holding the image.
     """
-    return HumanMessage(content=[
-        {"type": "text", "text": VISUAL_ANALYST_TEMPLATE},
-        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
-    ])
+    return prompt_messages("visual_analyst", [image_message_part(image)])
 
-def initialize_gpt4o_parser() -> ChatOpenAI:
+def initialize_gpt4o_parser():
     """
-    Initializes the GPT-4o model with structured output parsing.
+    Returns the shared GPT-4o model with structured output parsing.
     """
-    return ChatOpenAI(
-        model=settings.PARSER_LLM_ID,
-        api_key=settings.OPENAI_API_KEY,
-        temperature=0.1,
-        max_retries=2,
-        request_timeout=60
-    ).with_structured_output(VisualAnalysis)
+    return get_structured_model(settings.PARSER_LLM_ID, 0.1, VisualAnalysis)
 
 def fallback_analysis(error: Exception) -> VisualAnalysis:
     """
@@ -58,31 +48,90 @@ def fallback_analysis(error: Exception) -> VisualAnalysis:
         compositional_notes=f"Error during analysis: {error}"
     )
 
-def run_visual_analyst(state: Dict[str, Any]) -> Dict[str, Any]:
+async def run_visual_analyst(state: Dict[str, Any]) -> Dict[str, Any]:
     """
-    LangGraph node function to analyze an image using GPT-4o Vision
-    and inject structured visual metadata into the graph state.
+    LangGraph node function to analyze an image using GPT-4o Vision.
+    Returns the state update carrying the structured visual metadata.
     """
     logger.info("[Node] 🎬 Running GPT-4o Visual Analyst...")
 
-    image_bytes = state.get("original_image_bytes")
-    if not isinstance(image_bytes, bytes):
-        logger.error("[Error] `original_image_bytes` is missing or invalid in the state.")
-        raise ValueError("Missing or invalid `original_image_bytes` in state.")
+    blob_id = state.get("original_image")
+    if not blob_id:
+        logger.error("[Error] `original_image` is missing in the state.")
+        raise ValueError("Missing `original_image` in state.")
+    blob = get_blob_store().get(blob_id)
 
-    try:
-        encoded_image = encode_image_to_base64(image_bytes)
-        message = build_vision_message(encoded_image)
+    # Identical uploads skip the vision call entirely.
+    cache = get_analysis_cache()
+    digest = await run_blocking(lambda: blob.digest)
+    cache_key = analysis_cache_key(digest, settings.PARSER_LLM_ID)
+    if cache is not None:
+        cached_analysis = await cache.get(cache_key)
+        if cached_analysis is not None:
+            logger.info("[Node] ♻️ Visual analysis served from cache.")
+            metrics.inc("genprompt_visual_analysis_total", source="cache")
+            return {"visual_analysis": cached_analysis, "visual_analysis_source": "cache"}
+
+    # So do re-saved, resized or re-compressed copies of an analysed image.
+    index = get_near_duplicate_index() if cache is not None else None
+    perceptual_hash = None
+    if index is not None:
+        perceptual_hash = blob.perceptual_hash
+        if perceptual_hash is None:
+            perceptual_hash = blob.perceptual_hash = await run_blocking(dhash, blob)
+        match = None
+        if perceptual_hash is not None:
+            # A large index takes milliseconds to search; keep that off the event loop.
+            match = await run_blocking(index.nearest, perceptual_hash, settings.NEAR_DUPLICATE_MAX_DISTANCE)
+        if match is not None:
+            distance, original_digest = match
+            near_analysis = await cache.get(analysis_cache_key(original_digest, settings.PARSER_LLM_ID))
+            if near_analysis is not None:
+                logger.info("[Node] ♻️ Visual analysis reused from a near-duplicate image (distance %d).", distance)
+                metrics.inc("genprompt_visual_analysis_total", source="near_duplicate")
+                await cache.set(cache_key, near_analysis)
+                return {
+                    "visual_analysis": near_analysis,
+                    "visual_analysis_source": "near_duplicate",
+                    "near_duplicate_distance": distance,
+                }
+
+    async def analyze() -> VisualAnalysis:
+        # A coalesced leader may have just filled the cache.
+        if cache is not None:
+            cached = await cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        prepared_image = await prepare_image(blob, node="visual_analyst")
+        messages = build_vision_messages(prepared_image)
         model = initialize_gpt4o_parser()
-        
+
         # Perform analysis
-        structured_analysis = model.invoke([message])
+        analysis = await ainvoke_model(
+            model, messages, model_id=settings.PARSER_LLM_ID,
+            image_bytes=len(prepared_image.data), image_tokens=prepared_image.estimated_tokens or 0,
+        )
+
+        # Only genuine model output is cached, never `fallback_analysis`.
+        if cache is not None:
+            await cache.set(cache_key, analysis)
+            if index is not None and perceptual_hash is not None:
+                index.add(perceptual_hash, digest)
+        return analysis
+
+    try:
+        structured_analysis = await _analysis_flight.do(cache_key, analyze)
         logger.info("[Node] ✅ Visual analysis successful.")
+        source = "model"
 
+    except UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error("[Fatal Error] GPT-4o visual analysis failed: %s", e, exc_info=True)
         structured_analysis = fallback_analysis(e)
+        source = "fallback"
 
-    # Update state and return
-    state["visual_analysis"] = structured_analysis
-    return state
+    metrics.inc("genprompt_visual_analysis_total", source=source)
+    # Return the state update
+    return {"visual_analysis": structured_analysis, "visual_analysis_source": source}
@@ -0,0 +1,228 @@
+# File: src/api/middleware.py
+# ASGI middleware that traces every /api request, bounds how long it may run and
+# turns away oversized uploads before or while their body is read.
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+from ..config import settings
+from ..core.deadline import set_deadline
+from ..core.metrics import metrics
+from ..core.tracing import log_request, request_trace
+
+logger = logging.getLogger(__name__)
+
+# Non-standard, but widely used for "client closed the request".
+CLIENT_CLOSED_REQUEST = 499
+DISCONNECTED_SCOPE_KEY = "genprompt.client_disconnected"
+MiB = 1024 * 1024
+# Room for the multipart framing and the non-file form fields of an upload
+# request; internal, so the client is only ever told the per-image limit.
+FORM_OVERHEAD_BYTES = MiB
+
+class RequestBodyTooLarge(HTTPException):
+    """Raised from `receive` once a streamed request body passes its limit; answered with a 413."""
+
+    def __init__(self, images: int):
+        allowance = f" for {images} images" if images > 1 else ""
+        super().__init__(
+            status_code=413,
+            detail=f"The upload is larger than the {settings.UPLOAD_MAX_BYTES // MiB} MiB per-image limit allows{allowance}.",
+            headers={"Connection": "close"},
+        )
+
+class TracingMiddleware:
+    """
+    Opens a `RequestTrace` for each request under `path_prefix`, adds a
+    `Server-Timing` header (per-node and LLM time, plus the total) and logs one
+    structured record once the response body is complete. Streaming responses
+    send their headers before the graph runs, so their header only carries the
+    time to first byte; the log record always covers the whole request.
+    """
+
+    def __init__(self, app: Callable, path_prefix: str = "/api"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        with request_trace(scope["method"], scope["path"]) as trace:
+            status_code = 500
+
+            async def send_traced(message: Dict[str, Any]) -> None:
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    headers.append((b"x-request-id", trace.request_id.encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_traced)
+            finally:
+                if scope.get(DISCONNECTED_SCOPE_KEY) and status_code == 500:
+                    status_code = CLIENT_CLOSED_REQUEST
+                # Label by route template (e.g. `/api/jobs/{job_id}`) to keep metric cardinality bounded.
+                route = scope.get("route")
+                if route is not None:
+                    trace.path = getattr(route, "path_format", trace.path)
+                log_request(trace, status_code)
+
+class DeadlineMiddleware:
+    """
+    Gives each request under `path_prefix` a deadline, from the client's
+    `X-Request-Timeout: <seconds>` header (capped at
+    GENPROMPT_REQUEST_MAX_DEADLINE_SECONDS) or GENPROMPT_REQUEST_DEADLINE_SECONDS.
+    LLM calls and queued graph runs observe it through `core.deadline`.
+
+    Once the request body has been read, it also watches for the client
+    disconnecting and cancels the handler, so an abandoned request stops
+    spending LLM calls instead of running to completion.
+    """
+
+    def __init__(self, app: Callable, path_prefix: str = "/api"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    @staticmethod
+    def _timeout(scope: Dict[str, Any]) -> Optional[float]:
+        default = settings.REQUEST_DEADLINE_SECONDS or None
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                try:
+                    requested = float(value.decode("latin-1"))
+                except ValueError:
+                    return default
+                if requested > 0:
+                    return min(requested, settings.REQUEST_MAX_DEADLINE_SECONDS)
+        return default
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        set_deadline(self._timeout(scope))
+        body_read = asyncio.Event()
+        disconnected = asyncio.Event()
+        response_done = False
+
+        async def receive_watched() -> Dict[str, Any]:
+            # After the body, the watcher owns `receive`; the app only learns of a disconnect.
+            if body_read.is_set():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                body_read.set()
+            elif message["type"] == "http.disconnect":
+                disconnected.set()
+            return message
+
+        async def send_watched(message: Dict[str, Any]) -> None:
+            nonlocal response_done
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_done = True
+            await send(message)
+
+        handler = asyncio.create_task(self.app(scope, receive_watched, send_watched))
+
+        async def watch() -> None:
+            await body_read.wait()
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+            if not response_done and not handler.done():
+                logger.info("Client disconnected from %s; cancelling the request.", scope["path"])
+                metrics.inc("genprompt_http_client_disconnects_total")
+                scope[DISCONNECTED_SCOPE_KEY] = True
+                handler.cancel()
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not scope.get(DISCONNECTED_SCOPE_KEY):
+                raise  # Cancelled from outside (e.g. shutdown), not by a disconnect.
+        finally:
+            watcher.cancel()
+            if not handler.done():
+                handler.cancel()
+
+class UploadLimitMiddleware:
+    """
+    Bounds multipart requests under `path_prefix` to what their images may add
+    up to (GENPROMPT_UPLOAD_MAX_BYTES each; GENPROMPT_BATCH_MAX_IMAGES of them
+    for a batch). A declared `Content-Length` over the limit gets its 413
+    without the body being read; otherwise the body is counted as it streams
+    in, and the request fails with 413 as soon as it passes the limit, before
+    the form parser has buffered the rest (chunked bodies included).
+    """
+
+    def __init__(self, app: Callable, path_prefix: str = "/api"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    @staticmethod
+    def _max_images(path: str) -> int:
+        return settings.BATCH_MAX_IMAGES if path.endswith("/batch") else 1
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", []))
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        images = self._max_images(scope["path"])
+        limit = settings.UPLOAD_MAX_BYTES * images + FORM_OVERHEAD_BYTES
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            await self._reject(RequestBodyTooLarge(images), scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def receive_counted() -> Dict[str, Any]:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the form parser: FastAPI answers it as an HTTPException.
+                    raise RequestBodyTooLarge(images)
+            return message
+
+        async def send_tracked(message: Dict[str, Any]) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_tracked)
+        except RequestBodyTooLarge as e:
+            if response_started:
+                raise
+            await self._reject(e, scope, receive, send)  # Escaped a handler that does not map HTTPExceptions.
+            return
+        if received > limit:
+            metrics.inc("genprompt_uploads_rejected_total", reason="too_large")
+
+    @staticmethod
+    async def _reject(error: RequestBodyTooLarge, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        metrics.inc("genprompt_uploads_rejected_total", reason="too_large")
+        response = JSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
+        await response(scope, receive, send)
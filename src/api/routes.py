@@ -1,107 +1,470 @@
 # File: src/api/routes.py
 # FINAL, SIMPLIFIED VERSION
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
 import json
 import logging # Use logging for errors
-from ..core.graph import build_genprompt_graph
-from ..core.schemas import AppState, RefineRequest, ImagePrompt
+from contextlib import contextmanager
+from typing import Iterator, List, Literal, Optional
+from pydantic import ValidationError
+from ..config import settings
+from ..core.circuit import CircuitOpen
+from ..core.blobstore import Blob, get_blob_store
+from ..core.concurrency import run_blocking
+from ..core.phash import dhash
+from ..core.deadline import DeadlineExceeded, deadline_scope
+from ..core.ingest import UploadRejected, ingest_stream
+from ..core.jobs import JobQueueFull, get_job_manager, job_input_hash
+from ..core.scheduler import Priority, SchedulerSaturated, get_scheduler, use_priority
+from ..core.pipeline import (
+    fan_out, full_state, open_session, refine_state, release_blobs, result_error,
+    run_graph, stage1_state, stage2_state, stream_graph_sse,
+)
+from ..core.schemas import AppState, BatchItemResult, BatchResponse, JobStatus, RefineRequest
+from ..core.schemas import SimilarPrompt, SimilarPromptsResponse
 from ..core.schemas import VideoCreativeBrief
+from ..core.sessions import SessionNotFoundError
 
 router = APIRouter()
-graph = build_genprompt_graph()
 logger = logging.getLogger(__name__)
 
-@router.post("/invoke-graph", response_model=AppState)
-async def invoke_graph_endpoint(image_bytes: UploadFile = File(...), prompt_history_json: str = Form("[]")):
-    # ... (no changes needed here)
+# Suggested client back-off when the job queue itself is full.
+JOB_QUEUE_RETRY_AFTER_SECONDS = 5
+
+def _saturated(e: Exception, retry_after: int) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(retry_after)})
+
+def _event_stream(initial_state, prompt_type: str, priority: Priority = Priority.STANDARD) -> StreamingResponse:
+    """
+    Streams graph progress and prompt tokens as Server-Sent Events. Admission
+    is checked first: once the stream has started, a 503 can no longer be sent.
+    """
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        try:
+            scheduler.admit(priority)
+        except SchedulerSaturated as e:
+            release_blobs(initial_state)  # The upload is already stored; no run will release it.
+            raise _saturated(e, e.retry_after)
+    # Imported here so importing the routes does not pull in LangGraph; the lifespan has compiled the graph.
+    from ..core.graph import get_compiled_graph
+
+    return StreamingResponse(
+        stream_graph_sse(get_compiled_graph(), initial_state, prompt_type, priority),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _execute(initial_state, prompt_type: str, priority: Priority = Priority.STANDARD):
+    """
+    Runs the graph inline in this request's task at `priority` (not through
+    the /jobs pool) and returns the saved, cleaned state. Saturation or an
+    open circuit becomes a 503 with a Retry-After header; a run still
+    unfinished at the request deadline is cancelled with a 504.
+    """
+    from ..core.graph import get_compiled_graph
+
+    try:
+        with use_priority(priority):
+            async with deadline_scope():
+                return await run_graph(get_compiled_graph(), initial_state, prompt_type)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except (SchedulerSaturated, CircuitOpen) as e:
+        raise _saturated(e, e.retry_after)
+
+async def _open_session(session_id: Optional[str]):
+    try:
+        return await open_session(session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+
+def _put_upload(upload: UploadFile) -> Blob:
+    # Sniffed, size-checked and hashed while it is read, off the event loop:
+    # the caches, job dedupe and near-duplicate index key on these hashes.
+    blob = ingest_stream(upload.file, upload.size)
+    if settings.NEAR_DUPLICATE_ENABLED:
+        blob.perceptual_hash = dhash(blob)
+    return blob
+
+async def _store_upload(upload: UploadFile) -> Blob:
+    """
+    Moves an upload into the blob store; graph state then carries only its id.
+    Oversized uploads fail with 413 and non-images with 415.
+    """
+    try:
+        return await run_blocking(_put_upload, upload)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@contextmanager
+def _release_on_error(image: Optional[Blob]) -> Iterator[None]:
+    """Releases a freshly stored upload when building the run's state fails, so it is not orphaned."""
+    try:
+        yield
+    except BaseException:
+        if image is not None:
+            get_blob_store().release(image.id)
+        raise
+
+def _parse_history(prompt_history_json: str) -> List[str]:
     try:
-        image_data = await image_bytes.read()
         prompt_history = json.loads(prompt_history_json)
-        initial_state = AppState(original_image_bytes=image_data, prompt_history=prompt_history)
-        result_state = graph.invoke(initial_state.model_dump(exclude_none=True))
-        if 'original_image_bytes' in result_state: del result_state['original_image_bytes']
-        return result_state
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON format for prompt_history.")
+    if not isinstance(prompt_history, list) or not all(isinstance(item, str) for item in prompt_history):
+        raise HTTPException(status_code=400, detail="prompt_history must be a JSON list of strings.")
+    return prompt_history
+
+async def _stage1_state(
+    image_bytes: UploadFile, prompt_history_json: str, session_id: Optional[str], prompt_mode: Optional[str] = None
+):
+    prompt_history = _parse_history(prompt_history_json)
+    session_id, session = await _open_session(session_id)
+    image = await _store_upload(image_bytes)
+    with _release_on_error(image):
+        return stage1_state(image, prompt_history, session_id, session, prompt_mode)
+
+def _parse_brief(creative_brief_json: Optional[str]) -> Optional[VideoCreativeBrief]:
+    if not creative_brief_json:
+        return None
+    try:
+        brief_data = json.loads(creative_brief_json)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON format for creative_brief.")
+    # Create a validated VideoCreativeBrief object
+    try:
+        return VideoCreativeBrief.model_validate(brief_data)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+async def _stage2_state(image_bytes: Optional[UploadFile], creative_brief_json: str, session_id: Optional[str]):
+    creative_brief = _parse_brief(creative_brief_json) or VideoCreativeBrief()
+    session_id, session = await _open_session(session_id)
+    image = await _store_upload(image_bytes) if image_bytes is not None else None
+    with _release_on_error(image):
+        try:
+            return stage2_state(image, creative_brief, session_id, session)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+async def _full_state(
+    image_bytes: UploadFile, creative_brief_json: Optional[str], session_id: Optional[str], prompt_mode: Optional[str] = None
+):
+    creative_brief = _parse_brief(creative_brief_json)
+    session_id, session = await _open_session(session_id)
+    image = await _store_upload(image_bytes)
+    with _release_on_error(image):
+        return full_state(image, creative_brief, session_id, session, prompt_mode)
+
+async def _refine_state(request: RefineRequest):
+    session_id, session = await _open_session(request.session_id)
+    try:
+        return refine_state(request, session_id, session)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/invoke-graph", response_model=AppState)
+async def invoke_graph_endpoint(
+    image_bytes: UploadFile = File(...),
+    prompt_history_json: str = Form("[]"),
+    session_id: Optional[str] = Form(None),
+    prompt_mode: Optional[Literal["llm", "composer"]] = Form(None),
+):
+    """
+    Handles the Stage 1 workflow. Without a `session_id` a new session is
+    started; its id is returned in the response for later refinement calls.
+    `prompt_mode=composer` writes Prompt A locally, without an LLM call;
+    `prompt_mode=llm` never does, even when the LLM is saturated.
+    """
+    initial_state = await _stage1_state(image_bytes, prompt_history_json, session_id, prompt_mode)
+    try:
+        return await _execute(initial_state, "image")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Error in /invoke-graph: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error.")
 
+@router.post("/invoke-graph/stream")
+async def invoke_graph_stream_endpoint(
+    image_bytes: UploadFile = File(...),
+    prompt_history_json: str = Form("[]"),
+    session_id: Optional[str] = Form(None),
+    prompt_mode: Optional[Literal["llm", "composer"]] = Form(None),
+):
+    """Streaming variant of /invoke-graph. The `final` event carries the AppState."""
+    initial_state = await _stage1_state(image_bytes, prompt_history_json, session_id, prompt_mode)
+    return _event_stream(initial_state, "image")
+
+@router.post("/invoke-graph/batch", response_model=BatchResponse)
+async def invoke_graph_batch_endpoint(
+    images: List[UploadFile] = File(...),
+    creative_brief_json: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    max_concurrency: Optional[int] = Form(None),
+    prompt_mode: Optional[Literal["llm", "composer"]] = Form(None),
+):
+    """
+    Runs the graph for many images in one request, up to `max_concurrency` at a
+    time (capped by GENPROMPT_BATCH_MAX_CONCURRENCY). Without a creative brief
+    every image goes through Stage 1; with one, the shared brief drives Stage 2.
+    A failing image is reported in its own item and never fails the batch.
+    With `stream=true` the items are sent as NDJSON in completion order.
+    """
+    if len(images) > settings.BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_IMAGES} images per batch.")
+    creative_brief = _parse_brief(creative_brief_json)
+    prompt_type = "video" if creative_brief is not None else "image"
+    concurrency = max(1, min(max_concurrency or settings.BATCH_MAX_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY))
+
+    # Store every upload now: the form's files are closed once this handler returns,
+    # before a streaming response body runs. A rejected upload fails only its own item.
+    uploads = []
+    for image in images:
+        try:
+            uploads.append((image.filename, await _store_upload(image)))
+        except HTTPException as e:
+            uploads.append((image.filename, e))
+
+    async def run_item(upload):
+        _, image = upload
+        if isinstance(image, HTTPException):
+            raise ValueError(image.detail)
+        if creative_brief is not None:
+            initial_state = stage2_state(image, creative_brief)
+        else:
+            initial_state = stage1_state(image, prompt_mode=prompt_mode)
+        result_state = await _execute(initial_state, prompt_type, Priority.BATCH)
+        error = result_error(result_state, prompt_type)
+        if error:
+            raise RuntimeError(error)
+        return result_state
+
+    def item_result(index: int, result_state, error) -> BatchItemResult:
+        filename = uploads[index][0]
+        if error is not None:
+            logger.warning("Batch item %d (%s) failed: %s", index, filename, error)
+            return BatchItemResult(index=index, filename=filename, status="error", error=str(error))
+        return BatchItemResult(index=index, filename=filename, status="ok", result=AppState.model_validate(result_state))
+
+    if stream:
+        async def ndjson_lines():
+            async for index, result_state, error in fan_out(uploads, run_item, concurrency):
+                yield item_result(index, result_state, error).model_dump_json() + "\n"
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    items = [item_result(*outcome) async for outcome in fan_out(uploads, run_item, concurrency)]
+    items.sort(key=lambda item: item.index)
+    succeeded = sum(item.status == "ok" for item in items)
+    return BatchResponse(items=items, succeeded=succeeded, failed=len(items) - succeeded)
+
 # --- Corrected Endpoint for Prompt Refinement ---
 @router.post("/refine-prompt", response_model=AppState)
 async def refine_prompt_endpoint(request: RefineRequest):
     """
     Builds a state containing user feedback and invokes the graph.
     The main graph router will correctly send it to the 'refiner' node.
+    With a `session_id`, only the feedback needs to be sent. `deterministic`
+    refinements are cached; `num_candidates` > 1 returns alternatives in
+    `refinement_candidates`.
     """
+    initial_state = await _refine_state(request)
     try:
-        # Construct the state object needed for the refiner agent
-        if request.active_prompt_type == "image":
-            image_prompt_obj = ImagePrompt(prompt_body=request.prompt_to_refine)
-            initial_state = AppState(
-                image_prompt=image_prompt_obj,
-                user_feedback=request.user_feedback,
-                active_prompt_for_refinement=request.active_prompt_type,
-                prompt_history=[] # Start with a fresh history for this run
-            )
-        # --- THIS IS THE FIX ---
-        elif request.active_prompt_type == "video":
-            initial_state = AppState(
-                video_prompt=request.prompt_to_refine,
-                user_feedback=request.user_feedback,
-                active_prompt_for_refinement=request.active_prompt_type,
-                prompt_history=[] # Start with a fresh history for this run
-            )
-        else:
-            # This case should not be reached due to Pydantic validation
-            raise HTTPException(status_code=400, detail="Invalid active_prompt_type.")
-
         # Invoke the graph normally. The new router will handle it.
-        result_state = graph.invoke(initial_state.model_dump(exclude_none=True))
-
-        # Clean and return the state
-        if 'original_image_bytes' in result_state: del result_state['original_image_bytes']
-        if 'generated_image_bytes' in result_state: del result_state['generated_image_bytes']
-            
-        return result_state
+        # The result is saved to the session and cleaned before it is returned.
+        return await _execute(initial_state, initial_state["active_prompt_for_refinement"], Priority.INTERACTIVE)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Error in /refine-prompt: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail="An internal server error during refinement.")
-    
+
+@router.post("/refine-prompt/stream")
+async def refine_prompt_stream_endpoint(request: RefineRequest):
+    """Streaming variant of /refine-prompt. The `final` event carries the AppState."""
+    initial_state = await _refine_state(request)
+    return _event_stream(initial_state, initial_state["active_prompt_for_refinement"], Priority.INTERACTIVE)
+
 @router.post("/generate-video-prompt", response_model=AppState)
 async def generate_video_prompt_endpoint(
-    image_bytes: UploadFile = File(...),
-    creative_brief_json: str = Form(...)
+    image_bytes: Optional[UploadFile] = File(None),
+    creative_brief_json: str = Form(...),
+    session_id: Optional[str] = Form(None),
 ):
     """
     Handles the Stage 2 workflow: generating a video prompt from an image
-    and a user's creative brief.
+    and a user's creative brief. The image may be omitted when the session
+    already holds a visual analysis, which then stands in for it.
     """
+    initial_state = await _stage2_state(image_bytes, creative_brief_json, session_id)
     try:
-        image_data = await image_bytes.read()
-        brief_data = json.loads(creative_brief_json)
-        
-        # Create a validated VideoCreativeBrief object
-        creative_brief = VideoCreativeBrief.model_validate(brief_data)
-
-        # Construct the initial state for the graph.
         # The entry router will see `video_creative_brief` and route correctly.
-        initial_state = AppState(
-            generated_image_bytes=image_data, # Use the correct key for Stage 2
-            video_creative_brief=creative_brief,
-            prompt_history=[] # Start with a fresh history
-        )
-
-        result_state = graph.invoke(initial_state.model_dump(exclude_none=True))
+        # The session is saved and image blob ids are cleaned from the response.
+        return await _execute(initial_state, "video")
 
-        # Clean bytes from response
-        if 'original_image_bytes' in result_state: del result_state['original_image_bytes']
-        if 'generated_image_bytes' in result_state: del result_state['generated_image_bytes']
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error in /generate-video-prompt: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal server error occurred.")
 
-        return result_state
+@router.post("/generate-video-prompt/stream")
+async def generate_video_prompt_stream_endpoint(
+    image_bytes: Optional[UploadFile] = File(None),
+    creative_brief_json: str = Form(...),
+    session_id: Optional[str] = Form(None),
+):
+    """Streaming variant of /generate-video-prompt. The `final` event carries the AppState."""
+    initial_state = await _stage2_state(image_bytes, creative_brief_json, session_id)
+    return _event_stream(initial_state, "video")
 
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON format for creative_brief.")
+@router.post("/generate-prompts", response_model=AppState)
+async def generate_prompts_endpoint(
+    image_bytes: UploadFile = File(...),
+    creative_brief_json: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    prompt_mode: Optional[Literal["llm", "composer"]] = Form(None),
+):
+    """
+    Single-pass Stage 1 + Stage 2: the image is uploaded and analysed once, then
+    Prompt A and Prompt B are written in parallel, so latency is roughly the
+    slower of the two rather than their sum. `prompt_mode` is as for /invoke-graph.
+    """
+    initial_state = await _full_state(image_bytes, creative_brief_json, session_id, prompt_mode)
+    try:
+        return await _execute(initial_state, "image")
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error("Error in /generate-video-prompt: %s", e, exc_info=True)
-        raise HTTPException(status_code=500, detail="An internal server error occurred.")
\ No newline at end of file
+        logger.error("Error in /generate-prompts: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail="An internal server error occurred.")
+
+@router.post("/generate-prompts/stream")
+async def generate_prompts_stream_endpoint(
+    image_bytes: UploadFile = File(...),
+    creative_brief_json: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    prompt_mode: Optional[Literal["llm", "composer"]] = Form(None),
+):
+    """Streaming variant of /generate-prompts. Token events name the node that produced them."""
+    initial_state = await _full_state(image_bytes, creative_brief_json, session_id, prompt_mode)
+    return _event_stream(initial_state, "image")
+
+# --- Background jobs: queue a run, then poll for its result ---
+@router.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job_endpoint(
+    kind: Literal["stage1", "stage2", "refine", "full"] = Form(...),
+    image_bytes: Optional[UploadFile] = File(None),
+    prompt_history_json: str = Form("[]"),
+    creative_brief_json: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    active_prompt_type: Optional[Literal["image", "video"]] = Form(None),
+    prompt_to_refine: Optional[str] = Form(None),
+    user_feedback: Optional[str] = Form(None),
+    deterministic: bool = Form(False),
+    num_candidates: int = Form(1),
+    dedupe: bool = Form(True),
+    prompt_mode: Optional[Literal["llm", "composer"]] = Form(None),
+):
+    """
+    Queues a Stage 1, Stage 2, refinement or full-pipeline run and returns its
+    job id immediately; poll GET /jobs/{job_id} for the result. With `dedupe`,
+    identical inputs return the job that is already queued, running or done.
+    """
+    if kind in ("stage1", "full") and image_bytes is None:
+        raise HTTPException(status_code=400, detail=f"A '{kind}' job needs an image.")
+    # Everything that can reject the request without the image is checked before
+    # it is stored, so a 4xx never leaves an orphaned blob behind.
+    if kind == "stage1":
+        prompt_history = _parse_history(prompt_history_json)
+    elif kind in ("stage2", "full"):
+        creative_brief = _parse_brief(creative_brief_json)
+    else:
+        try:
+            request = RefineRequest(
+                active_prompt_type=active_prompt_type,
+                prompt_to_refine=prompt_to_refine,
+                user_feedback=user_feedback,
+                session_id=session_id,
+                deterministic=deterministic,
+                num_candidates=num_candidates,
+            )
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+        initial_state = await _refine_state(request)
+        prompt_type = initial_state["active_prompt_for_refinement"]
+    if kind != "refine":
+        opened_session_id, session = await _open_session(session_id)
+
+    # A refinement works on text only; an uploaded image is not stored.
+    image = await _store_upload(image_bytes) if image_bytes is not None and kind != "refine" else None
+    with _release_on_error(image):
+        # Hash what the client sent, before a new session id is assigned.
+        input_hash = job_input_hash(
+            kind, image,
+            session_id=session_id, prompt_history=prompt_history_json, creative_brief=creative_brief_json,
+            active_prompt_type=active_prompt_type, prompt_to_refine=prompt_to_refine, user_feedback=user_feedback,
+            deterministic=deterministic, num_candidates=num_candidates, prompt_mode=prompt_mode,
+        ) if dedupe else None
+
+        if kind == "stage1":
+            initial_state, prompt_type = stage1_state(image, prompt_history, opened_session_id, session, prompt_mode), "image"
+        elif kind == "stage2":
+            try:
+                initial_state = stage2_state(image, creative_brief or VideoCreativeBrief(), opened_session_id, session)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            prompt_type = "video"
+        elif kind == "full":
+            initial_state, prompt_type = full_state(image, creative_brief, opened_session_id, session, prompt_mode), "image"
+
+    try:
+        job = get_job_manager().submit(kind, initial_state, prompt_type, input_hash)
+    except JobQueueFull as e:
+        release_blobs(initial_state)
+        raise _saturated(e, JOB_QUEUE_RETRY_AFTER_SECONDS)
+    if job.initial_state is not initial_state:
+        release_blobs(initial_state)  # Deduplicated: the existing job has its own copy.
+    return job.to_status()
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_endpoint(job_id: str):
+    """Returns a job's status, and its result once it has finished."""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job.to_status()
+
+@router.get("/prompts/similar", response_model=SimilarPromptsResponse)
+async def similar_prompts_endpoint(
+    q: Optional[str] = Query(None, description="Text to match, e.g. a subject, style or draft prompt."),
+    session_id: Optional[str] = Query(None, description="Match the visual analysis of this session instead of `q`."),
+    kind: Optional[Literal["image", "video"]] = Query(None, description="Only Prompt A ('image') or Prompt B ('video') results."),
+    k: int = Query(5, ge=1, description="How many results to return (capped by the server)."),
+    min_score: float = Query(0.0, ge=-1.0, le=1.0, description="Drop results less similar than this."),
+):
+    """
+    Returns earlier prompts similar to `q`, or to a session's visual analysis,
+    from the local prompt index; no LLM call is made. Clients can offer these
+    next to, or instead of, a new generation.
+    """
+    # Imported here so importing the routes does not pull in NumPy; the lifespan has loaded the index.
+    from ..core.prompt_index import analysis_text, get_prompt_index
+
+    index = get_prompt_index()
+    if index is None:
+        raise HTTPException(status_code=404, detail="The prompt index is disabled.")
+    query = (q or "").strip()
+    if not query and session_id:
+        _, session = await _open_session(session_id)
+        query = analysis_text(session.get("visual_analysis"))
+        if not query:
+            raise HTTPException(status_code=400, detail="The session has no visual analysis yet.")
+    if not query:
+        raise HTTPException(status_code=400, detail="Pass a query `q` or a `session_id`.")
+
+    results = await run_blocking(index.search, query, min(k, settings.PROMPT_INDEX_MAX_RESULTS), kind, min_score)
+    return SimilarPromptsResponse(query=query, results=[SimilarPrompt(**result) for result in results], indexed=len(index))
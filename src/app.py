@@ -4,41 +4,86 @@
 import streamlit as st
 from dotenv import load_dotenv
 import requests
-import json
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
 
+from .client import BACKEND_URL, BackendCall, Upload, make_session, start_call, thumbnail
 from .core.schemas import AppState, ImagePrompt
 
+# How often a running backend call's progress is redrawn.
+POLL_INTERVAL_SECONDS = 0.5
+
+@st.cache_resource
+def get_http_session():
+    """One keep-alive HTTP session for every browser session of this Streamlit server."""
+    return make_session()
+
+@st.cache_resource
+def get_call_executor() -> ThreadPoolExecutor:
+    """Worker threads for backend calls, so a script run never waits on the agents."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="genprompt-ui")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_thumbnail(file_id: str, _data: bytes) -> bytes:
+    """Preview image for an upload, built once per file rather than on every rerun."""
+    return thumbnail(_data)
+
+def upload_of(uploaded_file) -> Upload:
+    return (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)
+
+def submit_call(url: str, label: str, slot: str, **request_kwargs) -> None:
+    """Starts a backend call in the background; `show_pending_call` renders its progress."""
+    st.session_state.pending_call = start_call(
+        get_call_executor(), get_http_session(), url, label, slot, **request_kwargs
+    )
+
+@st.fragment(run_every=POLL_INTERVAL_SECONDS)
+def show_pending_call(call: BackendCall) -> None:
+    """
+    Redraws a running call's progress on its own, without rerunning the page;
+    once the call is done, stores its result and reruns the whole app.
+    """
+    if not call.done():
+        st.caption(f"⚙️ {call.status}")
+        if call.text:
+            st.markdown(call.text)
+        return
+    st.session_state.pending_call = None
+    try:
+        st.session_state.session_state_dict = call.result()
+    except requests.exceptions.RequestException as e:
+        st.session_state.call_error = f"API Error: {e}"
+    st.rerun()
+
 def main():
     """The main function that runs the Streamlit UI."""
     st.set_page_config(page_title="GenPrompt", layout="wide", page_icon="📡")
     load_dotenv()
 
-    BACKEND_URL = "http://127.0.0.1:8000/api"
-
     if "session_state_dict" not in st.session_state:
         st.session_state.session_state_dict = AppState().model_dump()
 
-    # This function is correct. No changes needed.
+    def session_form_data() -> Dict[str, str]:
+        """Form fields that attach a request to the backend session, once one exists."""
+        session_id = st.session_state.session_state_dict.get("session_id")
+        return {'session_id': session_id} if session_id else {}
+
     def invoke_backend_graph(uploaded_file):
-        # ... (Your existing invoke_backend_graph function)
-        with st.spinner("🚀 GenPrompt agents are working on the backend..."):
-            try:
-                files = {'image_bytes': (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-                prompt_history = st.session_state.session_state_dict.get("prompt_history", [])
-                data = {'prompt_history_json': json.dumps(prompt_history)}
-
-                response = requests.post(f"{BACKEND_URL}/invoke-graph", files=files, data=data)
-                response.raise_for_status()
-                st.session_state.session_state_dict = response.json()
-                st.rerun()
-            except requests.exceptions.RequestException as e:
-                st.error(f"API Error: {e}")
+        # The upload is downscaled on the worker thread; the backend keeps the prompt history in its session store.
+        submit_call(
+            f"{BACKEND_URL}/invoke-graph/stream", "🚀 GenPrompt agents are working on the backend...", "A",
+            upload=upload_of(uploaded_file), data=session_form_data(),
+        )
 
     # --- UI Rendering ---
     st.title("📡GenPrompt")
     st.markdown("Your AI Creative Partner for Image and Video Prompts.")
 
+    if st.session_state.get("call_error"):
+        st.error(st.session_state.pop("call_error"))
+    pending_call: Optional[BackendCall] = st.session_state.get("pending_call")
+    busy = pending_call is not None
+
     tab1, tab2 = st.tabs(["**Stage 1: Generate Prompt A**", "**Stage 2: Generate Prompt B**"])
     current_state_dict = st.session_state.session_state_dict
 
@@ -47,19 +92,24 @@ def main():
         col1, col2 = st.columns(2, gap="large")
 
         with col1:
-            # This part is correct. No changes needed.
             uploaded_file_A = st.file_uploader("Upload your creative starting point...", type=["jpg", "png", "jpeg"], key="uploader_A")
             if uploaded_file_A:
-                st.image(uploaded_file_A, caption="Source Image Preview", use_container_width=True)
-            if st.button("Generate Image Prompt", use_container_width=True, type="primary", key="button_A"):
+                st.image(
+                    cached_thumbnail(uploaded_file_A.file_id, uploaded_file_A.getvalue()),
+                    caption="Source Image Preview", use_container_width=True,
+                )
+            if st.button("Generate Image Prompt", use_container_width=True, type="primary", key="button_A", disabled=busy):
                 if uploaded_file_A:
                     invoke_backend_graph(uploaded_file_A)
+                    st.rerun()
                 else:
                     st.warning("Please upload a file first.")
                     
         with col2:
             st.subheader("🕹️ Prompt A: For Image")
-            if current_state_dict.get("image_prompt"):
+            if busy and pending_call.slot == "A":
+                show_pending_call(pending_call)
+            elif current_state_dict.get("image_prompt"):
                 prompt_obj = ImagePrompt.model_validate(current_state_dict["image_prompt"])
                 st.write("**Prompt Preview:**")
                 with st.container(border=True):
@@ -77,22 +127,16 @@ def main():
                         label_visibility="collapsed", 
                         key="refine_A_input"
                     )
-                    if st.form_submit_button("Refine", use_container_width=True):
+                    if st.form_submit_button("Refine", use_container_width=True, disabled=busy):
                         if refinement_query_A:
-                            with st.spinner("🧠 Refining prompt..."):
-                                payload = {
-                                    "active_prompt_type": "image",
-                                    "prompt_to_refine": prompt_obj.prompt_body,
-                                    "user_feedback": refinement_query_A
-                                }
-                                try:
-                                    response = requests.post(f"{BACKEND_URL}/refine-prompt", json=payload)
-                                    response.raise_for_status()
-                                    # Update state and rerun to display the new prompt
-                                    st.session_state.session_state_dict = response.json()
-                                    st.rerun()
-                                except requests.exceptions.RequestException as e:
-                                    st.error(f"API Error during refinement: {e}")
+                            # The backend session already holds the prompt and its history.
+                            payload = {
+                                "session_id": current_state_dict.get("session_id"),
+                                "active_prompt_type": "image",
+                                "user_feedback": refinement_query_A
+                            }
+                            submit_call(f"{BACKEND_URL}/refine-prompt/stream", "🧠 Refining prompt...", "A", json=payload)
+                            st.rerun()
             else:
                 st.info("Your generated image prompt will appear here.")
     
@@ -109,7 +153,10 @@ def main():
 
             # Step 2: If a file is uploaded, show its preview immediately
             if uploaded_file_B:
-                st.image(uploaded_file_B, caption="Image to Animate Preview", use_container_width=True)
+                st.image(
+                    cached_thumbnail(uploaded_file_B.file_id, uploaded_file_B.getvalue()),
+                    caption="Image to Animate Preview", use_container_width=True,
+                )
 
             # Step 3: The form for the creative brief
             with st.form("creative_brief_form"):
@@ -126,39 +173,36 @@ def main():
                 notes = st.text_area("4. Additional Notes (Optional)")
                 
                 # --- THIS IS THE CORRECTED LOGIC ---
-                submitted = st.form_submit_button("Generate Video Prompt", use_container_width=True, type="primary")
+                submitted = st.form_submit_button("Generate Video Prompt", use_container_width=True, type="primary", disabled=busy)
                 if submitted:
                     # We check for the uploaded file *inside* the form submission logic
                     if uploaded_file_B is None:
                         st.warning("Please upload an image to animate before generating.")
                     else:
                         # If we have a file, proceed with the API call
-                        with st.spinner("🎬 The Video Director is on set..."):
-                            from .core.schemas import VideoCreativeBrief
-                            
-                            brief = VideoCreativeBrief(
-                                moods=moods if moods else None,
-                                camera_movement=camera_move if camera_move != "(AI Decides)" else None,
-                                additional_notes=notes if notes else None,
-                            )
-                            
-                            files = {'image_bytes': (uploaded_file_B.name, uploaded_file_B.getvalue(), uploaded_file_B.type)}
-                            data = {'creative_brief_json': brief.model_dump_json()}
-                            
-                            try:
-                                response = requests.post(f"{BACKEND_URL}/generate-video-prompt", files=files, data=data)
-                                response.raise_for_status()
-                                # Update state and trigger the final rerun to display the output
-                                st.session_state.session_state_dict = response.json()
-                                st.rerun()
-                            except requests.exceptions.RequestException as e:
-                                st.error(f"API Error during video prompt generation: {e}")
+                        from .core.schemas import VideoCreativeBrief
+
+                        brief = VideoCreativeBrief(
+                            moods=moods if moods else None,
+                            camera_movement=camera_move if camera_move != "(AI Decides)" else None,
+                            additional_notes=notes if notes else None,
+                        )
+                        data = {'creative_brief_json': brief.model_dump_json(), **session_form_data()}
+
+                        # Start the call and rerun so Prompt B shows its progress
+                        submit_call(
+                            f"{BACKEND_URL}/generate-video-prompt/stream", "🎬 The Video Director is on set...", "B",
+                            upload=upload_of(uploaded_file_B), data=data,
+                        )
+                        st.rerun()
 
         # File: src/app.py (replace the "with col4:" block)
 
         with col4:
             st.subheader("🎬 Prompt B: For Video")
-            if current_state_dict.get("video_prompt"):
+            if busy and pending_call.slot == "B":
+                show_pending_call(pending_call)
+            elif current_state_dict.get("video_prompt"):
                 # The video_prompt is just a string, so we can use it directly
                 video_prompt = current_state_dict["video_prompt"]
                 
@@ -177,23 +221,16 @@ def main():
                         label_visibility="collapsed",
                         key="refine_B_input"
                     )
-                    if st.form_submit_button("Refine", use_container_width=True):
+                    if st.form_submit_button("Refine", use_container_width=True, disabled=busy):
                         if refinement_query_B:
-                            with st.spinner("🧠 Refining video direction..."):
-                                # This payload is almost identical to the Stage 1 version,
-                                # but with active_prompt_type set to "video".
-                                payload = {
-                                    "active_prompt_type": "video",
-                                    "prompt_to_refine": video_prompt,
-                                    "user_feedback": refinement_query_B
-                                }
-                                try:
-                                    response = requests.post(f"{BACKEND_URL}/refine-prompt", json=payload)
-                                    response.raise_for_status()
-                                    # Update state and rerun to display the new refined prompt
-                                    st.session_state.session_state_dict = response.json()
-                                    st.rerun()
-                                except requests.exceptions.RequestException as e:
-                                    st.error(f"API Error during refinement: {e}")
+                            # This payload is almost identical to the Stage 1 version,
+                            # but with active_prompt_type set to "video".
+                            payload = {
+                                "session_id": current_state_dict.get("session_id"),
+                                "active_prompt_type": "video",
+                                "user_feedback": refinement_query_B
+                            }
+                            submit_call(f"{BACKEND_URL}/refine-prompt/stream", "🧠 Refining video direction...", "B", json=payload)
+                            st.rerun()
             else:
                 st.info("Your generated video prompt will appear here.")
\ No newline at end of file
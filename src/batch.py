@@ -0,0 +1,173 @@
+# File: src/batch.py
+# Offline batch generation of Prompt A for a directory (or manifest) of images.
+#
+# Runs the compiled GenPrompt graph with bounded concurrency under a
+# requests/tokens-per-minute budget, appending one JSON line per image to the
+# output file. Re-running with the same output file resumes: images that
+# already have a successful result are skipped.
+#
+# Usage:
+#   python -m src.batch ./catalog --output prompts.jsonl --concurrency 8 --rpm 500 --tpm 300000
+#   python -m src.batch manifest.txt --output prompts.jsonl
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from .config import validate_settings
+from .core.blobstore import get_blob_store
+from .core.concurrency import run_blocking
+from .core.graph import get_compiled_graph
+from .core.imaging import estimate_image_tokens
+from .core.pipeline import clean_result, release_blobs, result_error, serialize_state, stage1_state
+from .core.ratelimit import AsyncRateLimiter
+from .core.scheduler import Priority, set_priority
+
+logger = logging.getLogger("genprompt.batch")
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+# Each Stage 1 run makes two LLM calls (visual analyst + prompt engineer).
+LLM_CALLS_PER_IMAGE = 2
+# Rough text tokens per image: both prompt templates plus their completions.
+TEXT_TOKENS_PER_IMAGE = 1500
+
+def discover_images(source: Path) -> List[Path]:
+    """
+    Lists the images to process. `source` is either a directory (searched
+    recursively) or a manifest: one path per line, or JSON lines with an
+    `image` key. Relative manifest paths are resolved against its directory.
+    """
+    if source.is_dir():
+        return sorted(p for p in source.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+
+    images = []
+    for line in source.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        entry = json.loads(line)["image"] if line.startswith("{") else line
+        path = Path(entry)
+        images.append(path if path.is_absolute() else source.parent / path)
+    return images
+
+def completed_images(output: Path) -> Set[str]:
+    """Returns the images that already have a successful result in `output`."""
+    done: Set[str] = set()
+    if not output.exists():
+        return done
+    with output.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A partially written last line from an interrupted run.
+            if record.get("status") == "ok":
+                done.add(record["image"])
+    return done
+
+class BatchRunner:
+    """Processes images concurrently and streams one result record per image."""
+
+    def __init__(self, graph: Any, output: Path, concurrency: int, limiter: AsyncRateLimiter):
+        self.graph = graph
+        self.output = output
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = limiter
+        self.succeeded = 0
+        self.failed: List[Dict[str, str]] = []
+        self.total = 0
+        self.started_at = 0.0
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        with self.output.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _report(self, image: str, status: str, elapsed: float) -> None:
+        done = self.succeeded + len(self.failed)
+        rate = done / max(time.perf_counter() - self.started_at, 1e-9)
+        logger.info("[%d/%d] %s %s (%.1fs) — %.2f images/s", done, self.total, status, image, elapsed, rate)
+
+    async def process(self, path: Path) -> None:
+        async with self.semaphore:
+            started = time.perf_counter()
+            record: Dict[str, Any] = {"image": str(path)}
+            try:
+                image = await run_blocking(get_blob_store().put_file, path)
+                tokens = TEXT_TOKENS_PER_IMAGE + await run_blocking(estimate_image_tokens, image)
+                await self.limiter.acquire(requests=LLM_CALLS_PER_IMAGE, tokens=tokens)
+
+                initial_state = stage1_state(image)
+                try:
+                    result_state = clean_result(await self.graph.ainvoke(initial_state))
+                finally:
+                    release_blobs(initial_state)
+                error = result_error(result_state, "image")
+                if error:
+                    raise RuntimeError(error)
+                payload = serialize_state(result_state)
+                record.update(status="ok", image_prompt=payload["image_prompt"], visual_analysis=payload["visual_analysis"])
+                self.succeeded += 1
+            except Exception as e:
+                record.update(status="error", error=str(e))
+                self.failed.append({"image": str(path), "error": str(e)})
+            elapsed = time.perf_counter() - started
+            record["elapsed_seconds"] = round(elapsed, 3)
+            self._write(record)
+            self._report(str(path), record["status"], elapsed)
+
+    async def run(self, images: List[Path]) -> None:
+        self.total = len(images)
+        self.started_at = time.perf_counter()
+        await asyncio.gather(*(self.process(path) for path in images))
+
+    def summary(self, skipped: int) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "processed": self.total,
+            "succeeded": self.succeeded,
+            "failed": len(self.failed),
+            "skipped_already_done": skipped,
+            "elapsed_seconds": round(elapsed, 2),
+            "images_per_second": round(self.total / elapsed, 3) if elapsed > 0 else 0.0,
+            "failures": self.failed[:20],
+        }
+
+async def run_batch(args: argparse.Namespace) -> Dict[str, Any]:
+    set_priority(Priority.BATCH)
+    images = discover_images(Path(args.source))
+    done = completed_images(Path(args.output))
+    pending = [p for p in images if str(p) not in done]
+    logger.info("Found %d images, %d already done, %d to process.", len(images), len(images) - len(pending), len(pending))
+
+    runner = BatchRunner(
+        graph=get_compiled_graph(),
+        output=Path(args.output),
+        concurrency=args.concurrency,
+        limiter=AsyncRateLimiter(args.rpm, args.tpm),
+    )
+    await runner.run(pending)
+    return runner.summary(skipped=len(images) - len(pending))
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate Prompt A for a directory or manifest of images.")
+    parser.add_argument("source", help="A directory of images, or a manifest file (paths or JSON lines with an 'image' key).")
+    parser.add_argument("--output", "-o", default="genprompt_results.jsonl", help="JSONL file to append results to (also used to resume).")
+    parser.add_argument("--concurrency", "-c", type=int, default=8, help="Maximum images processed at once.")
+    parser.add_argument("--rpm", type=float, default=0, help="LLM requests-per-minute budget (0 = unlimited).")
+    parser.add_argument("--tpm", type=float, default=0, help="LLM tokens-per-minute budget (0 = unlimited).")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - [%(name)s] - %(message)s")
+    validate_settings()
+    summary = asyncio.run(run_batch(args))
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# File: src/client.py
+# HTTP client for the Streamlit front end (`src/app.py`), kept free of Streamlit
+# so it can be benchmarked on its own.
+#
+# * One pooled, keep-alive `requests.Session` serves every call.
+# * Uploads are downscaled before they are sent, to the size the vision model
+#   downsamples them to anyway (fit into 2048px, short side 768px), so
+#   full-resolution photos no longer cost upload time and server-side decoding.
+# * Previews are small JPEG thumbnails instead of the original file.
+# * `start_call` runs a streaming backend call on a worker thread; the UI polls
+#   the returned `BackendCall` instead of blocking its script run.
+
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+BACKEND_URL = os.getenv("GENPROMPT_BACKEND_URL", "http://127.0.0.1:8000/api")
+UPLOAD_DOWNSCALE = os.getenv("GENPROMPT_UI_UPLOAD_DOWNSCALE", "true").strip().lower() in ("1", "true", "yes", "on")
+UPLOAD_JPEG_QUALITY = int(os.getenv("GENPROMPT_UI_UPLOAD_JPEG_QUALITY", "90"))
+THUMBNAIL_MAX_EDGE = int(os.getenv("GENPROMPT_UI_THUMBNAIL_MAX_EDGE", "640"))
+# (connect, read) seconds; the read timeout outlasts the backend's longest request deadline.
+REQUEST_TIMEOUT = (10.0, float(os.getenv("GENPROMPT_UI_READ_TIMEOUT_SECONDS", "310")))
+
+# OpenAI "high detail" vision input: fitted into a 2048px square, then the short side scaled to 768px.
+VISION_MAX_SQUARE = 2048
+VISION_SHORT_SIDE = 768
+
+# (filename, bytes, mime type), as accepted by `requests` for a multipart file.
+Upload = Tuple[str, bytes, str]
+
+def make_session(pool_size: int = 8) -> requests.Session:
+    """A keep-alive session whose connection pool is shared by all UI calls."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _encode(image: Image.Image, keep_alpha: bool, quality: int) -> Tuple[bytes, str]:
+    output = io.BytesIO()
+    if keep_alpha:
+        image.save(output, format="PNG")
+        return output.getvalue(), "image/png"
+    image.convert("RGB").save(output, format="JPEG", quality=quality)
+    return output.getvalue(), "image/jpeg"
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+def vision_size(width: int, height: int) -> Tuple[int, int]:
+    """The size the vision model downsamples a `width` x `height` image to."""
+    scale = min(1.0, VISION_MAX_SQUARE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, VISION_SHORT_SIDE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def downscale_upload(upload: Upload) -> Upload:
+    """
+    Shrinks an upload to its vision-model size (EXIF rotation applied). Images
+    already that small, and files Pillow cannot read, are returned unchanged
+    for the backend to judge.
+    """
+    name, data, mime_type = upload
+    if not UPLOAD_DOWNSCALE:
+        return upload
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            target = vision_size(*image.size)
+            if target == image.size:
+                return upload
+            image.draft("RGB", target)  # JPEG: decode at a reduced scale no smaller than the target
+            image = ImageOps.exif_transpose(image)
+            target = vision_size(*image.size)  # EXIF rotation may have swapped the edges
+            image = image.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            resized, mime_type = _encode(image, _has_alpha(image), UPLOAD_JPEG_QUALITY)
+    except Exception as e:
+        logger.warning("Could not downscale %s, uploading it unchanged: %s", name, e)
+        return upload
+    if len(resized) >= len(data):
+        return upload
+    stem = name.rsplit(".", 1)[0]
+    return f"{stem}.{'png' if mime_type == 'image/png' else 'jpg'}", resized, mime_type
+
+def thumbnail(data: bytes, max_edge: int = THUMBNAIL_MAX_EDGE) -> bytes:
+    """A small preview image: JPEG (PNG when transparent), at most `max_edge` pixels on its longest side."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.BILINEAR)
+        return _encode(image, _has_alpha(image), 80)[0]
+
+def stream_backend(
+    session: requests.Session,
+    url: str,
+    on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    **request_kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    POSTs to one of the backend's `/stream` endpoints and hands each `token`
+    and `node_start` event to `on_event`. Returns the AppState from the `final` event.
+    """
+    final_state = None
+    request_kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    with session.post(url, stream=True, **request_kwargs) as response:
+        response.raise_for_status()
+        event_name = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event_name = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                payload = json.loads(line[len("data:"):])
+                if event_name == "final":
+                    final_state = payload
+                elif event_name == "error":
+                    raise requests.exceptions.RequestException(payload["detail"])
+                elif on_event is not None:
+                    on_event(event_name, payload)
+    if final_state is None:
+        raise requests.exceptions.RequestException("The stream ended without a final result.")
+    return final_state
+
+class BackendCall:
+    """
+    A streaming backend call running on a worker thread. The worker appends
+    streamed prompt tokens and node progress; the UI reads `text` and `status`
+    on each poll and `result()` once `done()`.
+    """
+
+    def __init__(self, label: str, slot: str):
+        self.label = label
+        self.slot = slot  # Which part of the page shows this call's progress
+        self.future: Optional[Future] = None
+        self._lock = threading.Lock()
+        self._text = ""
+        self._status = label
+
+    def on_event(self, event_name: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            if event_name == "token":
+                self._text += payload["text"]
+            elif event_name == "node_start":
+                self._status = f"Running {payload['node'].replace('_', ' ')}..."
+
+    @property
+    def text(self) -> str:
+        with self._lock:
+            return self._text
+
+    @property
+    def status(self) -> str:
+        with self._lock:
+            return self._status
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def result(self) -> Dict[str, Any]:
+        """The final AppState; re-raises the call's `RequestException`."""
+        return self.future.result()
+
+def start_call(
+    executor: Executor,
+    session: requests.Session,
+    url: str,
+    label: str,
+    slot: str,
+    upload: Optional[Upload] = None,
+    **request_kwargs: Any,
+) -> BackendCall:
+    """
+    Starts a streaming call on `executor` and returns at once. `label` is the
+    status shown until the first node starts. An `upload` is downscaled on the
+    worker thread and sent as the `image_bytes` file field.
+    """
+    call = BackendCall(label, slot)
+
+    def run() -> Dict[str, Any]:
+        if upload is not None:
+            request_kwargs["files"] = {"image_bytes": downscale_upload(upload)}
+        return stream_backend(session, url, call.on_event, **request_kwargs)
+
+    call.future = executor.submit(run)
+    return call
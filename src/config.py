@@ -1,31 +1,215 @@
 # File: src/config.py
+# Settings are built on first use, not at import: importing this module reads
+# no files and never raises. `validate_settings` (run from the FastAPI lifespan)
+# reports missing secrets.
+
+import logging
 import os
+import threading
+from typing import Any, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
-# This line correctly finds the .env file in the project's ROOT directory
-# by going up two levels from src/config.py
+logger = logging.getLogger(__name__)
+
+# The .env file in the project's ROOT directory, two levels up from src/config.py
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-if not os.path.exists(dotenv_path):
-    print(f"[Warning] .env file not found at {dotenv_path}. Make sure it exists in the project root.")
-else:
-    load_dotenv(dotenv_path=dotenv_path)
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Reads a boolean flag such as `true`/`false` from the environment."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
 
 class Settings:
     """Manages application-wide configurations and API keys."""
-    # Secrets loaded from .env
-    OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
-    HUGGING_FACE_TOKEN: str = os.getenv("HUGGING_FACE_TOKEN")
-
-    # Public Configurations
-    VISION_MODEL_ID: str = "unum-cloud/smol-vlm"
-    PARSER_LLM_ID: str = "gpt-4o"
-    
-settings = Settings()
-
-# Validate that essential secrets are set
-if not settings.OPENAI_API_KEY:
-    raise ValueError("FATAL: OPENAI_API_KEY environment variable not set in .env file.")
-
-# The HF token is optional for public models but good practice to have.
-if not settings.HUGGING_FACE_TOKEN:
-    print("[Warning] HUGGING_FACE_TOKEN is not set in the .env file.")
\ No newline at end of file
+
+    def __init__(self):
+        # Secrets loaded from .env
+        self.OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+        self.HUGGING_FACE_TOKEN: str = os.getenv("HUGGING_FACE_TOKEN")
+
+        # Public Configurations
+        self.VISION_MODEL_ID: str = "unum-cloud/smol-vlm"
+        self.PARSER_LLM_ID: str = "gpt-4o"
+
+        # Model routing for text-only nodes: routine work goes to the fast tier, large
+        # inputs and multi-part feedback to the strong tier; fast-tier output that
+        # fails validation is retried on the strong tier.
+        self.ROUTING_ENABLED: bool = _env_bool("GENPROMPT_ROUTING", True)
+        self.ROUTING_NODES: Tuple[str, ...] = tuple(
+            node.strip() for node in os.getenv("GENPROMPT_ROUTING_NODES", "refiner,prompt_engineer").split(",") if node.strip()
+        )
+        self.ROUTING_FAST_LLM_ID: str = os.getenv("GENPROMPT_ROUTING_FAST_LLM_ID", "gpt-4o-mini")
+        self.ROUTING_STRONG_LLM_ID: str = os.getenv("GENPROMPT_ROUTING_STRONG_LLM_ID", "gpt-4o")
+        self.ROUTING_FAST_MAX_INPUT_CHARS: int = int(os.getenv("GENPROMPT_ROUTING_FAST_MAX_INPUT_CHARS", "6000"))
+        self.ROUTING_FAST_MAX_FEEDBACK_WORDS: int = int(os.getenv("GENPROMPT_ROUTING_FAST_MAX_FEEDBACK_WORDS", "12"))
+        self.ROUTING_FAST_MAX_INSTRUCTIONS: int = int(os.getenv("GENPROMPT_ROUTING_FAST_MAX_INSTRUCTIONS", "2"))
+        # Below this many seconds left on the request deadline, always take the (lower-latency) fast tier.
+        self.ROUTING_FAST_DEADLINE_SECONDS: float = float(os.getenv("GENPROMPT_ROUTING_FAST_DEADLINE_SECONDS", "10"))
+        self.ROUTING_MIN_OUTPUT_CHARS: int = int(os.getenv("GENPROMPT_ROUTING_MIN_OUTPUT_CHARS", "20"))
+
+        # Concurrency: LLM calls use `ainvoke` unless disabled, in which case the
+        # blocking `invoke` runs in a bounded thread pool instead.
+        self.LLM_ASYNC_ENABLED: bool = _env_bool("GENPROMPT_LLM_ASYNC", True)
+        self.BLOCKING_POOL_SIZE: int = int(os.getenv("GENPROMPT_BLOCKING_POOL_SIZE", "8"))
+
+        # Shared, keep-alive HTTP connection pool used by every chat model.
+        self.HTTP_MAX_CONNECTIONS: int = int(os.getenv("GENPROMPT_HTTP_MAX_CONNECTIONS", "100"))
+        self.HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("GENPROMPT_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.HTTP_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("GENPROMPT_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+        self.LLM_REQUEST_TIMEOUT_SECONDS: float = float(os.getenv("GENPROMPT_LLM_REQUEST_TIMEOUT_SECONDS", "60"))
+        self.LLM_MAX_RETRIES: int = int(os.getenv("GENPROMPT_LLM_MAX_RETRIES", "2"))
+
+        # OpenAI-compatible endpoint; empty means the public API (benchmarks point this at a local mock).
+        self.OPENAI_BASE_URL: str = os.getenv("GENPROMPT_OPENAI_BASE_URL", "")
+
+        # Scheduler in front of every LLM call: budgets (0 = unlimited), adaptive
+        # concurrency bounds, and how long a call may queue before a 503 is returned.
+        self.SCHEDULER_ENABLED: bool = _env_bool("GENPROMPT_SCHEDULER", True)
+        self.SCHEDULER_RPM: float = float(os.getenv("GENPROMPT_SCHEDULER_RPM", "0"))
+        self.SCHEDULER_TPM: float = float(os.getenv("GENPROMPT_SCHEDULER_TPM", "0"))
+        self.SCHEDULER_MAX_CONCURRENCY: int = int(os.getenv("GENPROMPT_SCHEDULER_MAX_CONCURRENCY", "32"))
+        self.SCHEDULER_MIN_CONCURRENCY: int = int(os.getenv("GENPROMPT_SCHEDULER_MIN_CONCURRENCY", "2"))
+        self.SCHEDULER_MAX_QUEUE: int = int(os.getenv("GENPROMPT_SCHEDULER_MAX_QUEUE", "256"))
+        self.SCHEDULER_MAX_WAIT_SECONDS: float = float(os.getenv("GENPROMPT_SCHEDULER_MAX_WAIT_SECONDS", "20"))
+        self.SCHEDULER_BACKGROUND_MAX_WAIT_SECONDS: float = float(os.getenv("GENPROMPT_SCHEDULER_BACKGROUND_MAX_WAIT_SECONDS", "600"))
+        self.SCHEDULER_COMPLETION_TOKENS: int = int(os.getenv("GENPROMPT_SCHEDULER_COMPLETION_TOKENS", "400"))
+
+        # Request deadlines: clients may send `X-Request-Timeout: <seconds>`, capped at the maximum.
+        self.REQUEST_DEADLINE_SECONDS: float = float(os.getenv("GENPROMPT_REQUEST_DEADLINE_SECONDS", "120"))
+        self.REQUEST_MAX_DEADLINE_SECONDS: float = float(os.getenv("GENPROMPT_REQUEST_MAX_DEADLINE_SECONDS", "300"))
+
+        # Hedged LLM calls: duplicate a call still running after the p-th percentile
+        # latency of its node and model, for at most HEDGE_MAX_FRACTION of calls.
+        self.HEDGE_ENABLED: bool = _env_bool("GENPROMPT_HEDGE", True)
+        self.HEDGE_PERCENTILE: float = float(os.getenv("GENPROMPT_HEDGE_PERCENTILE", "95"))
+        self.HEDGE_MIN_SAMPLES: int = int(os.getenv("GENPROMPT_HEDGE_MIN_SAMPLES", "20"))
+        self.HEDGE_MIN_DELAY_SECONDS: float = float(os.getenv("GENPROMPT_HEDGE_MIN_DELAY_SECONDS", "1.0"))
+        self.HEDGE_MAX_FRACTION: float = float(os.getenv("GENPROMPT_HEDGE_MAX_FRACTION", "0.1"))
+        self.HEDGE_WINDOW: int = int(os.getenv("GENPROMPT_HEDGE_WINDOW", "200"))
+
+        # USD per million tokens as (input, cached input, output), used to price LLM spans.
+        self.LLM_PRICING_USD_PER_MILLION_TOKENS: Dict[str, Tuple[float, float, float]] = {
+            "gpt-4o": (2.50, 1.25, 10.00),
+            "gpt-4o-mini": (0.15, 0.075, 0.60),
+        }
+
+        # Visual analysis cache: in-process LRU, plus SQLite when a path is set.
+        self.ANALYSIS_CACHE_ENABLED: bool = _env_bool("GENPROMPT_ANALYSIS_CACHE", True)
+        self.ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("GENPROMPT_ANALYSIS_CACHE_MAX_ENTRIES", "1024"))
+        self.ANALYSIS_CACHE_TTL_SECONDS: float = float(os.getenv("GENPROMPT_ANALYSIS_CACHE_TTL_SECONDS", "86400"))
+        self.ANALYSIS_CACHE_SQLITE_PATH: str = os.getenv("GENPROMPT_ANALYSIS_CACHE_SQLITE_PATH", "")
+        self.ANALYSIS_CACHE_SQLITE_MAX_ENTRIES: int = int(os.getenv("GENPROMPT_ANALYSIS_CACHE_SQLITE_MAX_ENTRIES", "100000"))
+
+        # Refinement: cache for deterministic (temperature 0) refinements, and the cap on candidates per request.
+        self.REFINE_CACHE_ENABLED: bool = _env_bool("GENPROMPT_REFINE_CACHE", True)
+        self.REFINE_CACHE_MAX_ENTRIES: int = int(os.getenv("GENPROMPT_REFINE_CACHE_MAX_ENTRIES", "4096"))
+        self.REFINE_CACHE_TTL_SECONDS: float = float(os.getenv("GENPROMPT_REFINE_CACHE_TTL_SECONDS", "86400"))
+        self.REFINE_MAX_CANDIDATES: int = int(os.getenv("GENPROMPT_REFINE_MAX_CANDIDATES", "4"))
+
+        # Near-duplicate reuse: an upload whose perceptual hash is within this many
+        # bits (of 64) of an analysed image reuses that image's cached analysis.
+        self.NEAR_DUPLICATE_ENABLED: bool = _env_bool("GENPROMPT_NEAR_DUPLICATE", True)
+        self.NEAR_DUPLICATE_MAX_DISTANCE: int = int(os.getenv("GENPROMPT_NEAR_DUPLICATE_MAX_DISTANCE", "5"))
+        self.NEAR_DUPLICATE_MAX_ENTRIES: int = int(os.getenv("GENPROMPT_NEAR_DUPLICATE_MAX_ENTRIES", "100000"))
+
+        # /invoke-graph/batch: images per request and graphs run at once per request.
+        self.BATCH_MAX_IMAGES: int = int(os.getenv("GENPROMPT_BATCH_MAX_IMAGES", "50"))
+        self.BATCH_MAX_CONCURRENCY: int = int(os.getenv("GENPROMPT_BATCH_MAX_CONCURRENCY", "4"))
+
+        # Job API (/jobs): worker count bounds concurrently running background jobs.
+        self.JOB_WORKERS: int = int(os.getenv("GENPROMPT_JOB_WORKERS", "16"))
+        self.JOB_QUEUE_MAX: int = int(os.getenv("GENPROMPT_JOB_QUEUE_MAX", "1000"))
+        self.JOB_TTL_SECONDS: float = float(os.getenv("GENPROMPT_JOB_TTL_SECONDS", "3600"))
+        self.JOB_MAX_ENTRIES: int = int(os.getenv("GENPROMPT_JOB_MAX_ENTRIES", "10000"))
+
+        # Server-side sessions (visual analysis, prompts and history per user run).
+        self.SESSION_TTL_SECONDS: float = float(os.getenv("GENPROMPT_SESSION_TTL_SECONDS", "86400"))
+        self.SESSION_MAX_ENTRIES: int = int(os.getenv("GENPROMPT_SESSION_MAX_ENTRIES", "10000"))
+        self.SESSION_SQLITE_PATH: str = os.getenv("GENPROMPT_SESSION_SQLITE_PATH", "")
+
+        # Uploads larger than this are spooled to a temporary file and memory-mapped instead of held in RAM.
+        self.BLOB_MEMORY_MAX_BYTES: int = int(os.getenv("GENPROMPT_BLOB_MEMORY_MAX_BYTES", str(1024 * 1024)))
+        self.BLOB_TTL_SECONDS: float = float(os.getenv("GENPROMPT_BLOB_TTL_SECONDS", "7200"))
+
+        # Image uploads are read in chunks and rejected early: larger than this -> 413,
+        # contents (by magic bytes, not the declared type) not one of these formats -> 415.
+        self.UPLOAD_MAX_BYTES: int = int(os.getenv("GENPROMPT_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+        self.UPLOAD_ALLOWED_TYPES: Tuple[str, ...] = tuple(
+            mime_type.strip()
+            for mime_type in os.getenv("GENPROMPT_UPLOAD_ALLOWED_TYPES", "image/jpeg,image/png,image/webp,image/gif").split(",")
+            if mime_type.strip()
+        )
+
+        # Local index of generated prompts for "similar prompt" suggestions; kept in a
+        # temporary directory unless a path is set. Embedder: "hashing" (offline) or "openai".
+        self.PROMPT_INDEX_ENABLED: bool = _env_bool("GENPROMPT_PROMPT_INDEX", True)
+        self.PROMPT_INDEX_PATH: str = os.getenv("GENPROMPT_PROMPT_INDEX_PATH", "")
+        self.PROMPT_INDEX_EMBEDDER: str = os.getenv("GENPROMPT_PROMPT_INDEX_EMBEDDER", "hashing")
+        self.PROMPT_INDEX_DIM: int = int(os.getenv("GENPROMPT_PROMPT_INDEX_DIM", "256"))
+        self.PROMPT_INDEX_OPENAI_MODEL: str = os.getenv("GENPROMPT_PROMPT_INDEX_OPENAI_MODEL", "text-embedding-3-small")
+        self.PROMPT_INDEX_MAX_RESULTS: int = int(os.getenv("GENPROMPT_PROMPT_INDEX_MAX_RESULTS", "50"))
+
+        # Per-model circuit breakers: after this many consecutive failed calls a model is
+        # not called for CIRCUIT_RESET_SECONDS, then a single trial call decides.
+        self.CIRCUIT_BREAKER_ENABLED: bool = _env_bool("GENPROMPT_CIRCUIT_BREAKER", True)
+        self.CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("GENPROMPT_CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.CIRCUIT_RESET_SECONDS: float = float(os.getenv("GENPROMPT_CIRCUIT_RESET_SECONDS", "30"))
+
+        # Local, zero-LLM composer for Prompt A. Requests choose it with prompt_mode=composer;
+        # with PROMPT_COMPOSER_AUTO it also stands in when the LLM is saturated or its circuit is open.
+        self.PROMPT_COMPOSER_AUTO: bool = _env_bool("GENPROMPT_PROMPT_COMPOSER_AUTO", True)
+        self.PROMPT_COMPOSER_MAX_WORDS: int = int(os.getenv("GENPROMPT_PROMPT_COMPOSER_MAX_WORDS", "60"))
+
+        # Image preprocessing before vision calls. With IMAGE_FIT_VISION_TILES the
+        # image is also shrunk to the size the vision model downsamples to anyway.
+        self.IMAGE_PREPROCESS_ENABLED: bool = _env_bool("GENPROMPT_IMAGE_PREPROCESS", True)
+        self.IMAGE_MAX_EDGE: int = int(os.getenv("GENPROMPT_IMAGE_MAX_EDGE", "2048"))
+        self.IMAGE_FIT_VISION_TILES: bool = _env_bool("GENPROMPT_IMAGE_FIT_VISION_TILES", True)
+        self.IMAGE_MAX_VISION_TILES: int = int(os.getenv("GENPROMPT_IMAGE_MAX_VISION_TILES", "0"))  # 0 = no tile budget
+        self.IMAGE_JPEG_QUALITY: int = int(os.getenv("GENPROMPT_IMAGE_JPEG_QUALITY", "85"))
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+def load_environment() -> None:
+    """Loads the project's .env file into the environment (variables already set win)."""
+    if not os.path.exists(dotenv_path):
+        logger.warning(".env file not found at %s. Make sure it exists in the project root.", dotenv_path)
+    else:
+        load_dotenv(dotenv_path=dotenv_path)
+
+def get_settings() -> Settings:
+    """Returns the process-wide settings, loading .env on first call."""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                load_environment()
+                _settings = Settings()
+    return _settings
+
+def validate_settings() -> Settings:
+    """Fails fast when essential secrets are missing; called once at application startup."""
+    current = get_settings()
+    if not current.OPENAI_API_KEY:
+        raise ValueError("FATAL: OPENAI_API_KEY environment variable not set in .env file.")
+    # The HF token is optional for public models but good practice to have.
+    if not current.HUGGING_FACE_TOKEN:
+        logger.warning("HUGGING_FACE_TOKEN is not set in the .env file.")
+    return current
+
+class _LazySettings:
+    """
+    Module-level `settings`: forwards attribute reads and writes to
+    `get_settings()`, so `from ..config import settings` stays cheap at import.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(get_settings(), name, value)
+
+settings = _LazySettings()
@@ -0,0 +1,86 @@
+# File: src/core/analysis_cache.py
+# Content-addressed cache for VisualAnalysis results.
+#
+# Keys combine a SHA-256 of the raw image bytes with the vision model id and a
+# fingerprint of VISUAL_ANALYST_SYSTEM_PROMPT, so changing either invalidates old entries.
+
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from ..config import settings
+from .cache import LRUCache, SQLiteCache
+from .concurrency import run_blocking
+from .prompts import VISUAL_ANALYST_SYSTEM_PROMPT
+from .schemas import VisualAnalysis
+
+logger = logging.getLogger(__name__)
+
+VISUAL_ANALYST_PROMPT_VERSION = hashlib.sha256(VISUAL_ANALYST_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+def image_digest(image_bytes: bytes) -> str:
+    """Returns the hex SHA-256 digest of the raw image bytes."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def analysis_cache_key(image_hash: str, model_id: str) -> str:
+    """Builds the cache key for an image analysed by `model_id` with the current prompt."""
+    return f"{image_hash}:{model_id}:{VISUAL_ANALYST_PROMPT_VERSION}"
+
+class VisualAnalysisCache:
+    """Two-tier cache: an in-process LRU in front of an optional SQLite store."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> Optional[VisualAnalysis]:
+        analysis = self.memory.get(key)
+        if analysis is not None:
+            return analysis
+        if self.disk is None:
+            return None
+        try:
+            payload = await run_blocking(self.disk.get, key)
+        except Exception as e:
+            logger.warning("Analysis cache disk read failed: %s", e)
+            return None
+        if payload is None:
+            return None
+        analysis = VisualAnalysis.model_validate_json(payload)
+        self.memory.set(key, analysis)
+        return analysis
+
+    async def set(self, key: str, analysis: VisualAnalysis) -> None:
+        self.memory.set(key, analysis)
+        if self.disk is None:
+            return
+        try:
+            await run_blocking(self.disk.set, key, analysis.model_dump_json())
+        except Exception as e:
+            logger.warning("Analysis cache disk write failed: %s", e)
+
+_cache: Optional[VisualAnalysisCache] = None
+_cache_lock = threading.Lock()
+
+def get_analysis_cache() -> Optional[VisualAnalysisCache]:
+    """Returns the process-wide analysis cache, or None when caching is disabled."""
+    global _cache
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                disk = None
+                if settings.ANALYSIS_CACHE_SQLITE_PATH:
+                    disk = SQLiteCache(
+                        settings.ANALYSIS_CACHE_SQLITE_PATH,
+                        table="visual_analysis",
+                        max_entries=settings.ANALYSIS_CACHE_SQLITE_MAX_ENTRIES,
+                        ttl_seconds=settings.ANALYSIS_CACHE_TTL_SECONDS,
+                    )
+                _cache = VisualAnalysisCache(
+                    LRUCache(settings.ANALYSIS_CACHE_MAX_ENTRIES, settings.ANALYSIS_CACHE_TTL_SECONDS),
+                    disk,
+                )
+    return _cache
@@ -0,0 +1,184 @@
+# File: src/core/blobstore.py
+# Image blob store: uploads live here once, and graph state carries only their id.
+#
+# Small uploads are kept as the `bytes` object they were read into; larger ones
+# are copied in chunks to an anonymous temporary file and read back through
+# `mmap`, so they never sit in the Python heap. Graph state, Pydantic dumps and
+# job records hold the blob id, never a copy of the image.
+#
+# `release` only drops the store's reference: a node still holding the `Blob`
+# (e.g. a coalesced analysis that outlives its request) keeps reading it, and
+# the temporary file is closed once the last reference goes away.
+
+import hashlib
+import io
+import logging
+import mmap
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Dict, Iterator, Optional, Union
+
+from ..config import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Chunk size for copying uploads and hashing blobs.
+COPY_CHUNK_BYTES = 1 << 20
+
+def new_spool() -> IO[bytes]:
+    """An anonymous temporary file for a blob too large to keep in memory."""
+    return tempfile.TemporaryFile(prefix="genprompt-blob-")
+
+class BlobNotFoundError(LookupError):
+    """Raised when graph state refers to a blob that was released or never stored."""
+
+class Blob:
+    """One immutable image, in memory (`bytes`) or in a memory-mapped file."""
+
+    def __init__(self, data: Optional[bytes] = None, file: Optional[IO[bytes]] = None, digest: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.created_at = time.monotonic()
+        self._data = data
+        self._file = file
+        self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if file is not None else None
+        self.size = len(data) if data is not None else len(self._map)
+        self._digest = digest  # Known already when the upload was hashed while it was read
+        # 64-bit perceptual hash, set by `core.phash` at upload when near-duplicate reuse is on.
+        self.perceptual_hash: Optional[int] = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._data is not None
+
+    @property
+    def digest(self) -> str:
+        """Hex SHA-256 of the contents, computed once without copying them."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.view()).hexdigest()
+        return self._digest
+
+    def view(self) -> Union[bytes, memoryview]:
+        """A zero-copy, read-only view of the contents."""
+        return self._data if self._data is not None else memoryview(self._map)
+
+    @contextmanager
+    def open(self) -> Iterator[IO[bytes]]:
+        """A private file-like reader, safe to use from several threads at once."""
+        if self._data is not None:
+            yield io.BytesIO(self._data)  # Shares the buffer until written to.
+            return
+        reader = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield reader
+        finally:
+            reader.close()
+
+    def read(self) -> bytes:
+        """The contents as `bytes`; a copy for file-backed blobs, so avoid it on hot paths."""
+        return self._data if self._data is not None else self._map[:]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __del__(self) -> None:
+        if self._map is not None:
+            try:
+                self._map.close()
+                self._file.close()
+            except Exception:
+                pass
+
+class BlobStore:
+    """
+    Maps blob ids to `Blob`s for the lifetime of a graph run. Blobs never
+    released (e.g. a streaming response the client never read) are dropped
+    after `ttl_seconds`.
+    """
+
+    def __init__(self, memory_max_bytes: int, ttl_seconds: float):
+        self.memory_max_bytes = memory_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._blobs: Dict[str, Blob] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, blob: Blob) -> Blob:
+        with self._lock:
+            # Dicts keep insertion order, so expired blobs are at the front.
+            expired_before = time.monotonic() - self.ttl_seconds
+            while self._blobs:
+                oldest = next(iter(self._blobs.values()))
+                if oldest.created_at >= expired_before:
+                    break
+                del self._blobs[oldest.id]
+            self._blobs[blob.id] = blob
+        metrics.inc("genprompt_blobs_stored_total", storage="memory" if blob.in_memory else "file")
+        metrics.inc("genprompt_blob_bytes_stored_total", blob.size)
+        return blob
+
+    def put_bytes(self, data: bytes, digest: Optional[str] = None) -> Blob:
+        """Stores bytes the caller already holds, without copying them."""
+        return self._add(Blob(data=data, digest=digest))
+
+    def put_spool(self, spool: IO[bytes], digest: Optional[str] = None) -> Blob:
+        """Takes ownership of a written temporary file and memory-maps it."""
+        spool.flush()
+        return self._add(Blob(file=spool, digest=digest))
+
+    def put_stream(self, source: IO[bytes], size_hint: Optional[int] = None) -> Blob:
+        """
+        Stores a readable binary stream. Streams up to `memory_max_bytes` are read
+        into memory; larger (or unsized) ones are copied in chunks to a temporary
+        file. Blocking; call it through `run_blocking` from async code.
+        """
+        if size_hint is not None and size_hint <= self.memory_max_bytes:
+            return self._add(Blob(data=source.read()))
+        head = source.read(self.memory_max_bytes + 1)
+        if len(head) <= self.memory_max_bytes:
+            return self._add(Blob(data=head))
+        spool = new_spool()
+        spool.write(head)
+        del head
+        shutil.copyfileobj(source, spool, COPY_CHUNK_BYTES)
+        return self.put_spool(spool)
+
+    def put_file(self, path: Union[str, Path]) -> Blob:
+        """Stores a file from disk, memory-mapping it rather than reading it."""
+        path = Path(path)
+        if path.stat().st_size <= self.memory_max_bytes:
+            return self._add(Blob(data=path.read_bytes()))
+        return self._add(Blob(file=path.open("rb")))
+
+    def get(self, blob_id: str) -> Blob:
+        with self._lock:
+            blob = self._blobs.get(blob_id)
+        if blob is None:
+            raise BlobNotFoundError(blob_id)
+        return blob
+
+    def release(self, blob_id: Optional[str]) -> None:
+        """Forgets a blob; it is freed once nothing else references it. Unknown ids are ignored."""
+        if not blob_id:
+            return
+        with self._lock:
+            self._blobs.pop(blob_id, None)
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    """Returns the process-wide blob store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BlobStore(settings.BLOB_MEMORY_MAX_BYTES, settings.BLOB_TTL_SECONDS)
+    return _store
@@ -0,0 +1,109 @@
+# File: src/core/circuit.py
+# Circuit breakers for LLM calls, one per model.
+#
+# After CIRCUIT_FAILURE_THRESHOLD consecutive failed calls to a model its
+# circuit opens: for CIRCUIT_RESET_SECONDS every call fails at once with
+# `CircuitOpen` instead of waiting out timeouts and SDK retries. Then a single
+# trial call is let through (half-open); its success closes the circuit and its
+# failure opens it again. Our own limits (deadlines, scheduler saturation) say
+# nothing about the provider's health and are not counted.
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from ..config import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling a model whose circuit is open; `retry_after` is in seconds."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Calls to {model} are failing; the circuit is open.")
+        self.model = model
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one model. Thread-safe."""
+
+    def __init__(self, model: str, failure_threshold: int, reset_seconds: float):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("Circuit for %s: %s -> %s.", self.model, self.state, state)
+            metrics.inc("genprompt_circuit_transitions_total", model=self.model, state=state)
+            self.state = state
+
+    def retry_after(self) -> float:
+        return max(self._opened_at + self.reset_seconds - time.monotonic(), 0.0)
+
+    def is_open(self) -> bool:
+        """Whether a call made now would be refused (does not claim the half-open trial)."""
+        with self._lock:
+            if self.state == OPEN:
+                return self.retry_after() > 0
+            return self.state == HALF_OPEN and self._trial_in_flight
+
+    def before_call(self) -> bool:
+        """Raises CircuitOpen or lets the call through; returns True for the half-open trial call."""
+        with self._lock:
+            if self.state == OPEN and self.retry_after() <= 0:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return False
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        metrics.inc("genprompt_circuit_rejected_total", model=self.model)
+        raise CircuitOpen(self.model, self.retry_after() or self.reset_seconds)
+
+    def after_call(self, succeeded: Optional[bool], trial: bool = False) -> None:
+        """Records a call's outcome; None means it ended without a verdict (deadline, cancellation)."""
+        with self._lock:
+            if trial:
+                self._trial_in_flight = False
+            if succeeded is None:
+                return
+            if succeeded:
+                self._failures = 0
+                self._transition(CLOSED)
+                return
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+_circuits: Dict[str, CircuitBreaker] = {}
+_circuits_lock = threading.Lock()
+
+def get_circuit(model: str) -> Optional[CircuitBreaker]:
+    """The breaker for `model`, or None when GENPROMPT_CIRCUIT_BREAKER=false."""
+    if not settings.CIRCUIT_BREAKER_ENABLED:
+        return None
+    circuit = _circuits.get(model)
+    if circuit is None:
+        with _circuits_lock:
+            circuit = _circuits.get(model)
+            if circuit is None:
+                circuit = _circuits[model] = CircuitBreaker(
+                    model, settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_SECONDS
+                )
+    return circuit
+
+def is_circuit_open(model: str) -> bool:
+    circuit = get_circuit(model)
+    return circuit is not None and circuit.is_open()
@@ -0,0 +1,119 @@
+# File: src/core/clients.py
+# Process-wide registry of chat models that share pooled, keep-alive HTTP clients.
+#
+# Building a `ChatOpenAI` per request creates a fresh HTTP client (and TLS
+# handshake) every time. Here each (model, temperature) pair is built once and
+# every model reuses the same connection pools.
+#
+# `langchain_openai` (and the `openai` SDK under it) takes about a second to
+# import, so it is imported when the first model is built, not at startup.
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, Type
+
+import httpx
+from pydantic import BaseModel
+
+from ..config import settings
+from .scheduler import aobserve_http_response, observe_http_response
+from .tracing import acount_http_attempt, count_http_attempt
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI as ChatOpenAIType
+
+logger = logging.getLogger(__name__)
+
+# The chat model class; resolved by `load_chat_model_class` on first use (benchmarks may replace it).
+ChatOpenAI: Any = None
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+_chat_models: Dict[Tuple[str, float], Any] = {}
+_structured_models: Dict[Tuple[str, float, Type[BaseModel]], Any] = {}
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(settings.LLM_REQUEST_TIMEOUT_SECONDS, connect=10.0)
+
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Returns the shared sync and async HTTP clients, creating them on first use."""
+    global _http_client, _http_async_client
+    if _http_client is None or _http_async_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    limits=_limits(), timeout=_timeout(), event_hooks={"request": [count_http_attempt], "response": [observe_http_response]}
+                )
+            if _http_async_client is None:
+                _http_async_client = httpx.AsyncClient(
+                    limits=_limits(), timeout=_timeout(), event_hooks={"request": [acount_http_attempt], "response": [aobserve_http_response]}
+                )
+    return _http_client, _http_async_client
+
+def load_chat_model_class() -> Any:
+    """Imports the chat model class once; the lifespan calls this so the first request does not pay for it."""
+    global ChatOpenAI
+    if ChatOpenAI is None:
+        from langchain_openai import ChatOpenAI as chat_openai
+
+        ChatOpenAI = chat_openai
+    return ChatOpenAI
+
+def get_chat_model(model: str, temperature: float) -> "ChatOpenAIType":
+    """Returns the shared `ChatOpenAI` for this (model, temperature) pair."""
+    key = (model, temperature)
+    chat_model = _chat_models.get(key)
+    if chat_model is None:
+        http_client, http_async_client = get_http_clients()
+        with _lock:
+            chat_model = _chat_models.get(key)
+            if chat_model is None:
+                chat_model = load_chat_model_class()(
+                    model=model,
+                    temperature=temperature,
+                    api_key=settings.OPENAI_API_KEY,
+                    base_url=settings.OPENAI_BASE_URL or None,
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    request_timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+                    http_client=http_client,
+                    http_async_client=http_async_client,
+                    # Streamed calls (the graph runs under `astream_events`) report usage, cached tokens included.
+                    stream_usage=True,
+                )
+                _chat_models[key] = chat_model
+                logger.info("Created pooled chat model %s (temperature=%s).", model, temperature)
+    return chat_model
+
+def get_structured_model(model: str, temperature: float, schema: Type[BaseModel]) -> Any:
+    """
+    Returns a shared structured-output wrapper that parses responses into `schema`.
+    The raw message is kept (`include_raw=True`) so `ainvoke_model` can read token usage.
+    """
+    key = (model, temperature, schema)
+    structured = _structured_models.get(key)
+    if structured is None:
+        structured = get_chat_model(model, temperature).with_structured_output(schema, include_raw=True)
+        with _lock:
+            structured = _structured_models.setdefault(key, structured)
+    return structured
+
+async def close_clients() -> None:
+    """Closes the shared HTTP clients and forgets every cached model."""
+    global _http_client, _http_async_client
+    with _lock:
+        http_client, http_async_client = _http_client, _http_async_client
+        _http_client = _http_async_client = None
+        _chat_models.clear()
+        _structured_models.clear()
+    if http_client is not None:
+        http_client.close()
+    if http_async_client is not None:
+        await http_async_client.aclose()
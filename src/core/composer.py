@@ -0,0 +1,144 @@
+# File: src/core/composer.py
+# Deterministic Prompt A: a Midjourney-style prompt assembled from the visual
+# analysis without an LLM call.
+#
+# Every analysis field becomes one phrase through a weighted template. Phrases
+# are emitted by descending weight (Midjourney gives earlier words more pull),
+# so the subject and setting lead and the composition notes trail. Repeated
+# phrases are dropped, and when the prompt would run over
+# PROMPT_COMPOSER_MAX_WORDS the lowest-weighted phrases are shortened or left
+# out first. The aspect ratio and style flag are picked from the analysis.
+
+import re
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+from ..config import settings
+from .schemas import ImagePrompt, VisualAnalysis
+
+@dataclass(frozen=True)
+class PhraseTemplate:
+    """How one analysis field is phrased, how early it goes, and its own word cap."""
+    field: str
+    weight: float
+    template: str
+    max_words: int
+    # The template's suffix is left off when the value already says it, e.g. "ominous atmosphere".
+    implied_by: Tuple[str, ...] = ()
+
+PHRASE_TEMPLATES = (
+    PhraseTemplate("main_subject", 1.0, "{}", 18),
+    PhraseTemplate("setting_and_environment", 0.9, "{}", 14),
+    PhraseTemplate("artistic_style", 0.8, "{}", 10),
+    PhraseTemplate("lighting_style", 0.7, "{}", 10),
+    PhraseTemplate("mood_and_atmosphere", 0.6, "{} atmosphere", 8, ("atmosphere", "mood", "feel", "tone")),
+    PhraseTemplate("color_scheme", 0.5, "{} palette", 12, ("palette", "colors", "colour", "tones")),
+    PhraseTemplate("compositional_notes", 0.4, "{}", 10),
+)
+QUALITY_TAGS = ("highly detailed", "masterful composition")
+QUALITY_WEIGHT = 0.2
+# Shorter than this, a clipped phrase says too little to be worth its words.
+MIN_PHRASE_WORDS = 3
+
+_CLAUSE_BREAK = re.compile(r"\s*[,;:]\s+|\s+[-–—]\s+|\s*\(")
+_SPACES = re.compile(r"\s+")
+_SENTENCE_BREAK = re.compile(r"\s*[.;!?]\s+")
+# A clipped phrase should not end on a word that only links to what was cut.
+_DANGLING = {"a", "an", "the", "and", "or", "of", "with", "in", "on", "at", "to", "from", "by", "for", "above", "below", "against", "under", "over", "into"}
+_PORTRAIT = re.compile(r"\b(portrait|vertical|full[- ]length|full[- ]body|tall|standing figure)\b", re.IGNORECASE)
+_PANORAMIC = re.compile(r"\b(panoram\w*|ultra[- ]wide|widescreen|anamorphic|vista|skyline)\b", re.IGNORECASE)
+_SQUARE = re.compile(r"\b(square|symmetr\w*|centered|centred|top[- ]down|flat ?lay)\b", re.IGNORECASE)
+_PHOTOGRAPHIC = re.compile(r"\b(photo\w*|cinematic|film still|realis\w*|hyperrealis\w*|35 ?mm|dslr|documentary)\b", re.IGNORECASE)
+
+def _lower_first(text: str) -> str:
+    # Lowercase a capitalised first word, but keep acronyms and names like "HDR" or "McQueen".
+    first = text.split(" ", 1)[0]
+    if first[1:].islower() or len(first) == 1:
+        return text[:1].lower() + text[1:]
+    return text
+
+def _clean(text: str) -> str:
+    """One comma-separated phrase: whitespace collapsed, sentences joined, no end punctuation."""
+    parts = _SENTENCE_BREAK.split(_SPACES.sub(" ", text).strip())
+    return ", ".join(_lower_first(part.strip(".,;: ")) for part in parts if part.strip(".,;: "))
+
+def _clip(text: str, max_words: int) -> str:
+    """`text` cut to at most `max_words` words, at its first clause break when one comes early enough."""
+    words = text.split()
+    if len(words) <= max_words:
+        return text
+    head = _CLAUSE_BREAK.split(text, maxsplit=1)[0]
+    if MIN_PHRASE_WORDS <= len(head.split()) <= max_words:
+        return head.strip(" ,")
+    words = words[:max_words]
+    while len(words) > 1 and words[-1].lower().strip(",;:") in _DANGLING:
+        words.pop()
+    return " ".join(words).rstrip(",;:")
+
+def _join_colors(colors: List[str]) -> str:
+    colors = [_clean(color) for color in colors if color and color.strip()]
+    if len(colors) <= 1:
+        return "".join(colors)
+    return f"{', '.join(colors[:-1])} and {colors[-1]}"
+
+def _phrase(template: PhraseTemplate, value: Any) -> Optional[str]:
+    text = _join_colors(value) if isinstance(value, list) else _clean(str(value or ""))
+    if not text:
+        return None
+    text = _clip(text, template.max_words)
+    if any(word in text.lower() for word in template.implied_by):
+        return text
+    return template.template.format(text)
+
+def technical_parameters(analysis: VisualAnalysis) -> str:
+    """Aspect ratio from the framing notes, `--style raw` for photographic styles."""
+    framing = f"{analysis.compositional_notes} {analysis.main_subject}"
+    if _PORTRAIT.search(framing):
+        aspect = "2:3"
+    elif _PANORAMIC.search(framing):
+        aspect = "21:9"
+    elif _SQUARE.search(analysis.compositional_notes):
+        aspect = "1:1"
+    else:
+        aspect = "16:9"
+    style = "--style raw" if _PHOTOGRAPHIC.search(analysis.artistic_style) else "--stylize 250"
+    return f"--ar {aspect} --v 6.0 {style}"
+
+def compose_phrases(analysis: VisualAnalysis, max_words: int) -> List[str]:
+    """The prompt's phrases, highest weight first, within `max_words` words in total."""
+    weighted = [
+        (template.weight, _phrase(template, getattr(analysis, template.field)))
+        for template in PHRASE_TEMPLATES
+    ]
+    weighted += [(QUALITY_WEIGHT, tag) for tag in QUALITY_TAGS]
+    weighted.sort(key=lambda item: -item[0])  # Stable: equal weights keep table order.
+
+    phrases: List[str] = []
+    seen: List[str] = []
+    budget = max_words
+    for _, phrase in weighted:
+        if not phrase:
+            continue
+        key = phrase.lower()
+        if any(key in earlier for earlier in seen):
+            continue  # Already said, e.g. a setting repeated inside the subject.
+        words = len(phrase.split())
+        if words > budget:
+            if budget < MIN_PHRASE_WORDS:
+                continue
+            phrase = _clip(phrase, budget)
+            words = len(phrase.split())
+            if words > budget:
+                continue
+        phrases.append(phrase)
+        seen.append(key)
+        budget -= words
+    return phrases
+
+def compose_image_prompt(analysis: Any, max_words: Optional[int] = None) -> ImagePrompt:
+    """Prompt A for `analysis` (a VisualAnalysis or its dict), built locally and deterministically."""
+    if not isinstance(analysis, VisualAnalysis):
+        analysis = VisualAnalysis.model_validate(analysis)
+    phrases = compose_phrases(analysis, max_words or settings.PROMPT_COMPOSER_MAX_WORDS)
+    body = ", ".join(phrases)
+    return ImagePrompt(prompt_body=body[:1].upper() + body[1:], technical_parameters=technical_parameters(analysis))
@@ -0,0 +1,53 @@
+# File: src/core/concurrency.py
+# Helpers for keeping blocking work off the FastAPI event loop.
+
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from ..config import settings
+from .tracing import add_queue_wait
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide, bounded thread pool used for blocking calls.
+    The pool is created on first use so importing this module is cheap.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.BLOCKING_POOL_SIZE,
+                    thread_name_prefix="genprompt-blocking",
+                )
+                logger.info("Started blocking thread pool with %d workers.", settings.BLOCKING_POOL_SIZE)
+    return _executor
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a blocking callable in the bounded thread pool and awaits its result.
+    Context variables are copied so logging/tracing context follows the call,
+    and the time spent waiting for a free worker is charged to the current span.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    submitted_at = time.perf_counter()
+
+    def call() -> T:
+        add_queue_wait(time.perf_counter() - submitted_at)
+        return func(*args, **kwargs)
+
+    return await loop.run_in_executor(get_blocking_executor(), functools.partial(ctx.run, call))
@@ -0,0 +1,45 @@
+# File: src/core/deadline.py
+# Per-request deadlines, carried in a context variable from the HTTP request down to each LLM call.
+
+import asyncio
+import contextvars
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request's deadline passes before its graph run finishes."""
+
+# Absolute `time.monotonic()` by which the current request must be answered.
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("genprompt_deadline", default=None)
+
+def set_deadline(seconds: Optional[float]) -> None:
+    """Gives the current context (and the tasks it starts) `seconds` to finish; None clears it."""
+    _deadline.set(time.monotonic() + seconds if seconds is not None else None)
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline() -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("The request deadline has passed.")
+
+@asynccontextmanager
+async def deadline_scope() -> AsyncIterator[None]:
+    """Cancels the enclosed work when the current deadline passes, raising DeadlineExceeded."""
+    left = remaining()
+    if left is None:
+        yield
+        return
+    check_deadline()
+    timeout = asyncio.timeout(left)
+    try:
+        async with timeout:
+            yield
+    except TimeoutError:
+        if timeout.expired():
+            raise DeadlineExceeded(f"The request deadline passed after waiting {left:.1f}s.") from None
+        raise
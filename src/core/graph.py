@@ -1,43 +1,78 @@
 # File: src/core/graph.py
 # FINAL, CORRECTED VERSION. The router is now aware of refinement.
 
+import functools
+import logging
 from langgraph.graph import StateGraph, END
-from typing import Dict, Any, Literal
+from typing import Annotated, Dict, Any, List, Literal
+
+from .tracing import traced_node
 
 # Import all agent runners
 from ..agents.visual_analyst import run_visual_analyst
 from ..agents.prompt_engineer import run_prompt_engineer
+from ..agents.prompt_composer import image_prompt_node, run_prompt_composer
 from ..agents.video_director import run_video_director
 from ..agents.refiner import run_refiner
 
+logger = logging.getLogger(__name__)
+
+def merge_state(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reducer for the graph state. Nodes return only the keys they change;
+    `prompt_history` entries are appended instead of replacing the list, so
+    parallel branches can each add their prompt.
+    """
+    merged = {**current, **update}
+    if "prompt_history" in update:
+        merged["prompt_history"] = list(current.get("prompt_history", [])) + list(update["prompt_history"])
+    return merged
+
+GraphState = Annotated[dict, merge_state]
+
 def entry_or_refine_router(state: Dict[str, Any]) -> Literal["visual_analyst", "refiner", "video_director"]:
     """
     This is the main router. It decides if this is a new job or a refinement job.
     """
-    print("---MAIN ROUTER---")
     # If there is user feedback, we ALWAYS go to the refiner first.
     if state.get("user_feedback"):
-        print("Routing to: REFINE")
+        logger.debug("Routing to: REFINE")
         return "refiner"
-    
+
+    # The single-pass pipeline always starts with one visual analysis.
+    if state.get("pipeline_mode") == "full":
+        logger.debug("Routing to: VISUAL ANALYST (full pipeline)")
+        return "visual_analyst"
+
     # Otherwise, it's a new job. Decide between Stage 1 or Stage 2.
     if state.get("video_creative_brief") is not None:
-        print("Routing to: VIDEO DIRECTOR")
+        logger.debug("Routing to: VIDEO DIRECTOR")
         return "video_director"
     else:
-        print("Routing to: VISUAL ANALYST")
+        logger.debug("Routing to: VISUAL ANALYST")
         return "visual_analyst"
 
+def after_analysis_router(state: Dict[str, Any]) -> List[str]:
+    """
+    After the visual analysis, Stage 1 continues to the prompt engineer, or to
+    the local prompt composer when it was requested or the LLM is unavailable.
+    The full pipeline fans out so Prompt A and Prompt B are written in parallel.
+    """
+    image_node = image_prompt_node(state)
+    if state.get("pipeline_mode") == "full":
+        return [image_node, "video_director"]
+    return [image_node]
 
 def build_genprompt_graph():
     """Builds the complete, conditional LangGraph for the GenPrompt application."""
-    workflow = StateGraph(Dict[str, Any])
+    workflow = StateGraph(GraphState)
 
-    # Add all agent nodes
-    workflow.add_node("visual_analyst", run_visual_analyst)
-    workflow.add_node("prompt_engineer", run_prompt_engineer)
-    workflow.add_node("video_director", run_video_director)
-    workflow.add_node("refiner", run_refiner)
+    # Add all agent nodes; each run is recorded as a tracing span.
+    workflow.add_node("visual_analyst", traced_node("visual_analyst", run_visual_analyst))
+    workflow.add_node("prompt_engineer", traced_node("prompt_engineer", run_prompt_engineer))
+    workflow.add_node("prompt_composer", traced_node("prompt_composer", run_prompt_composer))
+    workflow.add_node("video_director", traced_node("video_director", run_video_director))
+    workflow.add_node("refiner", traced_node("refiner", run_refiner))
 
     # --- Corrected Graph Wiring ---
     
@@ -52,11 +87,17 @@ def build_genprompt_graph():
     )
 
     # 2. Define the paths from each node.
-    workflow.add_edge("visual_analyst", "prompt_engineer")
+    workflow.add_conditional_edges("visual_analyst", after_analysis_router, ["prompt_engineer", "prompt_composer", "video_director"])
     workflow.add_edge("prompt_engineer", END) # Stage 1 ends after prompt engineering
+    workflow.add_edge("prompt_composer", END) # ... or after composing the prompt locally
     workflow.add_edge("video_director", END)  # Stage 2 ends after video direction
     workflow.add_edge("refiner", END)         # Refinement ends after refining
 
     app = workflow.compile()
-    print("✅ GenPrompt Graph Compiled with FINAL, CORRECTED logic.")
-    return app
\ No newline at end of file
+    logger.info("GenPrompt graph compiled.")
+    return app
+
+@functools.lru_cache(maxsize=None)
+def get_compiled_graph():
+    """Returns the process-wide compiled graph, shared by the routes, jobs and batch runs."""
+    return build_genprompt_graph()
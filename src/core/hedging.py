@@ -0,0 +1,153 @@
+# File: src/core/hedging.py
+# Hedged LLM calls: when the primary call is slower than the recent p-th
+# percentile for its node and model, a duplicate is started and the first
+# answer wins; the loser is cancelled.
+#
+# Hedges only fire once enough latency samples exist, never exceed
+# GENPROMPT_HEDGE_MAX_FRACTION of calls, and are skipped when the scheduler
+# has no free slot, so they cannot amplify an overload. Streaming runs are
+# not hedged, since both attempts would stream tokens to the client.
+
+import asyncio
+import contextvars
+import logging
+import math
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from ..config import settings
+from .metrics import metrics
+from .scheduler import Permit, get_scheduler
+from .tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Key = Tuple[str, str]
+# Makes one call with the given permit (or its own); returns (result, model call seconds).
+Attempt = Callable[[Optional[Permit]], Awaitable[Tuple[T, float]]]
+
+_hedging_allowed: contextvars.ContextVar[bool] = contextvars.ContextVar("genprompt_hedging_allowed", default=True)
+
+def disable_hedging() -> None:
+    """Turns hedging off for LLM calls made from the current context."""
+    _hedging_allowed.set(False)
+
+class LatencyTracker:
+    """A sliding window of successful call latencies per (node, model)."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples: Dict[Key, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Key, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: Key, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(q / 100 * len(samples)) - 1)]
+
+class Hedger:
+    """Tracks per-(node, model) latency and the share of calls that were hedged."""
+
+    def __init__(self):
+        self.latencies = LatencyTracker(settings.HEDGE_WINDOW)
+        self.calls = 0
+        self.hedges = 0
+
+    def hedge_delay(self, key: Key) -> Optional[float]:
+        """How long to wait for the primary before hedging, or None to not hedge at all."""
+        if not settings.HEDGE_ENABLED or not _hedging_allowed.get():
+            return None
+        delay = self.latencies.percentile(key, settings.HEDGE_PERCENTILE, settings.HEDGE_MIN_SAMPLES)
+        if delay is None:
+            return None
+        return max(delay, settings.HEDGE_MIN_DELAY_SECONDS)
+
+    def _within_budget(self) -> bool:
+        return self.hedges < settings.HEDGE_MAX_FRACTION * self.calls
+
+    async def call(self, key: Key, tokens: int, attempt: Attempt[T]) -> T:
+        """
+        Runs `attempt(None)`; if it is still running after the hedge delay, also
+        runs `attempt(permit)` with a permit taken without queueing, and returns
+        whichever succeeds first. `attempt` must take its own scheduler slot
+        when given None, and returns its result with the seconds its model call
+        took: time spent queueing for a slot is not latency of the model.
+        """
+        self.calls += 1
+        primary = asyncio.ensure_future(attempt(None))
+        hedge: Optional["asyncio.Future[T]"] = None
+        delay = self.hedge_delay(key)
+        try:
+            if delay is None:
+                return self._record(key, await primary)
+
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done:
+                hedge = self._start_hedge(key, tokens, attempt)
+            if hedge is None:
+                return self._record(key, await primary)
+
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue  # Not an answer; wait for the other attempt.
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.inc("genprompt_llm_hedges_won_total", node=key[0], model=key[1])
+                        return self._record(key, task.result())
+                    error = error or task.exception()
+            if error is None:
+                raise asyncio.CancelledError()
+            raise error
+        finally:
+            # The loser, or both attempts when our caller was cancelled.
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def _record(self, key: Key, outcome: Tuple[T, float]) -> T:
+        result, seconds = outcome
+        self.latencies.record(key, seconds)
+        return result
+
+    def _start_hedge(self, key: Key, tokens: int, attempt: Attempt[T]):
+        if not self._within_budget():
+            metrics.inc("genprompt_llm_hedges_skipped_total", node=key[0], model=key[1], reason="budget")
+            return None
+        permit = None
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            permit = scheduler.try_acquire(tokens)
+            if permit is None:
+                metrics.inc("genprompt_llm_hedges_skipped_total", node=key[0], model=key[1], reason="saturated")
+                return None
+        self.hedges += 1
+        current = current_span()
+        if current is not None:
+            current.hedged = True
+        metrics.inc("genprompt_llm_hedges_fired_total", node=key[0], model=key[1])
+        logger.info("Hedging slow %s call to %s.", key[0], key[1])
+        hedge = asyncio.ensure_future(attempt(permit))
+        if permit is not None:
+            # A hedge cancelled before it starts never enters its slot; return the permit.
+            hedge.add_done_callback(lambda _: scheduler.release_unclaimed(permit))
+        return hedge
+
+_hedger: Optional[Hedger] = None
+
+def get_hedger() -> Hedger:
+    global _hedger
+    if _hedger is None:
+        _hedger = Hedger()
+    return _hedger
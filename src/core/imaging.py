@@ -0,0 +1,226 @@
+# File: src/core/imaging.py
+# Server-side image preprocessing shared by every vision call.
+#
+# Uploads are decoded with Pillow, rotated according to their EXIF orientation,
+# downscaled to what the vision model will actually look at, and re-encoded as
+# JPEG. This cuts both upload size and the number of image tokens billed.
+
+import binascii
+import io
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from ..config import settings
+from .blobstore import Blob
+from .concurrency import run_blocking
+from .metrics import metrics
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+_preprocess_flight = SingleFlight("image_preprocess")
+
+# OpenAI "high detail" image accounting: the image is fitted into a 2048px
+# square, its shortest side is scaled to 768px, then billed per 512px tile.
+VISION_MAX_SQUARE = 2048
+VISION_SHORT_SIDE = 768
+VISION_TILE_SIZE = 512
+VISION_BASE_TOKENS = 85
+VISION_TOKENS_PER_TILE = 170
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+_MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+@dataclass
+class PreparedImage:
+    """An image ready to be sent to a vision model, plus before/after sizes."""
+    data: Union[bytes, memoryview]  # A view of the blob itself when it is sent unchanged
+    mime_type: str
+    width: Optional[int]
+    height: Optional[int]
+    original_bytes: int
+    original_tokens: Optional[int]
+    estimated_tokens: Optional[int]
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+    @property
+    def tokens_saved(self) -> int:
+        if self.original_tokens is None or self.estimated_tokens is None:
+            return 0
+        return self.original_tokens - self.estimated_tokens
+
+def sniff_mime_type(data: Union[bytes, memoryview]) -> Optional[str]:
+    """Identifies the image format from its leading magic bytes."""
+    data = bytes(data[:16])
+    for magic, mime_type in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def _vision_dimensions(width: int, height: int) -> Tuple[int, int]:
+    """Returns the size the vision model downsamples a `width` x `height` image to."""
+    scale = min(1.0, VISION_MAX_SQUARE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, VISION_SHORT_SIDE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def _tile_count(width: int, height: int) -> int:
+    width, height = _vision_dimensions(width, height)
+    return math.ceil(width / VISION_TILE_SIZE) * math.ceil(height / VISION_TILE_SIZE)
+
+def estimate_vision_tokens(width: int, height: int) -> int:
+    """Estimates the prompt tokens a high-detail vision call bills for this image."""
+    return VISION_BASE_TOKENS + VISION_TOKENS_PER_TILE * _tile_count(width, height)
+
+def target_dimensions(width: int, height: int) -> Tuple[int, int]:
+    """
+    Applies the configured maximum edge and, optionally, the vision model's own
+    downsampling and a maximum number of billed tiles.
+    """
+    scale = min(1.0, settings.IMAGE_MAX_EDGE / max(width, height))
+    target = max(1, round(width * scale)), max(1, round(height * scale))
+    if settings.IMAGE_FIT_VISION_TILES:
+        vision = _vision_dimensions(width, height)
+        if vision[0] < target[0]:
+            target = vision
+        max_tiles = settings.IMAGE_MAX_VISION_TILES
+        while max_tiles > 0 and _tile_count(*target) > max_tiles and min(target) > 1:
+            target = max(1, int(target[0] * 0.9)), max(1, int(target[1] * 0.9))
+    return target
+
+def estimate_image_tokens(blob: Blob) -> int:
+    """
+    Estimates the vision tokens an upload will cost after preprocessing,
+    reading only the image header. Undecodable input assumes a 2x2 tile image.
+    """
+    try:
+        with blob.open() as source, Image.open(source) as image:
+            size = image.size
+    except Exception:
+        return VISION_BASE_TOKENS + VISION_TOKENS_PER_TILE * 4
+    return estimate_vision_tokens(*target_dimensions(*size))
+
+def _passthrough(blob: Blob) -> PreparedImage:
+    """Wraps the original bytes unchanged (without copying them), labelled with their real format."""
+    view = blob.view()
+    return PreparedImage(
+        data=view,
+        mime_type=sniff_mime_type(view) or "image/jpeg",
+        width=None,
+        height=None,
+        original_bytes=blob.size,
+        original_tokens=None,
+        estimated_tokens=None,
+    )
+
+def preprocess_image(blob: Blob) -> PreparedImage:
+    """
+    Decodes, orients, downscales and re-encodes an image for a vision call.
+    Undecodable input is passed through untouched with its sniffed MIME type.
+    """
+    original_size = blob.size
+    try:
+        with blob.open() as source, Image.open(source) as image:
+            source_format = image.format
+            original_tokens = estimate_vision_tokens(*image.size)
+            rotated = image.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+            oriented = ImageOps.exif_transpose(image)
+            width, height = target_dimensions(*oriented.size)
+            resized = (width, height) != oriented.size
+
+            if source_format == "JPEG" and not resized and not rotated:
+                # Already a JPEG the model will not downsample: re-encoding only loses quality.
+                data = blob.view()
+            else:
+                if resized:
+                    oriented = oriented.resize((width, height), Image.Resampling.LANCZOS)
+                if oriented.mode in ("RGBA", "LA", "P"):
+                    rgba = oriented.convert("RGBA")
+                    flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+                    flattened.paste(rgba, mask=rgba.getchannel("A"))
+                    oriented = flattened
+                elif oriented.mode != "RGB":
+                    oriented = oriented.convert("RGB")
+                buffer = io.BytesIO()
+                oriented.save(buffer, format="JPEG", quality=settings.IMAGE_JPEG_QUALITY, optimize=True)
+                data = buffer.getvalue()
+    except Exception as e:
+        logger.warning("Image preprocessing failed, sending original bytes: %s", e)
+        return _passthrough(blob)
+
+    return PreparedImage(
+        data=data,
+        mime_type="image/jpeg",
+        width=width,
+        height=height,
+        original_bytes=original_size,
+        original_tokens=original_tokens,
+        estimated_tokens=estimate_vision_tokens(width, height),
+    )
+
+def _preprocess_key(digest: str) -> str:
+    return (
+        f"{digest}:{settings.IMAGE_MAX_EDGE}:{settings.IMAGE_FIT_VISION_TILES}:"
+        f"{settings.IMAGE_MAX_VISION_TILES}:{settings.IMAGE_JPEG_QUALITY}"
+    )
+
+async def prepare_image(blob: Blob, node: str) -> PreparedImage:
+    """
+    Runs `preprocess_image` in the blocking thread pool and records how many
+    bytes and estimated vision tokens it saved for `node`. Concurrent calls for
+    the same image (by SHA-256 digest) share one preprocessing run.
+    """
+    if not settings.IMAGE_PREPROCESS_ENABLED:
+        return _passthrough(blob)
+
+    digest = await run_blocking(lambda: blob.digest)
+    prepared = await _preprocess_flight.do(
+        _preprocess_key(digest), lambda: run_blocking(preprocess_image, blob)
+    )
+    metrics.inc("genprompt_image_bytes_received_total", prepared.original_bytes, node=node)
+    metrics.inc("genprompt_image_bytes_sent_total", len(prepared.data), node=node)
+    metrics.inc("genprompt_image_tokens_saved_total", prepared.tokens_saved, node=node)
+    logger.info(
+        "Image prepared for %s: %d -> %d bytes (%d saved), ~%s -> ~%s vision tokens.",
+        node, prepared.original_bytes, len(prepared.data), prepared.bytes_saved,
+        prepared.original_tokens, prepared.estimated_tokens,
+    )
+    return prepared
+
+# Base64 is encoded in chunks of this many input bytes (a multiple of 3, so chunks concatenate cleanly).
+BASE64_CHUNK_BYTES = 3 * 64 * 1024
+
+def data_url(data: Union[bytes, memoryview], mime_type: str) -> str:
+    """
+    Builds a `data:` URL, base64-encoding `data` chunk by chunk straight into
+    one buffer. `data` may be a view of a memory-mapped blob, which is then
+    encoded page by page without first being read into a `bytes` copy.
+    """
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    buffer = bytearray(len(prefix) + 4 * ((len(data) + 2) // 3))
+    buffer[:len(prefix)] = prefix
+    view, position = memoryview(data), len(prefix)
+    for start in range(0, len(data), BASE64_CHUNK_BYTES):
+        encoded = binascii.b2a_base64(view[start:start + BASE64_CHUNK_BYTES], newline=False)
+        buffer[position:position + len(encoded)] = encoded
+        position += len(encoded)
+    return buffer.decode("ascii")
+
+def image_message_part(prepared: PreparedImage) -> Dict[str, Any]:
+    """Builds the `image_url` content part of a multimodal chat message."""
+    return {"type": "image_url", "image_url": {"url": data_url(prepared.data, prepared.mime_type)}}
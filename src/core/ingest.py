@@ -0,0 +1,99 @@
+# File: src/core/ingest.py
+# Streaming ingestion of image uploads into the blob store.
+#
+# An upload is read in chunks: the first chunk is sniffed for a supported image
+# format (415 otherwise), every chunk is hashed as it goes by, and reading
+# stops as soon as the size limit is crossed (413). Small uploads end up as one
+# `bytes` object; larger ones are written straight to a temporary file that the
+# blob store memory-maps. The SHA-256 is handed over with the blob, so caches
+# and job dedupe never read the image a second time to hash it.
+#
+# For API uploads the source is the form parser's spooled file, so the request
+# body has already been received: the byte limit on the body itself is enforced
+# while it streams in, by `UploadLimitMiddleware`. The copy made here outlives
+# the parser's spool, which is closed with the request's form.
+
+import hashlib
+import logging
+from typing import IO, List, Optional
+
+from ..config import settings
+from .blobstore import COPY_CHUNK_BYTES, Blob, BlobStore, get_blob_store, new_spool
+from .imaging import sniff_mime_type
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class UploadRejected(ValueError):
+    """An upload the API refuses; `status_code` is the HTTP status to answer with."""
+    status_code = 400
+
+class UploadTooLarge(UploadRejected):
+    status_code = 413
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"The image is larger than the {max_bytes // (1024 * 1024)} MiB limit.")
+
+class UnsupportedImageType(UploadRejected):
+    status_code = 415
+
+    def __init__(self, detected: Optional[str]):
+        allowed = ", ".join(settings.UPLOAD_ALLOWED_TYPES)
+        found = detected or "not a recognised image"
+        super().__init__(f"Unsupported image format ({found}); expected one of: {allowed}.")
+
+def _reject(error: UploadRejected, reason: str) -> UploadRejected:
+    metrics.inc("genprompt_uploads_rejected_total", reason=reason)
+    logger.info("Rejected upload: %s", error)
+    return error
+
+def ingest_stream(
+    source: IO[bytes],
+    size_hint: Optional[int] = None,
+    store: Optional[BlobStore] = None,
+    max_bytes: Optional[int] = None,
+) -> Blob:
+    """
+    Reads an image upload into the blob store, hashing while reading. Raises
+    `UploadTooLarge` or `UnsupportedImageType` before the rest of the stream
+    is read. Blocking; call it through `run_blocking` from async code.
+    """
+    store = get_blob_store() if store is None else store
+    max_bytes = settings.UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    if size_hint is not None and size_hint > max_bytes:
+        raise _reject(UploadTooLarge(max_bytes), "too_large")
+
+    chunk = source.read(COPY_CHUNK_BYTES)
+    detected = sniff_mime_type(chunk)
+    if detected not in settings.UPLOAD_ALLOWED_TYPES:
+        raise _reject(UnsupportedImageType(detected), "unsupported_type")
+
+    hasher = hashlib.sha256()
+    chunks: List[bytes] = []
+    spool: Optional[IO[bytes]] = None
+    total = 0
+    try:
+        while chunk:
+            total += len(chunk)
+            if total > max_bytes:
+                raise _reject(UploadTooLarge(max_bytes), "too_large")
+            hasher.update(chunk)
+            if spool is None and total > store.memory_max_bytes:
+                # Too big to keep in memory: move what was read so far to a temporary file.
+                spool = new_spool()
+                spool.writelines(chunks)
+                chunks.clear()
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                chunks.append(chunk)
+            chunk = source.read(COPY_CHUNK_BYTES)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+        raise
+
+    metrics.inc("genprompt_upload_bytes_total", total, type=detected)
+    if spool is not None:
+        return store.put_spool(spool, hasher.hexdigest())
+    return store.put_bytes(chunks[0] if len(chunks) == 1 else b"".join(chunks), hasher.hexdigest())
@@ -0,0 +1,211 @@
+# File: src/core/jobs.py
+# Background graph execution: a bounded worker pool with job retention and dedup.
+#
+# `POST /api/jobs` queues a graph run and returns at once; clients poll
+# `GET /api/jobs/{id}`. The pool serves /jobs only: the synchronous routes run
+# their graphs inline (see `pipeline.run_graph`), so they never wait behind
+# background jobs. Both share LLM capacity through the scheduler, whose
+# priorities put interactive calls ahead of background and batch ones.
+# Finished jobs are kept for GENPROMPT_JOB_TTL_SECONDS, and a submission whose
+# input hash matches a queued, running or successful job returns that job
+# instead of running the graph again.
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ..config import settings
+from .blobstore import Blob
+from .cache import LRUCache
+from .metrics import metrics
+from .pipeline import finish_run, release_blobs, result_error, serialize_state
+from .scheduler import Priority, set_priority
+from .tracing import add_queue_wait
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ("stage1", "stage2", "refine", "full")
+
+class JobQueueFull(RuntimeError):
+    """Raised when the job queue already holds GENPROMPT_JOB_QUEUE_MAX jobs."""
+
+def job_input_hash(kind: str, image: Optional[Blob], **fields: Any) -> str:
+    """A stable hash of everything that determines a job's result."""
+    payload = {
+        "kind": kind,
+        "image": image.digest if image is not None else None,
+        "fields": fields,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+@dataclass
+class Job:
+    """One queued graph run and, once finished, its result."""
+
+    kind: str
+    prompt_type: str
+    initial_state: Optional[Dict[str, Any]]
+    input_hash: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # Internal: the context the graph runs in (tracing, priorities).
+    context: Optional[contextvars.Context] = field(default=None, repr=False)
+
+    def to_status(self) -> Dict[str, Any]:
+        """The public `JobStatus` payload."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+class JobManager:
+    """
+    Runs graph jobs on `workers` asyncio worker tasks fed by a bounded queue.
+    Workers start lazily on the first submission, inside the running event loop.
+    """
+
+    def __init__(self, graph: Any, workers: int, queue_max: int, ttl_seconds: float, max_entries: int):
+        self.graph = graph
+        self.workers = workers
+        self.queue_max = queue_max
+        self._jobs = LRUCache(max_entries, ttl_seconds)
+        self._by_hash = LRUCache(max_entries, ttl_seconds)
+        self._queue: Optional["asyncio.Queue[Job]"] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    def _ensure_workers(self) -> "asyncio.Queue[Job]":
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_max)
+            self._tasks = [asyncio.create_task(self._worker(n), name=f"genprompt-job-worker-{n}") for n in range(self.workers)]
+            logger.info("Started %d job workers.", self.workers)
+        return self._queue
+
+    def _enqueue(self, job: Job) -> None:
+        try:
+            self._ensure_workers().put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.inc("genprompt_jobs_rejected_total", kind=job.kind)
+            raise JobQueueFull(f"The job queue is full ({self.queue_max} jobs).")
+        metrics.inc("genprompt_jobs_submitted_total", kind=job.kind)
+
+    def submit(self, kind: str, initial_state: Dict[str, Any], prompt_type: str, input_hash: Optional[str] = None) -> Job:
+        """
+        Queues a background job and returns it. When `input_hash` matches a job
+        that is queued, running or succeeded, that job is returned instead.
+        Raises JobQueueFull when the queue is at capacity.
+        """
+        if input_hash is not None:
+            existing_id = self._by_hash.get(input_hash)
+            existing = self._jobs.get(existing_id) if existing_id else None
+            if existing is not None and existing.status != "failed":
+                metrics.inc("genprompt_jobs_deduplicated_total", kind=kind)
+                return existing
+
+        # Background jobs start from a clean context (they outlive the request that
+        # queued them) and yield LLM capacity to interactive requests.
+        context = contextvars.Context()
+        context.run(set_priority, Priority.BACKGROUND)
+        job = Job(kind, prompt_type, initial_state, input_hash, context=context)
+        self._enqueue(job)
+        self._jobs.set(job.id, job)
+        if input_hash is not None:
+            self._by_hash.set(input_hash, job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def _worker(self, worker_number: int) -> None:
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                await self._run(job)
+            finally:
+                queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.started_at = time.time()
+        try:
+            job.status = "running"
+            queue_wait = job.started_at - job.created_at
+            metrics.observe("genprompt_job_queue_wait_seconds", queue_wait, kind=job.kind)
+            result_state = await asyncio.create_task(self._run_graph(job, queue_wait), context=job.context)
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise  # The worker itself is being stopped.
+            job.status, job.error = "failed", "cancelled"
+        except Exception as e:
+            logger.error("Job %s (%s) failed: %s", job.id, job.kind, e, exc_info=True)
+            job.status, job.error = "failed", str(e)
+        else:
+            job.error = result_error(result_state, job.prompt_type)
+            job.status = "failed" if job.error else "succeeded"
+            job.result = serialize_state(result_state)
+        finally:
+            job.finished_at = time.time()
+            release_blobs(job.initial_state)
+            job.initial_state = None
+            job.context = None
+            metrics.inc("genprompt_jobs_finished_total", kind=job.kind, status=job.status)
+            metrics.observe("genprompt_job_duration_seconds", job.finished_at - job.started_at, kind=job.kind)
+            self._jobs.set(job.id, job)  # Retention counts from completion.
+
+    async def _run_graph(self, job: Job, queue_wait: float) -> Dict[str, Any]:
+        add_queue_wait(queue_wait)
+        result_state = await self.graph.ainvoke(job.initial_state)
+        return await finish_run(result_state, job.prompt_type)
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def close(self) -> None:
+        """Stops the workers; queued jobs are abandoned."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._queue = [], None
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+def get_job_manager() -> JobManager:
+    """Returns the process-wide job manager (workers start on first use)."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                from .graph import get_compiled_graph
+
+                _manager = JobManager(
+                    graph=get_compiled_graph(),
+                    workers=settings.JOB_WORKERS,
+                    queue_max=settings.JOB_QUEUE_MAX,
+                    ttl_seconds=settings.JOB_TTL_SECONDS,
+                    max_entries=settings.JOB_MAX_ENTRIES,
+                )
+    return _manager
+
+async def close_job_manager() -> None:
+    global _manager
+    manager, _manager = _manager, None
+    if manager is not None:
+        await manager.close()
@@ -0,0 +1,105 @@
+# File: src/core/llm.py
+# The single place where agents hand work to a LangChain chat model.
+
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from ..config import settings
+from .circuit import CircuitOpen, get_circuit
+from .concurrency import run_blocking
+from .deadline import DeadlineExceeded, deadline_scope
+from .hedging import get_hedger
+from .scheduler import Permit, SchedulerSaturated, estimate_call_tokens, get_scheduler
+from .tracing import current_node, record_usage, span
+
+logger = logging.getLogger(__name__)
+
+# The limits on calling a model at all, rather than failures of the model.
+# Agents re-raise these instead of degrading, so the API answers 503 / 504.
+UNAVAILABLE_ERRORS = (SchedulerSaturated, CircuitOpen, DeadlineExceeded)
+
+def _unwrap(response: Any) -> Any:
+    """
+    Structured models are built with `include_raw=True` so token usage stays
+    visible; this returns the parsed object and surfaces parsing errors.
+    """
+    if isinstance(response, dict) and "parsed" in response and "raw" in response:
+        if response.get("parsing_error") is not None:
+            raise response["parsing_error"]
+        return response["parsed"]
+    return response
+
+def _usage(response: Any) -> Optional[Dict[str, Any]]:
+    raw = response.get("raw") if isinstance(response, dict) else response
+    return getattr(raw, "usage_metadata", None)
+
+async def _call(model: Any, model_input: Any) -> Any:
+    if settings.LLM_ASYNC_ENABLED:
+        return await model.ainvoke(model_input)
+    return await run_blocking(model.invoke, model_input)
+
+async def _timed_call(model: Any, model_input: Any) -> Tuple[Any, float]:
+    started = time.monotonic()
+    response = await _call(model, model_input)
+    return response, time.monotonic() - started
+
+async def _attempt(model: Any, model_input: Any, tokens: int, permit: Optional[Permit]) -> Tuple[Any, float]:
+    """
+    One call to the model, holding a scheduler permit (acquired here unless
+    given). Returns the response and how long the model call itself took.
+    """
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return await _timed_call(model, model_input)
+    async with scheduler.slot(tokens, permit) as held:
+        response, seconds = await _timed_call(model, model_input)
+        usage = _usage(response)
+        if usage:
+            held.used_tokens = int(usage.get("total_tokens") or 0)
+        return response, seconds
+
+async def ainvoke_model(
+    model: Any,
+    model_input: Any,
+    *,
+    model_id: Optional[str] = None,
+    image_bytes: int = 0,
+    image_tokens: int = 0,
+) -> Any:
+    """
+    Invokes a LangChain runnable without blocking the event loop.
+
+    Uses the native `ainvoke` by default. When async calls are disabled via
+    `GENPROMPT_LLM_ASYNC=false`, the synchronous `invoke` runs in the bounded
+    blocking thread pool instead. Every call:
+      * takes a permit from the shared scheduler (which may raise SchedulerSaturated);
+      * runs under the request's deadline (raising DeadlineExceeded when it passes);
+      * may be hedged with a duplicate call when it is slower than usual;
+      * fails at once with CircuitOpen while the model's circuit is open;
+      * is recorded as an `llm` span with latency, tokens, image bytes and retries.
+    """
+    model_id = model_id or getattr(model, "model_name", None) or "unknown"
+    tokens = estimate_call_tokens(model_input, image_tokens)
+    circuit = get_circuit(model_id)
+    trial = circuit.before_call() if circuit is not None else False
+    succeeded: Optional[bool] = None
+    try:
+        with span("llm", "llm", model=model_id, image_bytes=image_bytes) as llm_span:
+            async with deadline_scope():
+                response = await get_hedger().call(
+                    (current_node() or "none", model_id),
+                    tokens,
+                    lambda permit: _attempt(model, model_input, tokens, permit),
+                )
+            succeeded = True
+            record_usage(llm_span, _usage(response))
+            return _unwrap(response)
+    except (DeadlineExceeded, SchedulerSaturated):
+        raise  # Our own limits, not a verdict on the model
+    except Exception:
+        succeeded = succeeded or False  # A response that fails to parse still means the model answered
+        raise
+    finally:
+        if circuit is not None:
+            circuit.after_call(succeeded, trial)
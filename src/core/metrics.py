@@ -0,0 +1,97 @@
+# File: src/core/metrics.py
+# A tiny in-process metrics registry (counters and histograms keyed by labels)
+# with a Prometheus text-format renderer for the /metrics endpoint.
+
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+# Latency buckets in seconds, from fast cache hits to slow vision calls.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+def _labels(labels: Dict[str, object]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: LabelSet, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+class _Histogram:
+    __slots__ = ("bucket_counts", "count", "total")
+
+    def __init__(self, size: int):
+        self.bucket_counts: List[int] = [0] * size
+        self.count = 0
+        self.total = 0.0
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms (count, sum, buckets) for the whole process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, _Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels: object) -> None:
+        """Adds `value` to the counter `name` for the given labels."""
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        """Records one observation of `value` (usually seconds) in the histogram `name`."""
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(DEFAULT_BUCKETS))
+            index = bisect.bisect_left(DEFAULT_BUCKETS, value)
+            if index < len(DEFAULT_BUCKETS):
+                histogram.bucket_counts[index] += 1
+            histogram.count += 1
+            histogram.total += value
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Returns a copy of every series, suitable for logging or JSON."""
+        with self._lock:
+            return {
+                "counters": {name: dict(series) for name, series in self._counters.items()},
+                "histograms": {
+                    name: {key: (h.count, h.total) for key, h in series.items()}
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """Renders every series in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, bucket_count in zip(DEFAULT_BUCKETS, histogram.bucket_counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.total:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+metrics = MetricsRegistry()
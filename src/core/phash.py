@@ -0,0 +1,153 @@
+# File: src/core/phash.py
+# Perceptual hashing and a near-duplicate index for uploaded images.
+#
+# The exact analysis cache keys on the SHA-256 of the upload, so the same
+# picture re-saved, resized or re-compressed misses it. A 64-bit difference
+# hash (dHash) survives those edits: near-identical images differ in only a
+# few bits. `NearDuplicateIndex` keeps the hashes of analysed images in a
+# BK-tree, so finding an earlier image within a Hamming distance is a
+# logarithmic-ish walk rather than a scan.
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from ..config import settings
+from .blobstore import Blob
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8  # 8x8 gradient bits -> a 64-bit hash
+# Hashes with fewer set (or unset) bits than this come from nearly flat images,
+# which all hash alike; they are never matched.
+MIN_INFORMATIVE_BITS = 4
+
+def dhash(blob: Blob) -> Optional[int]:
+    """
+    64-bit difference hash: the image is shrunk to 9x8 grayscale and each bit
+    records whether a pixel is brighter than its right-hand neighbour.
+    Returns None for undecodable images. Blocking; run it in the thread pool.
+    """
+    try:
+        with blob.open() as source, Image.open(source) as image:
+            image.draft("L", (HASH_SIZE * 16, HASH_SIZE * 16))  # JPEG: decode at reduced scale
+            small = ImageOps.exif_transpose(image).convert("L").resize(
+                (HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS
+            )
+    except Exception as e:
+        logger.warning("Perceptual hash failed: %s", e)
+        return None
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def is_informative(value: int) -> bool:
+    return MIN_INFORMATIVE_BITS <= value.bit_count() <= HASH_SIZE * HASH_SIZE - MIN_INFORMATIVE_BITS
+
+class BKTree:
+    """A Burkhard-Keller tree over 64-bit hashes under the Hamming distance."""
+
+    def __init__(self):
+        # node: (hash, value, children keyed by distance to the node's hash)
+        self._root: Optional[Tuple[int, str, Dict[int, tuple]]] = None
+        self._size = 0
+
+    def add(self, value_hash: int, value: str) -> None:
+        if self._root is None:
+            self._root = (value_hash, value, {})
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming(value_hash, node[0])
+            if distance == 0:
+                return  # Already indexed; keep the earlier entry.
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value_hash, value, {})
+                self._size += 1
+                return
+            node = child
+
+    def search(self, value_hash: int, max_distance: int) -> Iterator[Tuple[int, str]]:
+        """Yields every (distance, value) within `max_distance` of `value_hash`."""
+        if self._root is None:
+            return
+        pending = [self._root]
+        while pending:
+            node_hash, value, children = pending.pop()
+            distance = hamming(value_hash, node_hash)
+            if distance <= max_distance:
+                yield distance, value
+            # Triangle inequality: only subtrees at |d - distance| <= max_distance can match.
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    pending.append(child)
+
+    def __len__(self) -> int:
+        return self._size
+
+class NearDuplicateIndex:
+    """
+    Maps perceptual hashes of analysed images to their SHA-256 digests, from
+    which the analysis cache key is rebuilt (so a template change still
+    invalidates near-duplicate hits).
+    Holds at most `max_entries` hashes; past that, the oldest half is dropped
+    and the tree rebuilt (BK-trees do not support removal).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, str]" = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def add(self, value_hash: int, digest: str) -> None:
+        if not is_informative(value_hash):
+            return
+        with self._lock:
+            if value_hash in self._entries:
+                return
+            self._entries[value_hash] = digest
+            self._tree.add(value_hash, digest)
+            if len(self._entries) > self.max_entries:
+                for _ in range(len(self._entries) - self.max_entries // 2):
+                    self._entries.popitem(last=False)
+                self._tree = BKTree()
+                for kept_hash, kept_digest in self._entries.items():
+                    self._tree.add(kept_hash, kept_digest)
+
+    def nearest(self, value_hash: int, max_distance: int) -> Optional[Tuple[int, str]]:
+        """The closest indexed (distance, image digest) within `max_distance`, if any."""
+        if not is_informative(value_hash):
+            return None
+        with self._lock:
+            matches: List[Tuple[int, str]] = list(self._tree.search(value_hash, max_distance))
+        return min(matches, key=lambda match: match[0]) if matches else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+_index: Optional[NearDuplicateIndex] = None
+_index_lock = threading.Lock()
+
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """Returns the process-wide index, or None when near-duplicate reuse is disabled."""
+    global _index
+    if not settings.NEAR_DUPLICATE_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = NearDuplicateIndex(settings.NEAR_DUPLICATE_MAX_ENTRIES)
+    return _index
@@ -0,0 +1,272 @@
+# File: src/core/pipeline.py
+# Helpers shared by every entry point that runs the GenPrompt graph: building
+# initial states (optionally seeded from a server-side session), saving and
+# cleaning results, and streaming graph progress as SSE.
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from ..config import settings
+from .blobstore import Blob, get_blob_store
+from .circuit import CircuitOpen
+from .deadline import DeadlineExceeded, check_deadline
+from .hedging import disable_hedging
+from .scheduler import Priority, SchedulerSaturated, set_priority
+from .schemas import AppState, ImagePrompt, RefineRequest, VideoCreativeBrief
+from .sessions import SessionNotFoundError, get_session_store
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Nodes whose progress is reported to streaming clients.
+GRAPH_NODES = ("visual_analyst", "prompt_engineer", "prompt_composer", "video_director", "refiner")
+
+# State fields holding blob store ids; the blobs are released once a run finishes.
+BLOB_FIELDS = ("original_image", "generated_image")
+
+async def open_session(session_id: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Loads the session `session_id`, or starts a new, empty one when no id is given.
+    Raises SessionNotFoundError for unknown or expired ids.
+    """
+    store = get_session_store()
+    if not session_id:
+        return store.new_id(), {}
+    session = await store.get(session_id)
+    if session is None:
+        raise SessionNotFoundError(session_id)
+    return session_id, session
+
+def _session_state(session_id: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a stored session that seed the next graph run."""
+    return {
+        "session_id": session_id,
+        "visual_analysis": session.get("visual_analysis"),
+        "image_prompt": session.get("image_prompt"),
+        "video_prompt": session.get("video_prompt"),
+        "prompt_history": session.get("prompt_history", []),
+    }
+
+def stage1_state(
+    image: Blob,
+    prompt_history: Optional[List[str]] = None,
+    session_id: Optional[str] = None,
+    session: Optional[Dict[str, Any]] = None,
+    prompt_mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Initial graph state for Stage 1 (image → Prompt A); see AppState.prompt_mode."""
+    seed = _session_state(session_id, session) if session_id else {}
+    if not seed.get("prompt_history"):
+        seed["prompt_history"] = prompt_history or []
+    return AppState(original_image=image.id, prompt_mode=prompt_mode, **seed).model_dump(exclude_none=True)
+
+def stage2_state(
+    image: Optional[Blob],
+    creative_brief: VideoCreativeBrief,
+    session_id: Optional[str] = None,
+    session: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Initial graph state for Stage 2 (image + brief → Prompt B). Without an
+    image, the session's visual analysis is used instead; raises ValueError
+    when neither is available.
+    """
+    seed = _session_state(session_id, session) if session_id else {"prompt_history": []}
+    if image is None and not seed.get("visual_analysis"):
+        raise ValueError("Upload an image, or use a session that already has a visual analysis.")
+    return AppState(
+        generated_image=image.id if image is not None else None,  # Use the correct key for Stage 2
+        video_creative_brief=creative_brief,
+        **seed,
+    ).model_dump(exclude_none=True)
+
+def full_state(
+    image: Blob,
+    creative_brief: Optional[VideoCreativeBrief] = None,
+    session_id: Optional[str] = None,
+    session: Optional[Dict[str, Any]] = None,
+    prompt_mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Initial graph state for the single-pass pipeline: one visual analysis,
+    then Prompt A and Prompt B in parallel branches.
+    """
+    seed = _session_state(session_id, session) if session_id else {"prompt_history": []}
+    seed.pop("visual_analysis", None)  # This image gets a fresh analysis.
+    return AppState(
+        original_image=image.id,
+        video_creative_brief=creative_brief,
+        pipeline_mode="full",
+        prompt_mode=prompt_mode,
+        **seed,
+    ).model_dump(exclude_none=True)
+
+def refine_state(
+    request: RefineRequest,
+    session_id: Optional[str] = None,
+    session: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Initial graph state for refining Prompt A or Prompt B. With a session, the
+    prompt, its type and the history come from the server instead of the client.
+    Raises ValueError when there is nothing to refine.
+    """
+    seed = _session_state(session_id, session) if session_id else {"prompt_history": []}
+    prompt_type = request.active_prompt_type or (session or {}).get("last_prompt_type")
+    if prompt_type is None:
+        raise ValueError("The session has no prompt to refine yet.")
+
+    if request.prompt_to_refine is not None:
+        if prompt_type == "image":
+            seed["image_prompt"] = ImagePrompt(prompt_body=request.prompt_to_refine)
+        else:
+            seed["video_prompt"] = request.prompt_to_refine
+    elif not seed.get("image_prompt" if prompt_type == "image" else "video_prompt"):
+        raise ValueError(f"The session has no {prompt_type} prompt to refine.")
+
+    return AppState(
+        user_feedback=request.user_feedback,
+        active_prompt_for_refinement=prompt_type,
+        refine_deterministic=request.deterministic or None,
+        refine_num_candidates=request.num_candidates if request.num_candidates > 1 else None,
+        **seed,
+    ).model_dump(exclude_none=True)
+
+async def finish_run(result_state: Dict[str, Any], prompt_type: str) -> Dict[str, Any]:
+    """
+    Saves the result into its session (if any), queues a successful run's
+    prompt for the similar-prompt index and strips the image blob ids.
+    """
+    result_state = clean_result(result_state)
+    session_id = result_state.get("session_id")
+    if session_id:
+        await get_session_store().save(session_id, {**result_state, "last_prompt_type": prompt_type})
+    if settings.PROMPT_INDEX_ENABLED and result_error(result_state, prompt_type) is None:
+        from .prompt_index import index_result  # NumPy loads on the first finished run, not at import
+
+        index_result(result_state, prompt_type)
+    return result_state
+
+async def run_graph(graph: Any, initial_state: Dict[str, Any], prompt_type: str) -> Dict[str, Any]:
+    """
+    Runs the graph inline in the calling task for the synchronous routes and
+    returns the finished (saved and cleaned) state; the state's blobs are
+    released either way. The run keeps the caller's trace, priority and
+    deadline and is cancelled with it. It does not use the /jobs worker pool,
+    so GENPROMPT_JOB_WORKERS does not bound it: the LLM scheduler's admission does.
+    """
+    try:
+        return await finish_run(await graph.ainvoke(initial_state), prompt_type)
+    finally:
+        release_blobs(initial_state)
+
+def result_error(result_state: Dict[str, Any], prompt_type: str) -> Optional[str]:
+    """
+    Detects runs that completed but produced no usable prompt (the agents log
+    and swallow their own errors). Returns a reason, or None when the run succeeded.
+    """
+    if prompt_type == "video":
+        return None if result_state.get("video_prompt") else "No video prompt was generated."
+    analysis = result_state.get("visual_analysis")
+    main_subject = analysis.get("main_subject") if isinstance(analysis, dict) else getattr(analysis, "main_subject", None)
+    if main_subject == "Analysis failed":
+        return "Visual analysis failed."
+    if not result_state.get("image_prompt"):
+        return "No image prompt was generated."
+    return None
+
+async def fan_out(
+    items: Sequence[T],
+    worker: Callable[[T], Awaitable[R]],
+    concurrency: int,
+) -> AsyncIterator[Tuple[int, Optional[R], Optional[Exception]]]:
+    """
+    Runs `worker` over `items` with at most `concurrency` in flight and yields
+    `(index, result, error)` in completion order. One failure never cancels the rest.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index: int, item: T):
+        async with semaphore:
+            try:
+                return index, await worker(item), None
+            except Exception as e:
+                return index, None, e
+
+    tasks = [asyncio.create_task(run_one(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def clean_result(result_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Drops the image blob ids from a graph result before it leaves the API."""
+    for field in BLOB_FIELDS:
+        result_state.pop(field, None)
+    return result_state
+
+def release_blobs(state: Optional[Dict[str, Any]]) -> None:
+    """Releases the image blobs a graph run's initial state refers to."""
+    if not state:
+        return
+    store = get_blob_store()
+    for field in BLOB_FIELDS:
+        store.release(state.get(field))
+
+def serialize_state(result_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the JSON-ready, `AppState`-shaped payload for a graph result."""
+    return AppState.model_validate(clean_result(dict(result_state))).model_dump(mode="json")
+
+def format_sse(event: str, data: Any) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_graph_sse(
+    graph: Any,
+    initial_state: Dict[str, Any],
+    prompt_type: str,
+    priority: Priority = Priority.STANDARD,
+) -> AsyncIterator[str]:
+    """
+    Runs the graph with `astream_events` and yields SSE frames:
+    `node_start` / `node_end` as agents run, `token` for each streamed chunk of
+    prompt text, then a single `final` event carrying the `AppState` payload.
+    LLM calls are scheduled at `priority` and are never hedged, since both
+    attempts would stream tokens.
+    """
+    set_priority(priority)  # The response body runs in its own task.
+    disable_hedging()
+    try:
+        # Each LLM call enforces the deadline itself; a scope here would span
+        # the `yield`s and cancel the consumer instead of the graph.
+        async for event in graph.astream_events(initial_state, version="v2"):
+            check_deadline()
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+
+            if kind == "on_chat_model_stream":
+                text = event["data"]["chunk"].content
+                if isinstance(text, str) and text:
+                    yield format_sse("token", {"node": node, "text": text})
+            elif kind in ("on_chain_start", "on_chain_end") and event["name"] in GRAPH_NODES and node == event["name"]:
+                yield format_sse("node_start" if kind == "on_chain_start" else "node_end", {"node": node})
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                result_state = await finish_run(dict(event["data"]["output"]), prompt_type)
+                yield format_sse("final", serialize_state(result_state))
+    except (SchedulerSaturated, CircuitOpen) as e:
+        logger.warning("Streaming run rejected by the LLM scheduler or an open circuit: %s", e)
+        yield format_sse("error", {"detail": str(e), "retry_after": e.retry_after})
+    except DeadlineExceeded as e:
+        logger.warning("Streaming run cancelled at its deadline: %s", e)
+        yield format_sse("error", {"detail": str(e)})
+    except Exception as e:
+        logger.error("Error while streaming graph events: %s", e, exc_info=True)
+        yield format_sse("error", {"detail": "An internal server error occurred."})
+    finally:
+        release_blobs(initial_state)
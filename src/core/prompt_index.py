@@ -0,0 +1,417 @@
+# File: src/core/prompt_index.py
+# A local vector index over generated prompts, for "similar prompt" suggestions.
+#
+# Every finished Prompt A / Prompt B is embedded together with the visual
+# analysis it was written from and appended to an index directory:
+#   * records.jsonl           — prompt, kind, analysis and timestamp, one JSON line per entry;
+#   * rows.bin                — a fixed-size (key, kind, created_at) row per entry, for dedupe and filters;
+#   * vectors-<embedder>.f32  — the unit-length embeddings, memory-mapped.
+# A query is one matrix-vector product over the mapped vectors (cosine
+# similarity, as every row has unit length) and an `argpartition` top-k, done in
+# blocks so memory stays flat however large the index grows.
+#
+# Embeddings come from a pluggable `Embedder`. The default hashes words and word
+# pairs into a fixed-size vector: no network, deterministic across processes.
+# Switching embedders re-embeds the stored records into a new vectors file.
+
+import abc
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Stored as 1 and 2 in the row's `kind` field.
+KINDS = ("image", "video")
+ROW_DTYPE = np.dtype([("key", "<u8"), ("kind", "u1"), ("created_at", "<f8")])
+# Rows scored per matrix-vector product; bounds the temporary score array.
+SEARCH_BLOCK_ROWS = 131072
+INITIAL_CAPACITY = 1024
+REBUILD_BATCH_SIZE = 4096
+
+# (prompt, kind, visual analysis as a dict or None)
+Entry = Tuple[str, str, Optional[Dict[str, Any]]]
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+def prompt_key(prompt: str) -> int:
+    """Identity of a prompt for dedupe; case and whitespace are ignored."""
+    return _hash64(" ".join(prompt.lower().split()))
+
+def analysis_text(analysis: Optional[Dict[str, Any]]) -> str:
+    """The visual analysis fields as one line of text, for embedding."""
+    if not analysis:
+        return ""
+    parts = []
+    for value in analysis.values():
+        if isinstance(value, list):
+            parts.extend(str(item) for item in value)
+        elif value:
+            parts.append(str(value))
+    return ". ".join(parts)
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scales each row to unit length; all-zero rows are left as they are."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+class Embedder(abc.ABC):
+    """Turns texts into unit-length float32 vectors of `dim` dimensions. `name` identifies the vector space."""
+
+    name = "embedder"
+    dim = 0
+
+    @abc.abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """One row per text, shape (len(texts), dim)."""
+
+class HashingEmbedder(Embedder):
+    """
+    Feature hashing of lower-cased words and adjacent word pairs: each feature
+    adds +1 or -1 to one of `dim` buckets, both chosen by a stable hash of the
+    feature. Offline and deterministic; similarity is word and phrase overlap.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing{dim}"
+        # Prompt vocabularies are small and repetitive, so most features are hashed once.
+        self._signed_bucket = functools.lru_cache(maxsize=1 << 18)(self._hash_feature)
+
+    def _hash_feature(self, feature: str) -> int:
+        """The feature's bucket plus one, negated when the feature counts -1."""
+        value = _hash64(feature)
+        bucket = value % self.dim + 1
+        return bucket if value >> 63 else -bucket
+
+    @staticmethod
+    def features(text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        rows: List[int] = []
+        signed: List[int] = []
+        for row, text in enumerate(texts):
+            buckets = [self._signed_bucket(feature) for feature in self.features(text)]
+            rows.extend([row] * len(buckets))
+            signed.extend(buckets)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        signed_array = np.asarray(signed, dtype=np.int64)
+        np.add.at(vectors, (np.asarray(rows, dtype=np.intp), np.abs(signed_array) - 1), np.sign(signed_array).astype(np.float32))
+        return normalize(vectors)
+
+class OpenAIEmbedder(Embedder):
+    """Embeddings from the OpenAI API; every add and every query is a network call."""
+
+    def __init__(self, model: str, dim: int):
+        from langchain_openai import OpenAIEmbeddings  # Only needed when this embedder is configured
+
+        self.dim = dim
+        self.name = f"openai-{model}-{dim}"
+        self._client = OpenAIEmbeddings(
+            model=model,
+            dimensions=dim,
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None,
+        )
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return normalize(np.asarray(self._client.embed_documents(list(texts)), dtype=np.float32))
+
+def make_embedder(name: str, dim: int) -> Embedder:
+    """The embedder configured as `GENPROMPT_PROMPT_INDEX_EMBEDDER` ("hashing" or "openai")."""
+    if name == "hashing":
+        return HashingEmbedder(dim)
+    if name == "openai":
+        return OpenAIEmbedder(settings.PROMPT_INDEX_OPENAI_MODEL, dim)
+    raise ValueError(f"Unknown prompt index embedder: {name!r}")
+
+class PromptIndex:
+    """
+    An append-only, on-disk index of prompts with cosine top-k search. Without
+    a `directory` it lives in a temporary directory for the life of the process.
+    Writes are serialised; searches run concurrently with them and see every
+    entry added before they started. All methods are blocking.
+    """
+
+    def __init__(self, directory: Optional[str], embedder: Embedder):
+        self._tempdir: Optional[tempfile.TemporaryDirectory] = None
+        if not directory:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="genprompt-prompt-index-")
+            directory = self._tempdir.name
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.embedder = embedder
+        self._records_path = os.path.join(directory, "records.jsonl")
+        self._rows_path = os.path.join(directory, "rows.bin")
+        self._vectors_path = os.path.join(directory, f"vectors-{embedder.name}.f32")
+        self._lock = threading.Lock()  # Guards the snapshot state below
+        self._write_lock = threading.Lock()  # Serialises add_many
+        self._count = 0
+        self._capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._kinds = np.zeros(0, dtype=np.uint8)
+        self._offsets = array("q")
+        self._keys: set = set()
+        self._load()
+
+    # --- Loading ---
+
+    def _load(self) -> None:
+        if os.path.exists(self._records_path):
+            with open(self._records_path, "rb") as records:
+                position = 0
+                for line in records:
+                    if not line.endswith(b"\n"):
+                        break  # A write torn by a crash
+                    self._offsets.append(position)
+                    position += len(line)
+        rows = np.fromfile(self._rows_path, dtype=ROW_DTYPE) if os.path.exists(self._rows_path) else np.zeros(0, ROW_DTYPE)
+        count = min(len(self._offsets), len(rows))
+        del self._offsets[count:]
+        self._truncate(self._records_path, self._record_end(count))
+        self._truncate(self._rows_path, count * ROW_DTYPE.itemsize)
+        self._keys = set(rows["key"][:count].tolist())
+
+        row_bytes = self.embedder.dim * 4
+        mapped_rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+        if mapped_rows >= count and mapped_rows > 0:
+            self._capacity = mapped_rows
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(mapped_rows, self.embedder.dim))
+        self._ensure_capacity(count)
+        self._kinds = np.zeros(self._capacity, dtype=np.uint8)
+        self._kinds[:count] = rows["kind"][:count]
+        if mapped_rows < count:
+            self._rebuild_vectors(count)
+        self._count = count
+        logger.info("Prompt index at %s: %d prompts (%s).", self.directory, count, self.embedder.name)
+
+    def _record_end(self, count: int) -> int:
+        if count == 0:
+            return 0
+        with open(self._records_path, "rb") as records:
+            records.seek(self._offsets[count - 1])
+            return self._offsets[count - 1] + len(records.readline())
+
+    @staticmethod
+    def _truncate(path: str, size: int) -> None:
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, "r+b") as file:
+                file.truncate(size)
+
+    def _rebuild_vectors(self, count: int) -> None:
+        """Embeds the stored records again, for a new embedder or a lost vectors file."""
+        logger.info("Re-embedding %d stored prompts with %s...", count, self.embedder.name)
+        with open(self._records_path, "rb") as records:
+            for start in range(0, count, REBUILD_BATCH_SIZE):
+                batch = [json.loads(records.readline()) for _ in range(min(REBUILD_BATCH_SIZE, count - start))]
+                texts = [self._document(record["prompt"], record.get("visual_analysis")) for record in batch]
+                self._vectors[start:start + len(batch)] = self.embedder.embed(texts)
+        self._vectors.flush()
+
+    def _ensure_capacity(self, rows: int) -> None:
+        """Grows the vectors file (doubling) and the kinds array to hold `rows` entries."""
+        if rows <= self._capacity and self._vectors is not None:
+            return
+        capacity = max(self._capacity, INITIAL_CAPACITY)
+        while capacity < rows:
+            capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self._vectors_path, "ab") as vectors_file:
+            vectors_file.truncate(capacity * self.embedder.dim * 4)
+        # Searches holding the previous mapping and kinds array keep using them safely.
+        vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.embedder.dim))
+        kinds = np.zeros(capacity, dtype=np.uint8)
+        kinds[:self._count] = self._kinds[:self._count]
+        with self._lock:
+            self._vectors, self._kinds, self._capacity = vectors, kinds, capacity
+
+    @staticmethod
+    def _document(prompt: str, analysis: Optional[Dict[str, Any]]) -> str:
+        return f"{prompt}\n{analysis_text(analysis)}"
+
+    # --- Writing ---
+
+    def add_many(self, entries: Sequence[Entry]) -> int:
+        """Appends the entries whose prompt is not indexed yet; returns how many were added."""
+        with self._write_lock:
+            fresh: Dict[int, Entry] = {}
+            for prompt, kind, analysis in entries:
+                key = prompt_key(prompt)
+                if prompt.strip() and key not in self._keys and key not in fresh:
+                    fresh[key] = (prompt, kind, analysis)
+            if not fresh:
+                return 0
+            vectors = self.embedder.embed([self._document(prompt, analysis) for prompt, _, analysis in fresh.values()])
+            start, added = self._count, len(fresh)
+            self._ensure_capacity(start + added)
+
+            now = time.time()
+            rows = np.zeros(added, dtype=ROW_DTYPE)
+            rows["key"] = list(fresh)
+            rows["kind"] = [KINDS.index(kind) + 1 for _, kind, _ in fresh.values()]
+            rows["created_at"] = now
+            lines = [
+                (json.dumps({"prompt": prompt, "kind": kind, "visual_analysis": analysis, "created_at": now}) + "\n").encode("utf-8")
+                for prompt, kind, analysis in fresh.values()
+            ]
+            # Vectors and rows first: an entry only counts once its record line is complete.
+            self._vectors[start:start + added] = vectors
+            self._kinds[start:start + added] = rows["kind"]
+            with open(self._rows_path, "ab") as rows_file:
+                rows_file.write(rows.tobytes())
+            with open(self._records_path, "ab") as records:
+                position = records.tell()
+                records.writelines(lines)
+            offsets = []
+            for line in lines:
+                offsets.append(position)
+                position += len(line)
+
+            with self._lock:
+                self._offsets.extend(offsets)
+                self._keys.update(fresh)
+                self._count = start + added
+            for _, kind, _ in fresh.values():
+                metrics.inc("genprompt_prompt_index_added_total", kind=kind)
+            return added
+
+    def add(self, prompt: str, kind: str, analysis: Optional[Dict[str, Any]] = None) -> bool:
+        return self.add_many([(prompt, kind, analysis)]) == 1
+
+    # --- Searching ---
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        kind: Optional[str] = None,
+        min_score: float = -1.0,
+    ) -> List[Dict[str, Any]]:
+        """
+        The `k` stored prompts most similar to `query` (cosine similarity of the
+        embeddings, best first), optionally of one `kind`. Each result is the
+        stored record plus its `score`.
+        """
+        started = time.perf_counter()
+        vector = self.embedder.embed([query])[0]
+        with self._lock:
+            count, vectors, kinds, offsets = self._count, self._vectors, self._kinds, self._offsets
+        kind_code = KINDS.index(kind) + 1 if kind else 0
+
+        candidate_rows: List[np.ndarray] = []
+        candidate_scores: List[np.ndarray] = []
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, count)
+            scores = vectors[start:stop] @ vector
+            if kind_code:
+                scores[kinds[start:stop] != kind_code] = -np.inf
+            best = np.argpartition(scores, -k)[-k:] if stop - start > k else np.arange(stop - start)
+            candidate_rows.append(best + start)
+            candidate_scores.append(scores[best])
+
+        results: List[Dict[str, Any]] = []
+        if candidate_rows:
+            rows = np.concatenate(candidate_rows)
+            scores = np.concatenate(candidate_scores)
+            order = np.argsort(-scores, kind="stable")[:k]
+            with open(self._records_path, "rb") as records:
+                for row, score in zip(rows[order].tolist(), scores[order].tolist()):
+                    if score == -np.inf or score < min_score:
+                        continue
+                    records.seek(offsets[row])
+                    results.append({**json.loads(records.readline()), "score": round(score, 4)})
+        metrics.observe("genprompt_prompt_index_query_seconds", time.perf_counter() - started)
+        return results
+
+    def flush(self) -> None:
+        with self._write_lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+
+    def __len__(self) -> int:
+        return self._count
+
+_index: Optional[PromptIndex] = None
+_index_lock = threading.Lock()
+# One writer thread: indexing never holds up a response or a blocking-pool worker.
+_writer: Optional[ThreadPoolExecutor] = None
+
+def get_prompt_index() -> Optional[PromptIndex]:
+    """Returns the process-wide prompt index, or None when it is disabled."""
+    global _index, _writer
+    if not settings.PROMPT_INDEX_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                embedder = make_embedder(settings.PROMPT_INDEX_EMBEDDER, settings.PROMPT_INDEX_DIM)
+                _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-index")
+                _index = PromptIndex(settings.PROMPT_INDEX_PATH, embedder)
+    return _index
+
+def _as_dict(value: Any) -> Optional[Dict[str, Any]]:
+    if value is None or isinstance(value, dict):
+        return value
+    return value.model_dump()
+
+def index_result(result_state: Dict[str, Any], prompt_type: str) -> Optional[Future]:
+    """
+    Queues the prompt(s) a successful run produced for indexing, in the
+    background. A full-pipeline run contributes both Prompt A and Prompt B.
+    """
+    index = get_prompt_index()
+    if index is None:
+        return None
+    analysis = _as_dict(result_state.get("visual_analysis"))
+    entries: List[Entry] = []
+    image_prompt = _as_dict(result_state.get("image_prompt"))
+    if prompt_type == "image" and image_prompt:
+        entries.append((image_prompt["prompt_body"], "image", analysis))
+    video_prompt = result_state.get("video_prompt")
+    if video_prompt and (prompt_type == "video" or result_state.get("pipeline_mode") == "full"):
+        entries.append((video_prompt, "video", analysis))
+    if not entries:
+        return None
+    future = _writer.submit(index.add_many, entries)
+    future.add_done_callback(_log_failure)
+    return future
+
+def _log_failure(future: Future) -> None:
+    if future.exception() is not None:
+        logger.error("Indexing a prompt failed: %s", future.exception())
+
+def close_prompt_index() -> None:
+    """Finishes queued writes and flushes the index to disk; called on shutdown."""
+    global _index, _writer
+    with _index_lock:
+        if _writer is not None:
+            _writer.shutdown(wait=True)
+        if _index is not None:
+            _index.close()
+        _index, _writer = None, None
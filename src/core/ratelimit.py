@@ -0,0 +1,58 @@
+# File: src/core/ratelimit.py
+# Async token-bucket rate limiting for requests-per-minute and tokens-per-minute budgets.
+
+import asyncio
+import time
+from typing import Optional
+
+class TokenBucket:
+    """A token bucket refilled continuously at `rate_per_minute`, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate_per_second = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they already are)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # Oversized requests wait for a full bucket.
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate_per_second
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+class AsyncRateLimiter:
+    """
+    Limits callers to `requests_per_minute` and `tokens_per_minute`.
+    A budget of 0 (or None) disables that limit.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, requests: float = 1, tokens: float = 0) -> None:
+        """Waits until both budgets can cover this call, then spends them."""
+        async with self._lock:
+            while True:
+                delay = max(
+                    self.requests.wait_time(requests) if self.requests else 0.0,
+                    self.tokens.wait_time(tokens) if self.tokens and tokens else 0.0,
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            if self.requests:
+                self.requests.take(requests)
+            if self.tokens and tokens:
+                self.tokens.take(tokens)
@@ -0,0 +1,52 @@
+# File: src/core/refine_cache.py
+# In-process cache for deterministic refinements.
+#
+# Common feedback ("make it darker", "more cinematic") repeats constantly. With
+# `deterministic` refinement (temperature 0) the answer for a given prompt,
+# feedback and prompt type is stable, so it is served from this cache instead
+# of a new GPT-4o call. Keys also include the id of the model that wrote the
+# answer (the strong one after an escalation) and a fingerprint of
+# PROMPT_REFINER_SYSTEM_PROMPT and PROMPT_REFINER_TEMPLATE, so changing any of
+# them invalidates old entries.
+
+import hashlib
+import json
+import re
+import threading
+from typing import Optional
+
+from ..config import settings
+from .cache import LRUCache
+from .prompts import PROMPT_REFINER_SYSTEM_PROMPT, PROMPT_REFINER_TEMPLATE
+
+PROMPT_REFINER_TEMPLATE_VERSION = hashlib.sha256(
+    (PROMPT_REFINER_SYSTEM_PROMPT + PROMPT_REFINER_TEMPLATE).encode("utf-8")
+).hexdigest()[:12]
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(text: str) -> str:
+    """Collapses whitespace; the prompt's wording and case are kept as they matter to the model."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+def normalize_feedback(text: str) -> str:
+    """Case- and whitespace-insensitive feedback, without trailing punctuation ("Darker!" == "darker")."""
+    return normalize_prompt(text).lower().rstrip(".!?, ")
+
+def refine_cache_key(prompt: str, feedback: str, prompt_type: str, model_id: str) -> str:
+    payload = [normalize_prompt(prompt), normalize_feedback(feedback), prompt_type, model_id, PROMPT_REFINER_TEMPLATE_VERSION]
+    return hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+
+_cache: Optional[LRUCache] = None
+_cache_lock = threading.Lock()
+
+def get_refine_cache() -> Optional[LRUCache]:
+    """Returns the process-wide refinement cache, or None when caching is disabled."""
+    global _cache
+    if not settings.REFINE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LRUCache(settings.REFINE_CACHE_MAX_ENTRIES, settings.REFINE_CACHE_TTL_SECONDS)
+    return _cache
@@ -0,0 +1,108 @@
+# File: src/core/routing.py
+# Model routing: text-only nodes use a cheap "fast" model for routine work and
+# the flagship "strong" model when the input is large, the feedback is
+# complex, or the fast model's output fails validation.
+#
+# Vision nodes (visual analyst, video director) are not routed. Every decision
+# and escalation is counted, and latency and cost are recorded per tier.
+
+import logging
+import re
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Optional
+
+from ..config import settings
+from .clients import get_chat_model
+from .deadline import remaining
+from .llm import ainvoke_model
+from .metrics import metrics
+from .tracing import estimate_cost
+
+logger = logging.getLogger(__name__)
+
+FAST, STRONG = "fast", "strong"
+
+# Feedback with several instructions ("darker, add rain and make it 35mm") needs the strong model.
+_INSTRUCTION_SEPARATORS = re.compile(r"[,;.!?]|\band\b|\bthen\b|\bbut\b", re.IGNORECASE)
+# Chatty openings mean the model answered instead of writing a prompt.
+_CONVERSATIONAL_OPENING = re.compile(r"^\s*(sure|certainly|of course|here('s| is)|i('m| am| have| can| will)|as an ai)\b", re.IGNORECASE)
+
+@dataclass(frozen=True)
+class RoutingDecision:
+    """The tier and model chosen for one LLM call, and why."""
+    node: str
+    tier: str
+    model: str
+    reason: str
+
+def tier_model(tier: str) -> str:
+    return settings.ROUTING_FAST_LLM_ID if tier == FAST else settings.ROUTING_STRONG_LLM_ID
+
+def feedback_instructions(feedback: Optional[str]) -> int:
+    """Roughly how many separate edits the feedback asks for."""
+    if not feedback:
+        return 0
+    return len([part for part in _INSTRUCTION_SEPARATORS.split(feedback) if part and part.strip()])
+
+def choose_tier(node: str, input_chars: int, feedback: Optional[str] = None) -> RoutingDecision:
+    """
+    Picks the model tier for a text-only node. A request whose deadline is
+    close goes to the fast tier; otherwise large inputs and complex feedback
+    go to the strong tier and routine work to the fast one.
+    """
+    if not settings.ROUTING_ENABLED or node not in settings.ROUTING_NODES:
+        decision = RoutingDecision(node, STRONG, tier_model(STRONG), "not_routed")
+    else:
+        left = remaining()
+        if left is not None and left < settings.ROUTING_FAST_DEADLINE_SECONDS:
+            decision = RoutingDecision(node, FAST, tier_model(FAST), "deadline")
+        elif input_chars > settings.ROUTING_FAST_MAX_INPUT_CHARS:
+            decision = RoutingDecision(node, STRONG, tier_model(STRONG), "input_size")
+        elif feedback is not None and (
+            len(feedback.split()) > settings.ROUTING_FAST_MAX_FEEDBACK_WORDS
+            or feedback_instructions(feedback) > settings.ROUTING_FAST_MAX_INSTRUCTIONS
+        ):
+            decision = RoutingDecision(node, STRONG, tier_model(STRONG), "feedback_complexity")
+        else:
+            decision = RoutingDecision(node, FAST, tier_model(FAST), "routine")
+    metrics.inc("genprompt_routing_decisions_total", node=node, tier=decision.tier, reason=decision.reason)
+    return decision
+
+def escalate(decision: RoutingDecision) -> Optional[RoutingDecision]:
+    """The strong-tier retry for a fast-tier call whose output failed validation, or None."""
+    if decision.tier == STRONG:
+        return None
+    metrics.inc("genprompt_routing_escalations_total", node=decision.node)
+    logger.info("Escalating %s from %s to the strong tier after a failed validation.", decision.node, decision.model)
+    return replace(decision, tier=STRONG, model=tier_model(STRONG), reason="validation_failed")
+
+def validate_prompt_text(text: Optional[str], previous: Optional[str] = None) -> bool:
+    """
+    Cheap checks that a model wrote a usable prompt: long enough, not a chatty
+    reply, not truncated to nothing, and (for refinements) actually changed.
+    """
+    if not text or len(text.strip()) < settings.ROUTING_MIN_OUTPUT_CHARS:
+        return False
+    if _CONVERSATIONAL_OPENING.match(text):
+        return False
+    if previous is not None and text.strip() == previous.strip():
+        return False
+    return True
+
+async def ainvoke_routed(decision: RoutingDecision, temperature: float, model_input: Any) -> Any:
+    """Calls the decision's model and records latency and cost for its tier."""
+    model = get_chat_model(decision.model, temperature=temperature)
+    started = time.perf_counter()
+    response = await ainvoke_model(model, model_input, model_id=decision.model)
+    labels = {"node": decision.node, "tier": decision.tier}
+    metrics.observe("genprompt_routing_tier_duration_seconds", time.perf_counter() - started, **labels)
+    usage = getattr(response, "usage_metadata", None) or {}
+    cost = estimate_cost(
+        decision.model,
+        int(usage.get("input_tokens") or 0),
+        int(usage.get("output_tokens") or 0),
+        int((usage.get("input_token_details") or {}).get("cache_read") or 0),
+    )
+    metrics.inc("genprompt_routing_tier_cost_usd_total", cost, **labels)
+    return response
@@ -0,0 +1,370 @@
+# File: src/core/scheduler.py
+# The shared scheduler in front of every LLM call: budgets, adaptive concurrency and priorities.
+#
+# Each call asks for a permit with its estimated tokens. Permits are granted in
+# priority order (interactive refinement, then interactive generation, then
+# background jobs, then batches) while three limits hold:
+#   * requests- and tokens-per-minute budgets (token buckets, optional);
+#   * an adaptive concurrency limit: AIMD, halved on every 429 and grown by
+#     one per `limit` successful calls, so we back off before the SDK's own
+#     retries pile on;
+#   * pauses learned from OpenAI's `x-ratelimit-*` and `retry-after` headers.
+# When the estimated wait exceeds GENPROMPT_SCHEDULER_MAX_WAIT_SECONDS, or the
+# queue is full, the call is rejected at once with `SchedulerSaturated`, which
+# the API turns into a 503 with a Retry-After header.
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import math
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from ..config import settings
+from .deadline import remaining
+from .metrics import metrics
+from .ratelimit import TokenBucket
+from .tracing import add_queue_wait
+
+logger = logging.getLogger(__name__)
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+
+    INTERACTIVE = 0  # Refinement: a user is waiting on a small edit.
+    STANDARD = 1     # Interactive Stage 1 / Stage 2 generation.
+    BACKGROUND = 2   # Queued jobs from POST /jobs.
+    BATCH = 3        # Batch endpoint and the batch CLI.
+
+class SchedulerSaturated(RuntimeError):
+    """Raised instead of queueing a call that would wait too long; `retry_after` is in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar("genprompt_priority", default=Priority.STANDARD)
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+def set_priority(priority: Priority) -> None:
+    """Sets the priority of LLM calls made from the current context (and tasks it starts)."""
+    _priority.set(priority)
+
+@contextmanager
+def use_priority(priority: Priority) -> Iterator[None]:
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def estimate_call_tokens(model_input: Any, image_tokens: int = 0) -> int:
+    """Rough prompt + completion tokens for budgeting: ~4 characters per text token."""
+    if isinstance(model_input, str):
+        chars = len(model_input)
+    else:
+        chars = 0
+        for message in model_input if isinstance(model_input, list) else [model_input]:
+            content = getattr(message, "content", message)
+            if isinstance(content, str):
+                chars += len(content)
+            elif isinstance(content, list):
+                chars += sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+    return chars // 4 + image_tokens + settings.SCHEDULER_COMPLETION_TOKENS
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parses OpenAI reset durations such as `1s`, `6m0s` or `120ms` into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * _UNIT_SECONDS[unit] for number, unit in parts)
+
+@dataclass
+class Permit:
+    """A granted slot for one LLM call; `rate_limited` is set by the HTTP hook on a 429."""
+
+    priority: Priority
+    tokens: int
+    granted_at: float = 0.0
+    rate_limited: bool = False
+    used_tokens: Optional[int] = None
+    claimed: bool = False  # Set once a call runs under it; unclaimed permits are handed back.
+
+_current_permit: contextvars.ContextVar[Optional[Permit]] = contextvars.ContextVar("genprompt_permit", default=None)
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    tokens: int = field(compare=False)
+    future: "asyncio.Future[None]" = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+
+class LLMScheduler:
+    """
+    Admission control for LLM calls. All state lives on the event loop; only
+    `observe_response` may be called from the blocking pool's threads.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        max_queue: int = 256,
+        max_wait_seconds: float = 20.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.in_flight = 0
+        self.paused_until = 0.0  # time.monotonic() until which OpenAI told us to hold off.
+        self.avg_call_seconds = 2.0
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # --- Admission -----------------------------------------------------------------
+
+    def _budget_wait(self, tokens: int) -> float:
+        now = time.monotonic()
+        return max(
+            self.paused_until - now,
+            self.requests.wait_time(1) if self.requests else 0.0,
+            self.tokens.wait_time(tokens) if self.tokens else 0.0,
+            0.0,
+        )
+
+    def _can_start(self, tokens: int) -> bool:
+        return self.in_flight < int(self.limit) and self._budget_wait(tokens) <= 0
+
+    def _grant(self, tokens: int) -> None:
+        self.in_flight += 1
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+
+    def estimated_wait(self, priority: Priority, tokens: int) -> float:
+        """How long a new call at `priority` would probably queue before starting."""
+        ahead = [w for w in self._waiters if w.priority <= priority and not w.future.done()]
+        budget_wait = max(
+            self.paused_until - time.monotonic(),
+            self.requests.wait_time(len(ahead) + 1) if self.requests else 0.0,
+            self.tokens.wait_time(sum(w.tokens for w in ahead) + tokens) if self.tokens else 0.0,
+            0.0,
+        )
+        slots_busy = max(self.in_flight + len(ahead) + 1 - int(self.limit), 0)
+        concurrency_wait = math.ceil(slots_busy / max(int(self.limit), 1)) * self.avg_call_seconds
+        return max(budget_wait, concurrency_wait)
+
+    def max_wait_for(self, priority: Priority) -> float:
+        """
+        Interactive calls fail fast; background jobs and batches may queue much
+        longer. Never longer than what is left of the request's deadline.
+        """
+        max_wait = self.max_wait_seconds
+        if priority >= Priority.BACKGROUND:
+            max_wait = max(max_wait, settings.SCHEDULER_BACKGROUND_MAX_WAIT_SECONDS)
+        left = remaining()
+        return max_wait if left is None else max(min(max_wait, left), 0.0)
+
+    def is_saturated(self, priority: Optional[Priority] = None, tokens: int = 0) -> bool:
+        """Whether `admit` would currently reject a call at `priority`, without counting a rejection."""
+        priority = current_priority() if priority is None else priority
+        return len(self._waiters) >= self.max_queue or self.estimated_wait(priority, tokens) > self.max_wait_for(priority)
+
+    def admit(self, priority: Optional[Priority] = None, tokens: int = 0) -> None:
+        """Raises SchedulerSaturated if a call at `priority` would currently queue too long."""
+        priority = current_priority() if priority is None else priority
+        wait = self.estimated_wait(priority, tokens)
+        if len(self._waiters) >= self.max_queue or wait > self.max_wait_for(priority):
+            metrics.inc("genprompt_scheduler_rejected_total", priority=priority.name.lower())
+            raise SchedulerSaturated(
+                f"LLM capacity is saturated (about {wait:.0f}s of queued work).", retry_after=min(wait, 300)
+            )
+
+    def try_acquire(self, tokens: int, priority: Optional[Priority] = None) -> Optional[Permit]:
+        """Grants a permit only if one is available right now (used for hedged calls)."""
+        self._loop = asyncio.get_running_loop()
+        if self._waiters or not self._can_start(tokens):
+            return None
+        self._grant(tokens)
+        return Permit(priority=current_priority() if priority is None else priority, tokens=tokens, granted_at=time.monotonic())
+
+    def release_unclaimed(self, permit: Permit) -> None:
+        """Hands back a permit whose call never started (e.g. a hedge cancelled at once)."""
+        if not permit.claimed:
+            permit.claimed = True
+            self._return_slot()
+
+    async def acquire(self, tokens: int, priority: Optional[Priority] = None) -> Permit:
+        """Waits for a permit, or raises SchedulerSaturated if that would take too long."""
+        priority = current_priority() if priority is None else priority
+        self._loop = asyncio.get_running_loop()
+        permit = Permit(priority=priority, tokens=tokens)
+        if not self._waiters and self._can_start(tokens):
+            self._grant(tokens)
+            permit.granted_at = time.monotonic()
+            return permit
+
+        self.admit(priority, tokens)
+        max_wait = self.max_wait_for(priority)
+
+        waiter = _Waiter(int(priority), next(self._sequence), tokens, self._loop.create_future())
+        heapq.heappush(self._waiters, waiter)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._return_slot()  # Granted just as we gave up: hand the slot back unused.
+            else:
+                waiter.future.cancel()
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            metrics.inc("genprompt_scheduler_rejected_total", priority=priority.name.lower())
+            raise SchedulerSaturated("Timed out waiting for LLM capacity.", retry_after=self.estimated_wait(priority, tokens))
+        permit.granted_at = time.monotonic()
+        metrics.observe("genprompt_scheduler_wait_seconds", permit.granted_at - waiter.enqueued_at, priority=priority.name.lower())
+        return permit
+
+    def _dispatch(self) -> None:
+        """Grants permits to queued waiters, highest priority first, while capacity allows."""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        while self._waiters:
+            head = self._waiters[0]
+            if head.future.done():  # Cancelled while queued.
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.limit):
+                return  # A release will dispatch again.
+            wait = self._budget_wait(head.tokens)
+            if wait > 0:
+                self._wakeup = self._loop.call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._grant(head.tokens)
+            head.future.set_result(None)
+
+    def _return_slot(self) -> None:
+        self.in_flight = max(self.in_flight - 1, 0)
+        self._dispatch()
+
+    def release(self, permit: Permit, used_tokens: Optional[int] = None) -> None:
+        """Returns the slot, adapts the concurrency limit and reconciles the token estimate."""
+        self.in_flight = max(self.in_flight - 1, 0)
+        elapsed = time.monotonic() - permit.granted_at
+        if permit.rate_limited:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            metrics.inc("genprompt_scheduler_rate_limited_total")
+            logger.warning("OpenAI rate limit hit; concurrency limit lowered to %d.", int(self.limit))
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.avg_call_seconds += 0.1 * (elapsed - self.avg_call_seconds)
+        if self.tokens and used_tokens is not None:
+            # Refund (or charge) the difference between the estimate and the real usage.
+            self.tokens.tokens = min(self.tokens.capacity, self.tokens.tokens + permit.tokens - used_tokens)
+        if self._loop is not None:
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, permit: Optional[Permit] = None) -> AsyncIterator[Permit]:
+        """
+        Holds a permit for the duration of one LLM call, acquiring one unless
+        `permit` was already granted. The queue wait is charged to the span.
+        """
+        if permit is None:
+            started = time.perf_counter()
+            permit = await self.acquire(tokens)
+            add_queue_wait(time.perf_counter() - started)
+        permit.claimed = True
+        token = _current_permit.set(permit)
+        try:
+            yield permit
+        finally:
+            _current_permit.reset(token)
+            self.release(permit, permit.used_tokens)
+
+    # --- Feedback from OpenAI's response headers (called from httpx hooks) ----------
+
+    def observe_response(self, status_code: int, headers: Any) -> None:
+        """
+        Learns from one HTTP response: a 429 marks the current permit as rate
+        limited and pauses for `retry-after`; an exhausted `x-ratelimit-remaining-*`
+        pauses until the matching reset. May run in a worker thread, so it only
+        makes single-field updates.
+        """
+        now = time.monotonic()
+        pause = 0.0
+        if status_code == 429:
+            permit = _current_permit.get()
+            if permit is not None:
+                permit.rate_limited = True
+            pause = parse_reset(headers.get("retry-after")) or 1.0
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is not None and remaining.isdigit() and int(remaining) == 0:
+                pause = max(pause, parse_reset(headers.get(f"x-ratelimit-reset-{kind}")) or 1.0)
+        # Trust the server's view of the token budget when it is tighter than ours.
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if self.tokens and remaining_tokens and remaining_tokens.isdigit():
+            self.tokens.tokens = min(self.tokens.tokens, float(remaining_tokens))
+        if pause:
+            self.paused_until = max(self.paused_until, now + pause)
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> Optional[LLMScheduler]:
+    """Returns the process-wide scheduler, or None when GENPROMPT_SCHEDULER=false."""
+    global _scheduler
+    if not settings.SCHEDULER_ENABLED:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(
+                    requests_per_minute=settings.SCHEDULER_RPM,
+                    tokens_per_minute=settings.SCHEDULER_TPM,
+                    max_concurrency=settings.SCHEDULER_MAX_CONCURRENCY,
+                    min_concurrency=settings.SCHEDULER_MIN_CONCURRENCY,
+                    max_queue=settings.SCHEDULER_MAX_QUEUE,
+                    max_wait_seconds=settings.SCHEDULER_MAX_WAIT_SECONDS,
+                )
+    return _scheduler
+
+def observe_http_response(response: Any) -> None:
+    scheduler = _scheduler
+    if scheduler is not None:
+        scheduler.observe_response(response.status_code, response.headers)
+
+async def aobserve_http_response(response: Any) -> None:
+    observe_http_response(response)
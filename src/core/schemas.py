@@ -1,6 +1,6 @@
 # File: src/core/schemas.py
 # This is the complete and correct schema definition for the GenPrompt application.
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional, Dict, Any, Literal
 
 # ==============================================================================
@@ -14,9 +14,20 @@ class ImagePromptRequest(BaseModel):
 # --- ADD THE NEW CLASS HERE ---
 class RefineRequest(BaseModel):
     """Request to refine an existing prompt via the /refine-prompt endpoint."""
-    active_prompt_type: Literal["image", "video"] = Field(..., description="Specifies whether to refine 'Prompt A' or 'Prompt B'.")
-    prompt_to_refine: str = Field(..., description="The full body of the prompt that needs refinement.")
+    active_prompt_type: Optional[Literal["image", "video"]] = Field(default=None, description="Specifies whether to refine 'Prompt A' or 'Prompt B'. Defaults to the session's latest prompt.")
+    prompt_to_refine: Optional[str] = Field(default=None, description="The full body of the prompt that needs refinement. Loaded from the session when omitted.")
     user_feedback: str = Field(..., description="The user's instruction for the change (e.g., 'make it more cinematic').")
+    session_id: Optional[str] = Field(default=None, description="A server-side session holding the prompts and history.")
+    deterministic: bool = Field(default=False, description="Refine at temperature 0; repeated requests are then served from a cache.")
+    num_candidates: int = Field(default=1, ge=1, description="How many alternative refinements to generate in parallel (capped by the server).")
+
+    @model_validator(mode="after")
+    def check_prompt_source(self) -> "RefineRequest":
+        if self.session_id is None and (self.active_prompt_type is None or self.prompt_to_refine is None):
+            raise ValueError("Provide either a session_id or both active_prompt_type and prompt_to_refine.")
+        if self.deterministic and self.num_candidates > 1:
+            raise ValueError("Deterministic refinement yields a single candidate; use num_candidates=1.")
+        return self
 
 
 # ==============================================================================
@@ -50,18 +61,68 @@ class ImagePrompt(BaseModel):
 
 class AppState(BaseModel):
     """The complete, stateful 'story' of a user's session. It holds all data for the LangGraph."""
-    original_image_bytes: Optional[bytes] = None
-    generated_image_bytes: Optional[bytes] = None
+    original_image: Optional[str] = None # Blob store id of the uploaded image (see core.blobstore)
+    generated_image: Optional[str] = None # Blob store id of the image to animate in Stage 2
     visual_analysis: Optional[VisualAnalysis] = None
+    visual_analysis_source: Optional[Literal["model", "cache", "near_duplicate", "fallback"]] = None # Where this run's analysis came from
+    near_duplicate_distance: Optional[int] = None # Hamming distance (of 64 bits) to the earlier image on a near-duplicate hit
     video_creative_brief: Optional[VideoCreativeBrief] = None
     image_prompt: Optional[ImagePrompt] = None
+    image_prompt_source: Optional[Literal["llm", "composer"]] = None # Who wrote Prompt A: the model or the local composer
+    prompt_mode: Optional[Literal["llm", "composer"]] = None # Force how Prompt A is written; None composes it only when the LLM is unavailable
     video_prompt: Optional[str] = None
     user_feedback: Optional[str] = None
     prompt_history: List[str] = []
     active_prompt_for_refinement: Optional[Literal["image", "video"]] = None
+    session_id: Optional[str] = None
+    pipeline_mode: Optional[Literal["full"]] = None # "full" writes Prompt A and Prompt B in one pass
+    refine_deterministic: Optional[bool] = None # Refine at temperature 0, through the refinement cache
+    refine_num_candidates: Optional[int] = None # Alternatives to generate; the first becomes the refined prompt
+    refinement_candidates: Optional[List[str]] = None # All alternatives from the last refinement, in order
 
-    class Config:
-        arbitrary_types_allowed = True # Allow bytes type
 
     def to_dict(self) -> Dict[str, Any]:
-        return self.model_dump(exclude_none=True)
\ No newline at end of file
+        return self.model_dump(exclude_none=True)
+
+# ==============================================================================
+# API RESPONSE MODELS (Data sent FROM the backend)
+# ==============================================================================
+
+class BatchItemResult(BaseModel):
+    """The outcome for one image of a /invoke-graph/batch request."""
+    index: int = Field(..., description="Position of the image in the uploaded list.")
+    filename: Optional[str] = None
+    status: Literal["ok", "error"]
+    result: Optional[AppState] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    """Per-image results of a /invoke-graph/batch request, in upload order."""
+    items: List[BatchItemResult]
+    succeeded: int
+    failed: int
+
+class SimilarPrompt(BaseModel):
+    """A previously generated prompt, as returned by /prompts/similar."""
+    prompt: str
+    kind: Literal["image", "video"]
+    score: float = Field(..., description="Cosine similarity to the query, from -1 to 1.")
+    visual_analysis: Optional[VisualAnalysis] = None
+    created_at: float = Field(..., description="Unix timestamp when the prompt was indexed.")
+
+class SimilarPromptsResponse(BaseModel):
+    """The most similar indexed prompts, best first."""
+    query: str
+    results: List[SimilarPrompt]
+    indexed: int = Field(..., description="How many prompts the index holds.")
+
+class JobStatus(BaseModel):
+    """State of a background graph run queued via POST /jobs."""
+    job_id: str
+    kind: Literal["stage1", "stage2", "refine", "full"]
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created_at: float = Field(..., description="Unix timestamp when the job was queued.")
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[AppState] = Field(default=None, description="The final state once the job has finished.")
+    error: Optional[str] = None
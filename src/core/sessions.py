@@ -0,0 +1,80 @@
+# File: src/core/sessions.py
+# Server-side session store, so clients send a session id instead of the whole AppState.
+#
+# A session remembers the visual analysis, both prompts and the prompt history
+# of one user's run. Sessions live in an in-process LRU with a TTL and, when
+# GENPROMPT_SESSION_SQLITE_PATH is set, are also persisted to SQLite.
+
+import json
+import logging
+import threading
+import uuid
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+from ..config import settings
+from .cache import LRUCache, SQLiteCache
+from .concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+SESSION_FIELDS = ("visual_analysis", "image_prompt", "video_prompt", "prompt_history", "last_prompt_type")
+
+class SessionNotFoundError(LookupError):
+    """Raised when a client refers to a session that expired or never existed."""
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return value
+
+class SessionStore:
+    """Stores session dicts by id, with TTL eviction and optional SQLite persistence."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self.memory.get(session_id)
+        if session is None and self.disk is not None:
+            payload = await run_blocking(self.disk.get, session_id)
+            if payload is not None:
+                session = json.loads(payload)
+                self.memory.set(session_id, session)
+        return dict(session) if session is not None else None
+
+    async def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        """Stores the session fields found in `state`, replacing the previous snapshot."""
+        session = {field: _jsonable(state[field]) for field in SESSION_FIELDS if state.get(field) is not None}
+        self.memory.set(session_id, session)
+        if self.disk is not None:
+            try:
+                await run_blocking(self.disk.set, session_id, json.dumps(session))
+            except Exception as e:
+                logger.warning("Session %s could not be persisted: %s", session_id, e)
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    """Returns the process-wide session store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                disk = None
+                if settings.SESSION_SQLITE_PATH:
+                    disk = SQLiteCache(
+                        settings.SESSION_SQLITE_PATH,
+                        table="sessions",
+                        max_entries=settings.SESSION_MAX_ENTRIES,
+                        ttl_seconds=settings.SESSION_TTL_SECONDS,
+                    )
+                _store = SessionStore(LRUCache(settings.SESSION_MAX_ENTRIES, settings.SESSION_TTL_SECONDS), disk)
+    return _store
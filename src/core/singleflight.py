@@ -0,0 +1,78 @@
+# File: src/core/singleflight.py
+# Request coalescing: concurrent callers with the same key share one in-flight call.
+
+import asyncio
+import contextvars
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from .deadline import deadline_scope, set_deadline
+from .metrics import metrics
+from .tracing import RequestTrace, adopt_spans, private_trace
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+@dataclass
+class _Flight:
+    task: "asyncio.Task"
+    trace: RequestTrace  # Spans of the shared work, handed to every caller.
+    waiters: int = 0
+
+class SingleFlight:
+    """
+    Deduplicates concurrent work by key. The first caller starts the work as
+    its own task; callers that arrive while it is running await the same task
+    instead of starting another. The task is shielded, so one caller going
+    away (e.g. a client disconnect) does not cancel it for the others; it is
+    cancelled once every caller has gone.
+
+    The task runs in a copy of the first caller's context, so its LLM calls
+    keep that caller's priority, but without its deadline: each caller waits
+    under its own, so a short timeout only fails the caller that set it. The
+    task's spans (LLM calls, tokens, cost) are copied onto every caller's trace.
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self._inflight: Dict[str, _Flight] = {}
+
+    async def do(self, key: str, work: Callable[[], Awaitable[T]]) -> T:
+        flight = self._inflight.get(key)
+        leader = flight is None
+        if not leader:
+            metrics.inc("genprompt_singleflight_coalesced_total", group=self.group)
+            logger.info("Coalesced %s call onto an in-flight request.", self.group)
+        else:
+            metrics.inc("genprompt_singleflight_calls_total", group=self.group)
+            context = contextvars.copy_context()
+            context.run(set_deadline, None)
+            trace = context.run(private_trace)
+            flight = _Flight(asyncio.create_task(work(), context=context), trace)
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda done: self._forget(key, done))
+
+        flight.waiters += 1
+        try:
+            async with deadline_scope():
+                return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.task.done():
+                adopt_spans(flight.trace.spans, coalesced=not leader)
+            elif flight.waiters == 0:
+                # Nobody is left to use the result; a later caller starts afresh.
+                self._forget(key, flight.task)
+                flight.task.cancel()
+
+    def _forget(self, key: str, task: "asyncio.Task") -> None:
+        flight = self._inflight.get(key)
+        if flight is not None and flight.task is task:
+            del self._inflight[key]
+        if task.done() and not task.cancelled():
+            task.exception()  # Mark as retrieved even if every caller went away.
+
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,56 @@
+# File: src/core/templates.py
+# Registry of the Jinja prompt templates, compiled once per process, and of the
+# fixed system prompts sent ahead of them.
+
+import functools
+import logging
+from typing import Any, Dict, List, Union
+
+from jinja2 import Environment, Template
+
+from .prompts import (
+    IMAGE_PROMPT_ENGINEER_SYSTEM_PROMPT,
+    IMAGE_PROMPT_ENGINEER_TEMPLATE,
+    PROMPT_REFINER_SYSTEM_PROMPT,
+    PROMPT_REFINER_TEMPLATE,
+    VIDEO_DIRECTOR_SYSTEM_PROMPT,
+    VIDEO_DIRECTOR_TEMPLATE,
+    VISUAL_ANALYST_SYSTEM_PROMPT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Default settings, matching what `jinja2.Template(source)` used per call.
+_environment = Environment()
+
+TEMPLATE_SOURCES = {
+    "image_prompt_engineer": IMAGE_PROMPT_ENGINEER_TEMPLATE,
+    "video_director": VIDEO_DIRECTOR_TEMPLATE,
+    "prompt_refiner": PROMPT_REFINER_TEMPLATE,
+}
+
+# Sent first and unchanged on every call, so the provider can cache the prompt prefix.
+SYSTEM_PROMPTS = {
+    "visual_analyst": VISUAL_ANALYST_SYSTEM_PROMPT,
+    "image_prompt_engineer": IMAGE_PROMPT_ENGINEER_SYSTEM_PROMPT,
+    "video_director": VIDEO_DIRECTOR_SYSTEM_PROMPT,
+    "prompt_refiner": PROMPT_REFINER_SYSTEM_PROMPT,
+}
+
+@functools.lru_cache(maxsize=None)
+def get_template(name: str) -> Template:
+    """Returns the compiled template registered under `name`."""
+    return _environment.from_string(TEMPLATE_SOURCES[name])
+
+def preload_templates() -> None:
+    """Compiles every registered template up front, e.g. during app startup."""
+    for name in TEMPLATE_SOURCES:
+        get_template(name)
+    logger.info("Compiled %d prompt templates.", len(TEMPLATE_SOURCES))
+
+def prompt_messages(name: str, content: Union[str, List[Dict[str, Any]]]) -> List[Any]:
+    """The system prompt registered under `name`, followed by the per-request `content` as the user message."""
+    # Imported here: this module is loaded at startup, LangChain only once the graph is built.
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    return [SystemMessage(content=SYSTEM_PROMPTS[name]), HumanMessage(content=content)]
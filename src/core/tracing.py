@@ -0,0 +1,237 @@
+# File: src/core/tracing.py
+# Per-request tracing: spans for graph nodes and LLM calls, carried in context variables.
+#
+# A `RequestTrace` is opened per API request (see `main.py`). Graph nodes and
+# LLM calls open `Span`s on it, which record wall time, queue wait, tokens,
+# image bytes and HTTP retries. Every finished span also feeds the process-wide
+# `metrics` registry, so the Prometheus endpoint works even without a trace.
+
+import contextvars
+import functools
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from ..config import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger("genprompt.requests")
+
+@dataclass
+class Span:
+    """One timed unit of work: a graph node (`kind="node"`) or an LLM call (`kind="llm"`)."""
+
+    name: str
+    kind: str
+    node: Optional[str] = None
+    model: Optional[str] = None
+    started_at: float = field(default_factory=time.perf_counter)
+    wall_seconds: float = 0.0
+    queue_wait_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    image_bytes: int = 0
+    http_attempts: int = 0
+    hedged: bool = False
+    cost_usd: float = 0.0
+    coalesced: bool = False  # A copy of a span recorded by work shared with another request.
+    error: Optional[str] = None
+
+    @property
+    def retries(self) -> int:
+        # A hedged call makes one extra, deliberate attempt; it is not a retry.
+        return max(self.http_attempts - 1 - int(self.hedged), 0)
+
+    def to_record(self) -> Dict[str, Any]:
+        record = asdict(self)
+        record.pop("started_at")
+        record["retries"] = self.retries
+        record["wall_seconds"] = round(self.wall_seconds, 4)
+        record["queue_wait_seconds"] = round(self.queue_wait_seconds, 4)
+        record["cost_usd"] = round(self.cost_usd, 6)
+        return {key: value for key, value in record.items() if value not in (None, 0, 0.0, False)}
+
+@dataclass
+class RequestTrace:
+    """Everything recorded while serving one API request."""
+
+    method: str
+    path: str
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started_at: float = field(default_factory=time.perf_counter)
+    spans: List[Span] = field(default_factory=list)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def server_timing(self) -> str:
+        """Formats the spans finished so far as a `Server-Timing` header value."""
+        node_seconds: Dict[str, float] = {}
+        llm_seconds = queue_seconds = 0.0
+        for span in self.spans:
+            if span.kind == "node":
+                node_seconds[span.name] = node_seconds.get(span.name, 0.0) + span.wall_seconds
+            elif span.kind == "llm":
+                llm_seconds += span.wall_seconds
+                queue_seconds += span.queue_wait_seconds
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in node_seconds.items()]
+        if llm_seconds:
+            entries.append(f"llm;dur={llm_seconds * 1000:.1f}")
+        if queue_seconds:
+            entries.append(f"queue;dur={queue_seconds * 1000:.1f}")
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_record(self, status_code: int) -> Dict[str, Any]:
+        llm_spans = [span for span in self.spans if span.kind == "llm"]
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": status_code,
+            "duration_seconds": round(self.elapsed(), 4),
+            "llm_calls": len(llm_spans),
+            "prompt_tokens": sum(span.prompt_tokens for span in llm_spans),
+            "completion_tokens": sum(span.completion_tokens for span in llm_spans),
+            "cached_tokens": sum(span.cached_tokens for span in llm_spans),
+            "cost_usd": round(sum(span.cost_usd for span in llm_spans), 6),
+            "spans": [span.to_record() for span in self.spans],
+        }
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("genprompt_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("genprompt_span", default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def current_node() -> Optional[str]:
+    """Name of the graph node the caller is running in, if any."""
+    span = _current_span.get()
+    if span is None:
+        return None
+    return span.name if span.kind == "node" else span.node
+
+def private_trace() -> RequestTrace:
+    """
+    Gives the current context a trace of its own, for work shared by several
+    requests: its spans are handed to each of them with `adopt_spans`.
+    """
+    trace = RequestTrace(method="", path="")
+    _current_trace.set(trace)
+    return trace
+
+def adopt_spans(spans: List[Span], coalesced: bool = False) -> None:
+    """Adds copies of spans finished elsewhere to the current trace; `metrics` already counted them."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.extend(replace(finished, coalesced=coalesced) for finished in spans)
+
+@contextmanager
+def request_trace(method: str, path: str) -> Iterator[RequestTrace]:
+    """Opens a trace for one request; spans started in this context attach to it."""
+    trace = RequestTrace(method=method, path=path)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def log_request(trace: RequestTrace, status_code: int) -> None:
+    """Emits the structured per-request record and the request-level metrics."""
+    duration = trace.elapsed()
+    metrics.inc("genprompt_http_requests_total", path=trace.path, status=status_code)
+    metrics.observe("genprompt_http_request_duration_seconds", duration, path=trace.path)
+    request_logger.info(json.dumps(trace.to_record(status_code)))
+
+@contextmanager
+def span(name: str, kind: str, **attributes: Any) -> Iterator[Span]:
+    """Times a unit of work and records it on the current trace and in `metrics`."""
+    parent = _current_span.get()
+    current = Span(name=name, kind=kind, node=current_node() if parent is not None else None, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.wall_seconds = time.perf_counter() - current.started_at
+        _finish(current)
+
+def _finish(finished: Span) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(finished)
+    status = "error" if finished.error else "ok"
+    if finished.kind == "node":
+        metrics.observe("genprompt_node_duration_seconds", finished.wall_seconds, node=finished.name)
+        metrics.inc("genprompt_node_runs_total", node=finished.name, status=status)
+        return
+
+    labels = {"node": finished.node or "none", "model": finished.model or "unknown"}
+    metrics.observe("genprompt_llm_duration_seconds", finished.wall_seconds, **labels)
+    metrics.observe("genprompt_llm_queue_wait_seconds", finished.queue_wait_seconds, **labels)
+    metrics.inc("genprompt_llm_calls_total", status=status, **labels)
+    metrics.inc("genprompt_llm_prompt_tokens_total", finished.prompt_tokens, **labels)
+    metrics.inc("genprompt_llm_completion_tokens_total", finished.completion_tokens, **labels)
+    metrics.inc("genprompt_llm_cached_tokens_total", finished.cached_tokens, **labels)
+    metrics.inc("genprompt_llm_image_bytes_total", finished.image_bytes, **labels)
+    metrics.inc("genprompt_llm_retries_total", finished.retries, **labels)
+    metrics.inc("genprompt_llm_cost_usd_total", finished.cost_usd, **labels)
+
+def add_queue_wait(seconds: float) -> None:
+    """Charges time spent waiting for a worker or a budget to the current span."""
+    current = _current_span.get()
+    if current is not None:
+        current.queue_wait_seconds += seconds
+
+def record_usage(current: Span, usage: Optional[Dict[str, Any]]) -> None:
+    """Copies LangChain `usage_metadata` onto an LLM span and prices it."""
+    if not usage:
+        return
+    current.prompt_tokens += int(usage.get("input_tokens") or 0)
+    current.completion_tokens += int(usage.get("output_tokens") or 0)
+    current.cached_tokens += int((usage.get("input_token_details") or {}).get("cache_read") or 0)
+    current.cost_usd = estimate_cost(current.model, current.prompt_tokens, current.completion_tokens, current.cached_tokens)
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """USD cost from `Settings.LLM_PRICING_USD_PER_MILLION_TOKENS`; 0 for unpriced models."""
+    pricing = settings.LLM_PRICING_USD_PER_MILLION_TOKENS.get(model or "")
+    if pricing is None:
+        return 0.0
+    input_price, cached_price, output_price = pricing
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+# --- httpx event hooks: every attempt (including SDK retries) is counted on the current LLM span.
+
+def _count_attempt() -> None:
+    current = _current_span.get()
+    if current is not None and current.kind == "llm":
+        current.http_attempts += 1
+
+def count_http_attempt(_request: Any) -> None:
+    _count_attempt()
+
+async def acount_http_attempt(_request: Any) -> None:
+    _count_attempt()
+
+def traced_node(name: str, node: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]):
+    """Wraps an async graph node so each run is recorded as a `node` span."""
+
+    @functools.wraps(node)
+    async def run(state: Dict[str, Any]) -> Dict[str, Any]:
+        with span(name, "node"):
+            return await node(state)
+
+    return run
@@ -3,8 +3,9 @@
 
 import logging
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from dotenv import load_dotenv
+from fastapi.responses import PlainTextResponse
 
 # --- RECOMMENDED CHANGE: CONFIGURE LOGGING ---
 # This setup ensures that all log messages at the INFO level and above
@@ -16,20 +17,56 @@ logging.basicConfig(
 
 # --- Your existing code (with one import path fix) ---
 from .api import routes  # Use a relative import for robustness
+from .api.middleware import DeadlineMiddleware, TracingMiddleware, UploadLimitMiddleware
+from .config import validate_settings
+from .core.clients import close_clients, load_chat_model_class
+from .core.jobs import close_job_manager
+from .core.metrics import metrics
+from .core.templates import preload_templates
 
-# Load environment variables from .env file
-load_dotenv()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Loads and validates settings, compiles the graph and warms per-process
+    resources on startup (importing the app does none of this); stops job
+    workers and releases pooled connections on shutdown.
+    """
+    validate_settings()
+    from .core.graph import get_compiled_graph
+    from .core.prompt_index import close_prompt_index, get_prompt_index
+
+    get_compiled_graph()
+    load_chat_model_class()
+    preload_templates()
+    get_prompt_index()  # Loads (or re-embeds) a persisted index before the first request
+    yield
+    await close_job_manager()
+    close_prompt_index()
+    await close_clients()
 
 app = FastAPI(
+    lifespan=lifespan,
     title="GenPrompt API",
     version="1.0.0",
     description="Backend services for the GenPrompt creative co-pilot.",
 )
 
+# Per-request tracing: Server-Timing headers and structured logs for /api routes.
+# Deadlines and disconnect cancellation run inside the trace, so abandoned requests are logged (499).
+app.add_middleware(DeadlineMiddleware, path_prefix="/api")
+# Oversized uploads get their 413 before or while the body is read (still traced and logged).
+app.add_middleware(UploadLimitMiddleware, path_prefix="/api")
+app.add_middleware(TracingMiddleware, path_prefix="/api")
+
 # All routes defined in `.api.routes` will be prefixed with `/api`
 app.include_router(routes.router, prefix="/api")
 
 @app.get("/", tags=["Health Check"])
 async def read_root():
     """Health check endpoint to confirm the API is running."""
-    return {"status": "GenPrompt API is running"}
\ No newline at end of file
+    return {"status": "GenPrompt API is running"}
+
+@app.get("/metrics", tags=["Health Check"], response_class=PlainTextResponse)
+async def read_metrics():
+    """Prometheus scrape endpoint: request, node and LLM latency, tokens, retries and cost."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
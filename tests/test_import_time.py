@@ -0,0 +1,69 @@
+# File: tests/test_import_time.py
+# `import src.main` must stay cheap and free of side effects: no settings read,
+# no HTTP clients or chat models built, no graph compiled, no job workers, and
+# no heavy packages imported. Each check runs in a fresh interpreter.
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.import_time import DEFAULT_BUDGET_MS, DEFERRED_PACKAGES, measure_once
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Imports the app, then reports the process-wide state it left behind. Modules
+# the import did not load are reported as not loaded rather than imported here.
+_PROBE = """
+import json, sys
+import src.main
+modules = sys.modules
+def loaded(name):
+    return modules.get(name)
+report = {"deferred": sorted({name.split(".")[0] for name in modules} & set(DEFERRED))}
+config = loaded("src.config")
+report["settings_built"] = config is not None and config._settings is not None
+clients = loaded("src.core.clients")
+report["clients_built"] = clients is not None and bool(
+    clients._chat_models or clients._http_client or clients._http_async_client
+)
+graph = loaded("src.core.graph")
+report["graph_compiled"] = graph is not None and graph.get_compiled_graph.cache_info().currsize > 0
+jobs = loaded("src.core.jobs")
+report["job_manager_started"] = jobs is not None and jobs._manager is not None
+print(json.dumps(report))
+"""
+
+def _env() -> dict:
+    env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+    return env
+
+def test_import_builds_nothing():
+    completed = subprocess.run(
+        [sys.executable, "-c", f"DEFERRED = {DEFERRED_PACKAGES!r}\n{_PROBE}"],
+        capture_output=True, text=True, env=_env(), cwd=ROOT,
+    )
+    assert completed.returncode == 0, completed.stderr
+    report = json.loads(completed.stdout)
+    assert report == {
+        "deferred": [],
+        "settings_built": False,
+        "clients_built": False,
+        "graph_compiled": False,
+        "job_manager_started": False,
+    }
+
+def test_import_within_budget(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    measure_once("src.main")  # Warm-up: writes .pyc files and fills the OS file cache.
+    totals = []
+    for _ in range(3):
+        timings, completed = measure_once("src.main")
+        assert completed.returncode == 0, completed.stderr
+        assert not completed.stdout.strip(), "importing src.main printed to stdout"
+        totals.append(next(t.cumulative_us for t in reversed(timings) if t.name == "src.main") / 1000)
+    median = statistics.median(totals)
+    assert median <= DEFAULT_BUDGET_MS, f"import src.main took {median:.0f} ms (budget {DEFAULT_BUDGET_MS:.0f} ms)"